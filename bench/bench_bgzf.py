@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Compare serial and multi-threaded decompression when reading a whole
+bgzipped GFF3 file. Run from the root of the repository::
+
+    $ PYTHONPATH=. python bench/bench_bgzf.py [n_copies] [threads ...]
+
+The generated file holds `n_copies` copies of the features in
+fixture/sample.sorted.gff.gz, with randomised attributes so that it does not
+compress unrealistically well. It is written to a temporary directory and
+removed afterwards.
+
+"""
+from __future__ import absolute_import, print_function, division
+
+
+import gzip
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+
+import petl as etl
+# activate bio extensions
+import petlx.bio
+from petlx.bio.bgzf import BgzfWriter, bgzflines
+
+
+def generate(filename, n_copies, seed=42):
+    rnd = random.Random(seed)
+    with gzip.open('fixture/sample.sorted.gff.gz', 'rt') as f:
+        lines = [l for l in f if not l.startswith('#')]
+    with BgzfWriter(filename) as f:
+        f.write(b'##gff-version 3\n')
+        for i in range(n_copies):
+            for line in lines:
+                f.write(('%s;Note=%x\n' % (line.rstrip('\n'),
+                                           rnd.getrandbits(64)))
+                        .encode('utf-8'))
+    return filename
+
+
+def gziplines(filename):
+    f = io.BufferedReader(gzip.open(filename, 'rb'), buffer_size=2**20)
+    return io.TextIOWrapper(f, encoding='utf-8')
+
+
+def bench(label, f, number=1):
+    t = min(timeit.repeat(f, number=number, repeat=3))
+    print('%-40s %8.4fs' % (label, t / number))
+
+
+def main():
+    n_copies = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    threads = [int(n) for n in sys.argv[2:]] or [1, 2, 4]
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = generate(os.path.join(tmpdir, 'bench.gff.gz'), n_copies)
+        print('%s bytes' % os.path.getsize(filename))
+
+        # decompression only
+        bench('lines, gzip', lambda: sum(1 for _ in gziplines(filename)))
+        for n in threads:
+            bench('lines, %s threads' % n,
+                  lambda: sum(1 for _ in bgzflines(filename, threads=n)))
+
+        # decompression and parsing
+        bench('fromgff3, gzip', etl.fromgff3(filename).nrows)
+        for n in threads:
+            bench('fromgff3, %s threads' % n,
+                  etl.fromgff3(filename, threads=n).nrows)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Measure the start-up cost of importing petlx on top of petl, using the
+interpreter's ``-X importtime`` option (Python 3.7 or later). Run from the
+root of the repository::
+
+    $ python bench/bench_import.py [repeat]
+
+Each import is timed in a fresh interpreter and the best of `repeat` runs is
+reported. The script exits with a non-zero status if the overhead of
+``import petlx`` exceeds TARGET_MS, or if the import pulls in any of the
+optional dependencies, which should only be loaded on first use.
+
+"""
+from __future__ import absolute_import, print_function, division
+
+
+import os
+import subprocess
+import sys
+
+
+# target for the time spent importing petlx modules, excluding petl itself
+TARGET_MS = 10
+
+
+# modules which must not be loaded by importing petlx
+DEFERRED = ('pysam', 'vcf', 'numpy', 'intervaltree', 'bx', 'petlx.bio.gff3',
+            'petlx.bio.interval', 'petlx.bio.tabix', 'petlx.bio.vcf',
+            'petlx.bio.bgzf', 'petlx.bio.lineindex',
+            'petlx.bio.cache', 'petlx.bio.encoding')
+
+
+def importtime(statement):
+    # run statement in a fresh interpreter and return the import time in
+    # microseconds of each top-level module, plus the set of modules loaded
+    code = '%s; import sys; print(" ".join(sys.modules))' % statement
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.getcwd()] + [p for p in [env.get('PYTHONPATH')] if p])
+    p = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', code],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                         env=env, universal_newlines=True)
+    out, err = p.communicate()
+    if p.returncode != 0:
+        raise RuntimeError(err)
+    times = dict()
+    for line in err.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative_us)
+    return times, set(out.split())
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    best = None
+    for _ in range(repeat):
+        # import petl first so its own dependencies are not counted
+        times, modules = importtime('import petl; import petlx')
+        overhead = times['petlx']
+        if best is None or overhead < best[0]:
+            best = overhead, times
+    overhead, times = best
+
+    print('%-30s %8.1fms' % ('import petl', times['petl'] / 1000))
+    print('%-30s %8.1fms (target %sms)'
+          % ('petlx overhead', overhead / 1000, TARGET_MS))
+
+    # cost of the first use of an extension, which imports its module
+    for module in 'petlx.bio.gff3', 'petlx.bio.tabix', 'petlx.bio.vcf':
+        t = min(importtime('import petl, petlx; import %s' % module)[0][module]
+                for _ in range(repeat))
+        print('%-30s %8.1fms' % ('first use of ' + module, t / 1000))
+
+    failed = False
+    loaded = sorted(m for m in DEFERRED if m in modules)
+    if loaded:
+        print('modules loaded eagerly: %s' % ', '.join(loaded))
+        failed = True
+    if overhead > TARGET_MS * 1000:
+        print('petlx import overhead exceeds target')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Compare the PyVCF and pysam engines for fromvcf(). Run from the root of the
+repository::
+
+    $ PYTHONPATH=. python bench/bench_vcf.py [n_variants] [n_samples]
+
+The generated file is written to a temporary directory and removed
+afterwards.
+
+"""
+from __future__ import absolute_import, print_function, division
+
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+
+import petl as etl
+# activate bio extensions
+import petlx.bio
+
+
+HEADER = """##fileformat=VCFv4.1
+##contig=<ID=1,length=100000000>
+##INFO=<ID=DP,Number=1,Type=Integer,Description="Total Depth">
+##INFO=<ID=AF,Number=A,Type=Float,Description="Allele Frequency">
+##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">
+##FORMAT=<ID=GQ,Number=1,Type=Integer,Description="Genotype Quality">
+##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Read Depth">
+"""
+
+
+def generate(filename, n_variants, n_samples, seed=42):
+    import pysam
+    rnd = random.Random(seed)
+    samples = ['S%04d' % i for i in range(n_samples)]
+    with open(filename, 'w') as f:
+        f.write(HEADER)
+        f.write('\t'.join(['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL',
+                           'FILTER', 'INFO', 'FORMAT'] + samples) + '\n')
+        pos = 0
+        for i in range(n_variants):
+            pos += rnd.randint(1, 1000)
+            calls = ['%s/%s:%s:%s' % (rnd.randint(0, 1), rnd.randint(0, 1),
+                                      rnd.randint(0, 99), rnd.randint(0, 50))
+                     for _ in samples]
+            f.write('\t'.join(['1', str(pos), '.', 'A', 'T', '50', 'PASS',
+                               'DP=%s;AF=0.5' % rnd.randint(0, 5000),
+                               'GT:GQ:DP'] + calls) + '\n')
+    pysam.tabix_index(filename, preset='vcf', force=True)
+    return filename + '.gz'
+
+
+def bench(label, filename, number=1, **kwargs):
+    for engine in 'pyvcf', 'pysam':
+        table = etl.fromvcf(filename, engine=engine, **kwargs)
+        t = min(timeit.repeat(table.nrows, number=number, repeat=3))
+        print('%-40s %-6s %8.4fs' % (label, engine, t / number))
+
+
+def main():
+    n_variants = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    n_samples = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    bench('fixture/sample.vcf.gz', 'fixture/sample.vcf.gz', number=100)
+    bench('fixture/sample.vcf.gz (region)', 'fixture/sample.vcf.gz',
+          number=100, region='20:14000-1240000')
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = generate(os.path.join(tmpdir, 'bench.vcf'),
+                            n_variants, n_samples)
+        label = '%s variants x %s samples' % (n_variants, n_samples)
+        bench(label, filename)
+        bench(label + ' (no samples)', filename, samples=None)
+        bench(label + ' (5 samples)', filename,
+              samples=['S%04d' % i for i in range(0, n_samples, 100)][:5])
+        bench(label + ' (region)', filename, region='1:1-500000')
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,64 @@
 from __future__ import absolute_import, print_function, division
 
 
-# activate all extensions
-import petlx.bio.gff3
-import petlx.bio.tabix
-import petlx.bio.vcf
+import importlib
+
+
+import petl as etl
+from petl.util.base import Table
+
+
+# functions provided by each extension module, as (module, names registered
+# on petl, names registered on Table)
+EXTENSIONS = (
+    ('petlx.bio.encoding',
+     ('dictcodes',),
+     ('dictcodes',)),
+    ('petlx.bio.gff3',
+     ('fromgff3', 'togff3', 'gff3index'),
+     ('togff3', 'gff3index')),
+    ('petlx.bio.interval',
+     ('overlapindex', 'overlapjoin', 'overlapleftjoin', 'overlapsubtract',
+      'overlapmergejoin'),
+     ('overlapindex', 'overlapjoin', 'overlapleftjoin', 'overlapsubtract',
+      'overlapmergejoin')),
+    ('petlx.bio.tabix',
+     ('fromtabix', 'tobed'),
+     ('tobed',)),
+    ('petlx.bio.vcf',
+     ('fromvcf', 'tovcf', 'vcfunpackinfo', 'vcfmeltsamples', 'vcfunpackcall',
+      'vcfmeltcalls', 'vcftoarray'),
+     ('tovcf', 'vcfunpackinfo', 'vcfmeltsamples', 'vcfunpackcall',
+      'vcfmeltcalls')),
+)
+
+
+def _stub(module, name):
+    # stand-in for an extension function, importing the module on first call;
+    # importing the module registers the real function over the stub
+
+    def stub(*args, **kwargs):
+        f = getattr(importlib.import_module(module), name)
+        return f(*args, **kwargs)
+
+    stub.__name__ = name
+    stub.__doc__ = 'See :func:`%s.%s`.' % (module, name)
+    return stub
+
+
+def _register():
+    for module, names, methods in EXTENSIONS:
+        for name in names:
+            stub = _stub(module, name)
+            # don't clobber functions from a module that is already loaded
+            if getattr(getattr(etl, name, None), '__module__', None) != module:
+                setattr(etl, name, stub)
+            if name in methods and \
+                    getattr(getattr(Table, name, None), '__module__',
+                            None) != module:
+                setattr(Table, name, stub)
+
+
+# activate all extensions, deferring the import of each module until one of
+# its functions is first used
+_register()
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, division
+
+
+import struct
+import zlib
+from collections import deque
+
+
+# maximum amount of uncompressed data in a BGZF block, as used by htslib
+BGZF_BLOCK_SIZE = 0xff00
+
+
+# empty block marking the end of a BGZF file
+BGZF_EOF = (b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC'
+            b'\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00')
+
+
+class BgzfWriter(object):
+    """
+    Write a file in the blocked gzip format (BGZF) used by bgzip and tabix.
+    The :meth:`tell` method returns virtual file offsets as used in tabix
+    indexes.
+
+    """
+
+    def __init__(self, filename, compresslevel=6):
+        self.file = open(filename, 'wb')
+        self.compresslevel = compresslevel
+        self.buffer = bytearray()
+        self.offset = 0
+
+    def write(self, data):
+        self.buffer.extend(data)
+        while len(self.buffer) >= BGZF_BLOCK_SIZE:
+            self._writeblock(bytes(self.buffer[:BGZF_BLOCK_SIZE]))
+            del self.buffer[:BGZF_BLOCK_SIZE]
+
+    @property
+    def closed(self):
+        return self.file.closed
+
+    def tell(self):
+        return (self.offset << 16) | len(self.buffer)
+
+    def flush(self):
+        if self.buffer:
+            self._writeblock(bytes(self.buffer))
+            del self.buffer[:]
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.write(BGZF_EOF)
+            self.file.close()
+
+    def _writeblock(self, data):
+        c = zlib.compressobj(self.compresslevel, zlib.DEFLATED, -15)
+        cdata = c.compress(data) + c.flush()
+        header = (b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00'
+                  + struct.pack('<H', len(cdata) + 25))
+        trailer = struct.pack('<II', zlib.crc32(data) & 0xffffffff,
+                              len(data))
+        self.file.write(header)
+        self.file.write(cdata)
+        self.file.write(trailer)
+        self.offset += len(header) + len(cdata) + len(trailer)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# leading bytes of every BGZF block: gzip magic, deflate, FEXTRA flag
+_BGZF_MAGIC = b'\x1f\x8b\x08\x04'
+
+
+def isbgzf(filename):
+    """
+    Return True if `filename` is compressed with BGZF, as by bgzip, rather
+    than plain gzip or not compressed at all.
+
+    """
+
+    with open(filename, 'rb') as f:
+        header = f.read(18)
+    return _blocksize(header, 0) is not None
+
+
+def _blocksize(buf, pos):
+    # total size of the BGZF block starting at pos, or None if there is not
+    # one; N.B., other subfields may precede the BC subfield
+    if buf[pos:pos + 4] != _BGZF_MAGIC or len(buf) < pos + 12:
+        return None
+    xlen, = struct.unpack_from('<H', buf, pos + 10)
+    i, end = pos + 12, pos + 12 + xlen
+    while i + 4 <= end:
+        slen, = struct.unpack_from('<H', buf, i + 2)
+        if buf[i:i + 2] == b'BC' and slen == 2 and i + 6 <= len(buf):
+            bsize, = struct.unpack_from('<H', buf, i + 4)
+            return bsize + 1
+        i += 4 + slen
+    return None
+
+
+def _inflate(blocks):
+    # decompress a batch of raw deflate blocks; zlib releases the GIL while
+    # inflating, so batches can be decompressed in parallel by threads
+    data = list()
+    for cdata, size in blocks:
+        d = zlib.decompress(cdata, -15)
+        if len(d) != size:
+            raise ValueError('corrupt BGZF block, expected %s bytes, found %s'
+                             % (size, len(d)))
+        data.append(d)
+    return b''.join(data)
+
+
+def _iterbatches(f, blocks):
+    # split a BGZF file into batches of compressed blocks
+    buf = b''
+    pos = offset = 0
+    batch = list()
+    eof = False
+    while True:
+        if len(buf) - pos < 0x10000 and not eof:
+            # make sure a whole block is buffered
+            data = f.read(blocks * 0x10000)
+            eof = not data
+            offset += pos
+            buf = buf[pos:] + data
+            pos = 0
+            continue
+        if pos == len(buf):
+            break
+        bsize = _blocksize(buf, pos)
+        if bsize is None or pos + bsize > len(buf):
+            raise ValueError('invalid BGZF block at offset %s'
+                             % (offset + pos))
+        xlen, = struct.unpack_from('<H', buf, pos + 10)
+        size, = struct.unpack_from('<I', buf, pos + bsize - 4)
+        if size:
+            batch.append((buf[pos + 12 + xlen:pos + bsize - 8], size))
+        pos += bsize
+        if len(batch) == blocks:
+            yield batch
+            batch = list()
+    if batch:
+        yield batch
+
+
+def bgzfchunks(filename, threads=1, blocks=16):
+    """
+    Iterate over the decompressed contents of a BGZF file, in chunks of up
+    to `blocks` blocks (64 KB or less each). Chunks are decompressed by a
+    pool of `threads` threads while earlier chunks are consumed, and are
+    returned in file order.
+
+    """
+
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(threads)
+    f = open(filename, 'rb')
+    try:
+        # keep a bounded number of batches in flight
+        pending = deque()
+        for batch in _iterbatches(f, blocks):
+            pending.append(pool.apply_async(_inflate, (batch,)))
+            if len(pending) < 2 * threads:
+                continue
+            yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        f.close()
+        pool.terminate()
+
+
+def bgzflines(filename, threads=1, encoding='utf-8'):
+    """
+    Iterate over lines of text in a BGZF file, decompressed as by
+    :func:`bgzfchunks`. Line terminators, '\\n' or '\\r\\n', are removed.
+
+    """
+
+    rest = b''
+    chunks = bgzfchunks(filename, threads=threads)
+    try:
+        for chunk in chunks:
+            i = chunk.rfind(b'\n')
+            if i < 0:
+                rest += chunk
+                continue
+            text = (rest + chunk[:i]).decode(encoding)
+            rest = chunk[i + 1:]
+            for line in text.split('\n'):
+                yield line[:-1] if line.endswith('\r') else line
+        if rest:
+            rest = rest.decode(encoding)
+            yield rest[:-1] if rest.endswith('\r') else rest
+    finally:
+        chunks.close()
+
+
+# tabix index configurations, as (format, col_seq, col_beg, col_end, meta,
+# skip) with 1-based columns
+TABIX_PRESETS = {
+    'gff': (0, 1, 4, 5, '#', 0),
+    'bed': (0x10000, 1, 2, 3, '#', 0),
+    'vcf': (2, 1, 2, 0, '#', 0),
+}
+
+
+# tabix binning scheme
+TABIX_MIN_SHIFT = 14
+TABIX_DEPTH = 5
+TABIX_PSEUDO_BIN = 37450
+
+
+def reg2bin(beg, end):
+    """
+    Return the smallest tabix bin containing the 0-based half-open
+    interval [`beg`, `end`).
+
+    """
+
+    end -= 1
+    shift = TABIX_MIN_SHIFT
+    offset = ((1 << (3 * TABIX_DEPTH)) - 1) // 7
+    for level in range(TABIX_DEPTH, 0, -1):
+        if beg >> shift == end >> shift:
+            return offset + (beg >> shift)
+        shift += 3
+        offset -= 1 << (3 * (level - 1))
+    return 0
+
+
+class TabixIndexer(object):
+    """
+    Build a tabix index from records added in coordinate order, with
+    their virtual file offsets.
+
+    """
+
+    def __init__(self, preset):
+        self.config = TABIX_PRESETS[preset]
+        self.names = list()
+        self.refs = list()
+        self.ref = None
+        self.prevbeg = 0
+
+    def add(self, chrom, beg, end, vstart, vend):
+        """
+        Add a record on `chrom` covering the 0-based half-open interval
+        [`beg`, `end`), stored between virtual offsets `vstart` and `vend`.
+
+        """
+
+        if self.ref is None or chrom != self.names[-1]:
+            if chrom in self.names:
+                raise ValueError('cannot index, records for %r are not '
+                                 'contiguous' % chrom)
+            self.names.append(chrom)
+            self.ref = _IndexRef(vstart)
+            self.refs.append(self.ref)
+        elif beg < self.prevbeg:
+            raise ValueError('cannot index, records for %r are not sorted by '
+                             'position, found %s after %s'
+                             % (chrom, beg + 1, self.prevbeg + 1))
+        self.prevbeg = beg
+        self.ref.add(beg, max(end, beg + 1), vstart, vend)
+
+    def write(self, filename):
+        fmt, col_seq, col_beg, col_end, meta, skip = self.config
+        names = b''.join(n.encode('ascii') + b'\x00' for n in self.names)
+        with BgzfWriter(filename) as f:
+            f.write(b'TBI\x01')
+            f.write(struct.pack('<8i', len(self.names), fmt, col_seq,
+                                col_beg, col_end, ord(meta), skip,
+                                len(names)))
+            f.write(names)
+            for ref in self.refs:
+                ref.write(f)
+
+
+class _IndexRef(object):
+    # bins and linear index for a single reference sequence
+
+    def __init__(self, vstart):
+        self.bins = dict()
+        self.linear = list()
+        self.vstart = vstart
+        self.vend = vstart
+        self.n = 0
+
+    def add(self, beg, end, vstart, vend):
+        chunks = self.bins.setdefault(reg2bin(beg, end), [])
+        if chunks and chunks[-1][1] >> 16 == vstart >> 16:
+            # the previous chunk for this bin ends in the same BGZF block
+            # so extend it, as htslib does
+            chunks[-1][1] = vend
+        else:
+            chunks.append([vstart, vend])
+        linear = self.linear
+        first = beg >> TABIX_MIN_SHIFT
+        last = (end - 1) >> TABIX_MIN_SHIFT
+        if len(linear) <= last:
+            linear.extend([None] * (last + 1 - len(linear)))
+        for w in range(first, last + 1):
+            if linear[w] is None:
+                linear[w] = vstart
+        self.vend = vend
+        self.n += 1
+
+    def write(self, f):
+        f.write(struct.pack('<i', len(self.bins) + 1))
+        for b in sorted(self.bins):
+            chunks = self.bins[b]
+            f.write(struct.pack('<Ii', b, len(chunks)))
+            for vstart, vend in chunks:
+                f.write(struct.pack('<QQ', vstart, vend))
+        # pseudo-bin holding the extent of the reference and record counts
+        f.write(struct.pack('<IiQQQQ', TABIX_PSEUDO_BIN, 2, self.vstart,
+                            self.vend, self.n, 0))
+        # windows without records take the offset of the previous window
+        prev = self.vstart
+        offsets = list()
+        for v in self.linear:
+            if v is None:
+                v = prev
+            offsets.append(v)
+            prev = v
+        f.write(struct.pack('<i', len(offsets)))
+        f.write(struct.pack('<%sQ' % len(offsets), *offsets))
+
+
+class TabixWriter(object):
+    """
+    Write lines of text to `filename`. If the file name ends with '.gz' the
+    file is compressed with BGZF, and if `index` is True a tabix index is
+    built as records are written, and saved to `filename` + '.tbi' when the
+    writer is closed. Records must then be grouped by chromosome and sorted
+    by start position.
+
+    """
+
+    def __init__(self, filename, preset, index=True, compresslevel=6):
+        self.filename = filename
+        if filename.endswith('.gz'):
+            self.file = BgzfWriter(filename, compresslevel=compresslevel)
+            self.indexer = TabixIndexer(preset) if index else None
+        else:
+            self.file = open(filename, 'wb')
+            self.indexer = None
+
+    def writeheader(self, line):
+        self.file.write(line.encode('utf-8') + b'\n')
+
+    def writerecord(self, chrom, beg, end, line):
+        """
+        Write a line for a record on `chrom` covering the 0-based half-open
+        interval [`beg`, `end`).
+
+        """
+
+        data = line.encode('utf-8') + b'\n'
+        if self.indexer is None:
+            self.file.write(data)
+        else:
+            vstart = self.file.tell()
+            self.file.write(data)
+            self.indexer.add(chrom, beg, end, vstart, self.file.tell())
+
+    def close(self, index=True):
+        if not self.file.closed:
+            self.file.close()
+            if index and self.indexer is not None:
+                self.indexer.write(self.filename + '.tbi')
+
+
+def _writetable(table, cls, filename, **kwargs):
+    # write a table via a TabixWriter subclass with a writerow() method
+    it = iter(table)
+    writer = cls(filename, next(it), **kwargs)
+    try:
+        for row in it:
+            writer.writerow(row)
+    except Exception:
+        writer.close(index=False)
+        raise
+    writer.close()
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, division
+
+
+import gc
+import hashlib
+import io
+import os
+import struct
+import tempfile
+try:
+    import copyreg
+except ImportError:
+    import copy_reg as copyreg
+
+
+from petl.compat import pickle, text_type, binary_type, integer_types
+from petl.util.base import Table
+
+
+# directory holding cached tables, unless another path is given
+cache_dir = os.environ.get('PETLX_CACHE_DIR',
+                           os.path.join(os.path.expanduser('~'), '.cache',
+                                        'petlx'))
+
+
+# total size in bytes of cached tables to keep in each cache directory, least
+# recently used tables are removed first
+cache_size = 2**30
+
+
+# number of rows per compressed frame
+_batchsize = 1000
+
+
+# functions for pickling values which are not pickled faithfully or
+# efficiently by default, by type; see the copyreg module
+reducers = dict()
+
+
+def diskcache(table, path=None, codec='zlib'):
+    """
+    Cache the rows of a table read from a file, e.g., via
+    :func:`petlx.bio.gff3.fromgff3`, :func:`petlx.bio.vcf.fromvcf` or
+    :func:`petlx.bio.tabix.fromtabix`, in a binary file on disk, e.g.::
+
+        >>> import petl as etl
+        >>> # activate bio extensions
+        ... import petlx.bio
+        >>> import tempfile
+        >>> path = tempfile.mkdtemp()
+        >>> table1 = etl.fromgff3('fixture/sample.gff').diskcache(path=path)
+        >>> table1.nrows()  # parses the file and caches the rows
+        177
+        >>> table1.nrows()  # reads the rows from the cache
+        177
+        >>> import shutil
+        >>> shutil.rmtree(path)
+
+    The rows are written to the cache as the table is first iterated through
+    to the end, and later iterations, including from other tables and other
+    sessions with the same arguments, read the cached rows instead of parsing
+    the source file again. Entries are keyed by the path, size and
+    modification time of the source file and by the arguments of the table,
+    so changes to the file are picked up. Caching pays off where parsing is
+    costly compared with creating the row values, e.g., when extracting GFF3
+    attributes or fetching many regions; rows from the 'pysam' VCF engine,
+    whose calls are parsed lazily, are usually quicker to read again from
+    the source file.
+
+    Arguments are keyed by value, so tables with other arguments, e.g.,
+    lambdas or other user functions in `types`, whose behaviour may change
+    between sessions, are not cached and are read from the source file each
+    time. Built-in functions and types such as `int` and `float` can be
+    used.
+
+    Cached tables are stored in the directory `path`, by default
+    `petlx.bio.cache.cache_dir` (`~/.cache/petlx` unless the PETLX_CACHE_DIR
+    environment variable is set). Rows are pickled in batches and compressed
+    with `codec`, one of 'zlib', 'bz2', 'lzma' or None. When a new table is
+    added, the least recently used tables are removed to keep the size of
+    the directory within `petlx.bio.cache.cache_size` bytes.
+
+    """
+
+    return DiskCacheView(table, path=path, codec=codec)
+
+
+def clearcache(path=None):
+    """
+    Remove all cached tables from the directory `path`, by default
+    `petlx.bio.cache.cache_dir`.
+
+    """
+
+    path = cache_dir if path is None else path
+    for fn, _, _ in _entries(path):
+        _remove(fn)
+
+
+class DiskCacheView(Table):
+
+    def __init__(self, source, path=None, codec='zlib'):
+        self.source = source
+        self.path = path
+        self.codec = codec
+        self._compress, self._decompress = _codec(codec)
+
+    def __iter__(self):
+        path = cache_dir if self.path is None else self.path
+        key = _cachekey(self.source, self.codec)
+        if key is None:
+            # not a local file
+            for row in self.source:
+                yield row
+            return
+        filename = os.path.join(path, key + '.rows')
+        try:
+            f = open(filename, 'rb')
+        except (IOError, OSError):
+            f = None
+        if f is not None:
+            # mark as recently used
+            _touch(filename)
+            with f:
+                for row in _readrows(f, self._decompress):
+                    yield row
+        else:
+            for row in self._iterwrite(path, filename):
+                yield row
+
+    def _iterwrite(self, path, filename):
+        # iterate over the source, writing rows to a temporary file which
+        # becomes the cache entry if iteration completes
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                # created concurrently
+                pass
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=path)
+        complete = False
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                it = iter(self.source)
+                hdr = tuple(next(it))
+                _writeframe(out, [hdr], self._compress)
+                yield hdr
+                batch = list()
+                for row in it:
+                    batch.append(row)
+                    if len(batch) == _batchsize:
+                        _writeframe(out, batch, self._compress)
+                        batch = list()
+                    yield row
+                if batch:
+                    _writeframe(out, batch, self._compress)
+            complete = True
+        finally:
+            if complete:
+                _rename(tmp, filename)
+                _evict(path, cache_size, keep=filename)
+            else:
+                _remove(tmp)
+
+
+def _codec(codec):
+    if codec is None:
+        return None, None
+    elif codec == 'zlib':
+        import zlib
+        return _zlib_compress, zlib.decompress
+    elif codec == 'bz2':
+        import bz2
+        return bz2.compress, bz2.decompress
+    elif codec == 'lzma':
+        import lzma
+        return lzma.compress, lzma.decompress
+    raise ValueError('unknown codec: %r' % codec)
+
+
+def _zlib_compress(data):
+    import zlib
+    # favour speed, rows are mostly read back soon after being written
+    return zlib.compress(data, 1)
+
+
+def _cachekey(table, codec):
+    filename = getattr(table, 'filename', None)
+    if not isinstance(filename, (str, text_type)) or \
+            not os.path.isfile(filename):
+        return None
+    st = os.stat(filename)
+    try:
+        args = sorted((k, _keyvalue(v)) for k, v in vars(table).items()
+                      if not k.startswith('_') and k not in _unkeyed)
+    except _Unkeyable:
+        return None
+    key = repr((type(table).__name__, os.path.abspath(filename), st.st_size,
+                st.st_mtime, args, codec))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+# arguments of tables which don't affect the rows returned
+_unkeyed = ('filename', 'parallel', 'threads', 'buffersize', 'index')
+
+
+# types of arguments whose repr is their value
+_keytypes = (type(None), bool, float, str, text_type, binary_type) + \
+    integer_types
+
+
+class _Unkeyable(Exception):
+    pass
+
+
+def _keyvalue(v):
+    # value of an argument for the key, raising _Unkeyable for values whose
+    # repr may not identify them, e.g., functions and other objects, whose
+    # repr gives their address
+    if isinstance(v, _keytypes):
+        return v
+    if isinstance(v, (tuple, list)):
+        return tuple(_keyvalue(x) for x in v)
+    if isinstance(v, (set, frozenset)):
+        return ('set', sorted((_keyvalue(x) for x in v), key=repr))
+    if isinstance(v, dict):
+        return ('dict', sorted(((_keyvalue(k), _keyvalue(x))
+                                for k, x in v.items()), key=repr))
+    if isinstance(v, Table):
+        # N.B., tables of regions are keyed by their rows
+        return tuple(_keyvalue(tuple(row)) for row in v)
+    if isinstance(v, type) or type(v) is type(len):
+        # built-in functions and types only, others may be redefined
+        module = getattr(v, '__module__', None)
+        if module in ('builtins', '__builtin__'):
+            return ('builtin', v.__name__)
+    raise _Unkeyable(v)
+
+
+def _dumps(rows):
+    if not reducers:
+        return pickle.dumps(rows, protocol=-1)
+    buf = io.BytesIO()
+    pickler = pickle.Pickler(buf, protocol=-1)
+    pickler.dispatch_table = dict(copyreg.dispatch_table)
+    pickler.dispatch_table.update(reducers)
+    pickler.dump(rows)
+    return buf.getvalue()
+
+
+def _writeframe(f, rows, compress):
+    data = _dumps(rows)
+    if compress is not None:
+        data = compress(data)
+    f.write(struct.pack('<I', len(data)))
+    f.write(data)
+
+
+def _readrows(f, decompress):
+    while True:
+        n = f.read(4)
+        if len(n) < 4:
+            break
+        data = f.read(struct.unpack('<I', n)[0])
+        if decompress is not None:
+            data = decompress(data)
+        for row in _loads(data):
+            yield row
+
+
+def _loads(data):
+    # N.B., unpickling creates many container objects at once, which would
+    # otherwise trigger repeated garbage collection passes
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return pickle.loads(data)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _entries(path):
+    # cached tables in path, as (filename, size, last used) tuples
+    entries = list()
+    if os.path.isdir(path):
+        for name in os.listdir(path):
+            if name.endswith('.rows'):
+                fn = os.path.join(path, name)
+                try:
+                    st = os.stat(fn)
+                except OSError:
+                    continue
+                entries.append((fn, st.st_size, st.st_mtime))
+    return entries
+
+
+def _evict(path, size, keep=None):
+    entries = sorted(_entries(path), key=lambda e: e[2])
+    total = sum(e[1] for e in entries)
+    for fn, n, _ in entries:
+        if total <= size:
+            break
+        if fn != keep:
+            _remove(fn)
+            total -= n
+
+
+def _touch(filename):
+    try:
+        os.utime(filename, None)
+    except OSError:
+        pass
+
+
+def _rename(src, dst):
+    try:
+        os.replace(src, dst)
+    except AttributeError:
+        # PY2, N.B., does not replace an existing file on Windows
+        os.rename(src, dst)
+
+
+def _remove(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, division
+
+
+from array import array
+
+
+import petl as etl
+from petl.util.base import Table, asindices
+
+
+class ValueDictionary(object):
+    """
+    Distinct values of a field, in order of first appearance, each with an
+    integer code given by its position in `values`. List values are stored
+    as tuples, so they can be shared between rows.
+
+    """
+
+    def __init__(self):
+        self.values = list()
+        self.codes = dict()
+
+    def encode(self, value):
+        """Return the code for `value`, adding it if it has not been seen."""
+        if isinstance(value, list):
+            value = tuple(value)
+        try:
+            return self.codes[value]
+        except KeyError:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+            return code
+
+    def intern(self, value):
+        """Return the stored value equal to `value`, adding it if needed."""
+        return self.values[self.encode(value)]
+
+    def __len__(self):
+        return len(self.values)
+
+
+def dictcodes(table, field):
+    """
+    Return the values of `field` in `table` as an array of integer codes,
+    along with a list of the distinct values indexed by code, e.g.::
+
+        >>> import petl as etl
+        >>> # activate bio extensions
+        ... import petlx.bio
+        >>> table1 = etl.fromgff3('fixture/sample.gff', encode=True)
+        >>> codes, values = table1.dictcodes('type')
+        >>> values[:4]
+        ['supercontig', 'gene', 'mRNA', 'CDS']
+        >>> list(codes[:8])
+        [0, 0, 0, 0, 0, 0, 0, 0]
+
+    The codes are a standard library :class:`array.array` which may be
+    passed to `numpy.asarray` without copying, e.g., for columnar export.
+    If the field is dictionary encoded by the table, i.e., it was read with
+    the `encode` argument, the codes are those of the table's own
+    dictionary, so they are consistent between calls. Otherwise a new
+    dictionary is built.
+
+    """
+
+    it = iter(table)
+    try:
+        hdr = next(it)
+    except StopIteration:
+        hdr = ()
+    i = field if isinstance(field, int) else asindices(hdr, field)[0]
+    d = getattr(table, '_dictionaries', {}).get(i)
+    if d is None:
+        d = ValueDictionary()
+    encode = d.encode
+    codes = array('l', (encode(row[i]) for row in it))
+    return codes, list(d.values)
+
+
+etl.dictcodes = dictcodes
+Table.dictcodes = dictcodes
+
+
+def _encodefields(encode, default):
+    # fields to encode as requested via the `encode` argument of a reader
+    if encode is True:
+        return default
+    elif isinstance(encode, (list, tuple)):
+        return tuple(encode)
+    return encode,
+
+
+def _encoderows(hdr, rows, fields, dictionaries):
+    # share the values of fields (names or indices) between rows, via a
+    # dictionary per field which persists between iterations so the codes
+    # of values do not change; N.B., the dictionaries are created before
+    # the rows are iterated, so are available once the header is returned
+    indices = [f if isinstance(f, int) else asindices(hdr, f)[0]
+               for f in fields]
+    interns = [(i, dictionaries.setdefault(i, ValueDictionary()).intern)
+               for i in indices]
+    return _iterencoded(rows, interns)
+
+
+def _iterencoded(rows, interns):
+    for row in rows:
+        vals = list(row)
+        n = len(vals)
+        for i, intern in interns:
+            if i < n:
+                vals[i] = intern(vals[i])
+        # N.B., keeps the row type, e.g., GFF3Feature
+        yield type(row)(vals)
@@ -2,16 +2,56 @@
 from __future__ import absolute_import, print_function, division
 
 
-from petl.compat import PY2
+import io
+import operator
+import os
+from itertools import islice
+from array import array
+from petl.compat import PY2, pickle
 if PY2:
     from urllib import unquote_plus
+    from collections import Mapping
 else:
     from urllib.parse import unquote_plus
+    from collections.abc import Mapping
 
 
 import petl as etl
+from petl.compat import text_type, string_types
+from petl.io.sources import read_source_from_arg
+from petl.util.base import Table, asindices
 # activate tabix extension
 import petlx.bio.tabix
+from petlx.bio.tabix import _acquire, _release, _iterpool, _viewpool, \
+    _closepool
+from petlx.bio.lineindex import lineindex
+from petlx.bio.cache import diskcache
+from petlx.bio.encoding import _encodefields, _encoderows
+from petlx.bio.bgzf import TabixWriter, _writetable, isbgzf, bgzflines
+
+
+# attribute keys are shared between rows, so keep one copy of each
+_interned_keys = dict()
+
+
+# maximum number of entries in each of the module-level tables of shared
+# values, which are cleared once full, so a long running process reading
+# many files does not keep every distinct value alive; rows already read
+# keep their values
+_intern_limit = 2**16
+
+
+def _intern_key(key):
+    if len(_interned_keys) >= _intern_limit:
+        _interned_keys.clear()
+    return _interned_keys.setdefault(key, key)
+
+
+def _unquote(s):
+    # most attribute strings contain no escapes, avoid the cost of unquoting
+    if '%' in s or '+' in s:
+        return unquote_plus(s)
+    return s
 
 
 def gff3_parse_attributes(attributes_string):
@@ -25,19 +65,138 @@ def gff3_parse_attributes(attributes_string):
     fields = attributes_string.split(';')
     for f in fields:
         if '=' in f:
-            key, value = f.split('=')
-            attributes[unquote_plus(key).strip()] = unquote_plus(value.strip())
+            key, value = f.split('=', 1)
+            attributes[_intern_key(_unquote(key).strip())] = \
+                _unquote(value.strip())
         elif len(f) > 0:
             # not strictly kosher
-            attributes[unquote_plus(f).strip()] = True            
+            attributes[_intern_key(_unquote(f).strip())] = True
     return attributes
 
 
+class GFF3Attributes(Mapping):
+    """
+    Read-only mapping over a string of GFF3 attributes, which is only parsed
+    the first time the mapping is accessed. Looking up a single key via
+    :meth:`get` before the mapping has been parsed scans the string without
+    unquoting any other values.
+
+    Once parsed, the values are held in a tuple alongside a set of keys
+    shared with all other rows having the same keys, and the string itself
+    is dropped if it can be formatted again exactly from the values.
+
+    """
+
+    __slots__ = ('_string', '_keys', '_values')
+
+    def __init__(self, attributes_string):
+        self._string = attributes_string
+        self._keys = None
+        self._values = None
+
+    def _parse(self):
+        if self._keys is None:
+            parsed = gff3_parse_attributes(self._string)
+            self._keys = _keyset(tuple(parsed))
+            self._values = tuple(parsed.values())
+            if gff3_format_attributes(parsed) == self._string:
+                self._string = None
+        return self._keys
+
+    def __getitem__(self, key):
+        index = self._parse().index
+        return self._values[index[key]]
+
+    def __iter__(self):
+        return iter(self._parse().keys)
+
+    def __len__(self):
+        return len(self._parse().keys)
+
+    def __contains__(self, key):
+        return key in self._parse().index
+
+    def get(self, key, default=None):
+        if self._keys is not None:
+            i = self._keys.index.get(key)
+            return default if i is None else self._values[i]
+        value = default
+        for f in self._string.split(';'):
+            k, sep, v = f.partition('=')
+            if _unquote(k).strip() == key:
+                # last occurrence wins, as when parsing into a dict
+                value = _unquote(v.strip()) if sep else True
+        return value
+
+    def __str__(self):
+        if self._string is None:
+            return gff3_format_attributes(self)
+        return self._string
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def __reduce__(self):
+        return GFF3Attributes, (str(self),)
+
+
+class _KeySet(object):
+    # keys of a GFF3Attributes mapping, with the position of each value
+
+    __slots__ = ('keys', 'index')
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.index = dict((k, i) for i, k in enumerate(keys))
+
+
+# rows with the same attribute keys share a single key set
+_keysets = dict()
+
+
+def _keyset(keys):
+    try:
+        return _keysets[keys]
+    except KeyError:
+        if len(_keysets) >= _intern_limit:
+            _keysets.clear()
+        ks = _keysets[keys] = _KeySet(keys)
+        return ks
+
+
+class GFF3Feature(tuple):
+    """
+    Row of a GFF3 table, returned by :func:`fromgff3`. This is a tuple, with
+    the columns also available as attributes, e.g., ``row.seqid`` or
+    ``row.start``. The seqid, source, type and strand strings are shared
+    between rows.
+
+    """
+
+    __slots__ = ()
+
+    seqid = property(operator.itemgetter(0))
+    source = property(operator.itemgetter(1))
+    type = property(operator.itemgetter(2))
+    start = property(operator.itemgetter(3))
+    end = property(operator.itemgetter(4))
+    score = property(operator.itemgetter(5))
+    strand = property(operator.itemgetter(6))
+    phase = property(operator.itemgetter(7))
+    attributes = property(operator.itemgetter(8))
+
+
+# seqid, source, type and strand values are shared between rows, so keep
+# one copy of each
+_interned_values = dict()
+
+
 GFF3_HEADER = ('seqid', 'source', 'type', 'start', 'end', 'score', 'strand',
                'phase', 'attributes')
 
 
-def fromgff3(filename, region=None):
+def fromgff3(filename, region=None, attributes=None, threads=None,
+             parallel=None, index=False, encode=None):
     """
     Extract feature rows from a GFF3 file, e.g.::
 
@@ -82,29 +241,563 @@ def fromgff3(filename, region=None):
         | 'apidb|MAL5' | 'ApiDB' | 'rRNA'        | 1289594 | 1291685 | '.'   | '+'    | '.'   | {'ID': 'apidb|rna_MAL5_18S-1', |
         +--------------+---------+---------------+---------+---------+-------+--------+-------+--------------------------------+
 
-    """
+    Rows are :class:`GFF3Feature` tuples, which also provide the fields as
+    attributes, e.g., ``row.start``. The attributes column holds a
+    :class:`GFF3Attributes` mapping, which defers parsing of the attributes
+    string until it is first accessed.
+    Specific attributes may be extracted into separate fields by passing a
+    tuple of keys as the `attributes` argument, e.g.::
+
+        >>> table3 = etl.fromgff3('fixture/sample.gff',
+        ...                       attributes=('ID', 'Parent'))
+        >>> table3.cut('type', 'ID', 'Parent').selecteq('type', 'CDS').head(2)
+        +-------+--------------------+--------------------+
+        | type  | ID                 | Parent             |
+        +=======+====================+====================+
+        | 'CDS' | 'apidb|cds_coI-1'  | 'apidb|rna_coI-1'  |
+        +-------+--------------------+--------------------+
+        | 'CDS' | 'apidb|cds_CYTB-1' | 'apidb|rna_CYTB-1' |
+        +-------+--------------------+--------------------+
+
+    Missing attributes are given as None.
 
-    if region is None:
+    Reading stops at a '##FASTA' directive, so any trailing sequence data is
+    ignored. Gzipped files are read in large buffered chunks. If `threads`
+    is given and the file is compressed with bgzip, blocks are decompressed
+    by that many threads, see :func:`petlx.bio.bgzf.bgzflines`. The
+    '##sequence-region' directives from the file header are available via
+    the `sequence_regions()` method of the returned table, e.g.::
 
-        # parse file as tab-delimited
-        table = etl.fromtsv(filename)
+        >>> table1.sequence_regions()['apidb|MAL1']
+        (1, 643292)
 
-    else:
+    If `encode` is True, the seqid, source, type and strand fields are
+    dictionary encoded: the table keeps the distinct values of each field,
+    rows share a single copy of each value, and the integer codes of the
+    values are available via :func:`petlx.bio.encoding.dictcodes`, e.g.,
+    for columnar export. Shared values also make pickling and comparing
+    rows cheaper, e.g., when sorting. Other fields may be encoded by
+    passing a tuple of field names as `encode`.
 
-        # extract via tabix
-        table = etl.fromtabix(filename, region=region)
+    Uncompressed files may be parsed by a pool of `parallel` worker
+    processes, each reading a separate range of bytes. As rows are sent
+    back to the parent process, this mostly helps when there is more work
+    per row, e.g., extracting `attributes`. This requires an index of line
+    offsets, which is built via a single pass through the file the first
+    time it is needed and cached in `filename` + '.pidx', see
+    :func:`petlx.bio.lineindex.lineindex`. If `index` is True, or `parallel`
+    is given, or an up to date index already exists, the `rowslice()`
+    method of the table uses the index to jump close to the first row
+    required rather than reading through the file, e.g.::
 
-    return (
-        table
-        .pushheader(GFF3_HEADER)
-        .skipcomments('#')
-        # ignore any row not 9 values long (e.g., trailing fasta)
-        .rowlenselect(9)
-        # parse attributes into a dict
-        .convert('attributes', gff3_parse_attributes)
-        # parse coordinates
-        .convert(('start', 'end'), int)
-    )
+        >>> import os, shutil, tempfile
+        >>> tmpdir = tempfile.mkdtemp()
+        >>> filename = os.path.join(tmpdir, 'sample.gff')
+        >>> _ = shutil.copy('fixture/sample.gff', filename)
+        >>> table4 = etl.fromgff3(filename, parallel=2)
+        >>> table4.nrows()
+        177
+        >>> table4.rowslice(170, 172).cut('seqid', 'type', 'start')
+        +--------------+-------+-------+
+        | seqid        | type  | start |
+        +==============+=======+=======+
+        | 'apidb|MAL1' | 'CDS' | 55161 |
+        +--------------+-------+-------+
+        | 'apidb|MAL1' | 'CDS' | 54001 |
+        +--------------+-------+-------+
+
+        >>> shutil.rmtree(tmpdir)
+
+    """
+
+    return GFF3View(filename, region=region, attributes=attributes,
+                    threads=threads, parallel=parallel, index=index,
+                    encode=encode)
 
 
 etl.fromgff3 = fromgff3
+
+
+class GFF3View(Table):
+
+    def __init__(self, filename, region=None, attributes=None,
+                 buffersize=2**20, threads=None, parallel=None,
+                 index=False, encode=None):
+        self.filename = filename
+        self.region = region
+        if attributes:
+            self.attributes = tuple(attributes)
+        else:
+            self.attributes = ()
+        self.buffersize = buffersize
+        self.threads = threads
+        self.parallel = parallel
+        self.index = index
+        self.encode = encode
+        self._index = None
+        self._dictionaries = dict()
+        self._pool = None
+
+    def __iter__(self):
+        hdr = GFF3_HEADER + self.attributes
+        rows = self._iterrows()
+        if self.encode:
+            fields = _encodefields(self.encode, _GFF3_ENCODED)
+            rows = _encoderows(hdr, rows, fields, self._dictionaries)
+        yield hdr
+        for row in rows:
+            yield row
+
+    def _iterrows(self):
+        if self.parallel:
+            for row in self._iterparallel():
+                yield row
+        elif self.region is None and self.threads and \
+                isinstance(self.filename, string_types) and \
+                isbgzf(self.filename):
+            lines = bgzflines(self.filename, threads=self.threads)
+            try:
+                for row in _iterfeatures(lines, self.attributes):
+                    yield row
+            finally:
+                lines.close()
+        elif self.region is None:
+            source = read_source_from_arg(self.filename)
+            with source.open('rb') as f:
+                for row in _iterfeatures(self._textlines(f),
+                                         self.attributes):
+                    yield row
+        else:
+            f = _acquire(self.filename)
+            try:
+                for row in _iterfeatures(f.fetch(region=self.region),
+                                         self.attributes):
+                    yield row
+            finally:
+                _release(self.filename, f)
+
+    def _lineindex(self, build=True):
+        # index of line offsets, if the file can be indexed
+        if self.region is not None or not _isplainfile(self.filename):
+            return None
+        if self._index is None or not self._index.current():
+            self._index = lineindex(self.filename, build=build,
+                                    **_GFF3_RECORDS)
+        return self._index
+
+    def _iterparallel(self):
+        index = self._lineindex()
+        if index is None:
+            raise ValueError('parallel parsing requires an uncompressed '
+                             'local file and no region')
+        # shards of at most 16MB, and a few per worker to balance the load
+        n = max(4 * self.parallel, index.end // 2**24)
+        shards = ((self.filename, start, stop, self.attributes)
+                  for start, stop in index.ranges(n))
+        for rows in _iterpool(_viewpool(self), shards, self.parallel, True,
+                              _parseshard):
+            for row in rows:
+                yield _feature(row[:8], GFF3Attributes(row[8]), row[9:])
+
+    def close(self):
+        _closepool(self)
+
+    def rowslice(self, *sliceargs):
+        index = self._lineindex(build=self.index or bool(self.parallel))
+        s = slice(*sliceargs)
+        if index is None or (s.start or 0) < 0 or \
+                (s.stop is not None and s.stop < 0):
+            return etl.rowslice(self, *sliceargs)
+        return GFF3SliceView(self, s.start or 0, s.stop, s.step)
+
+    def _textlines(self, f):
+        # N.B., read ahead in large chunks, particularly helps when the
+        # underlying stream is decompressing gzip
+        f = io.BufferedReader(f, buffer_size=self.buffersize)
+        return io.TextIOWrapper(f, encoding='utf-8')
+
+    def sequence_regions(self):
+        """
+        Return a dictionary mapping seqid to (start, end) tuples, parsed
+        from the '##sequence-region' directives in the file header.
+
+        """
+
+        regions = dict()
+        if self.region is None:
+            source = read_source_from_arg(self.filename)
+            with source.open('rb') as f:
+                _parse_sequence_regions(self._textlines(f), regions)
+        else:
+            f = _acquire(self.filename)
+            try:
+                _parse_sequence_regions(f.header, regions)
+            finally:
+                _release(self.filename, f)
+        return regions
+
+
+GFF3View.diskcache = diskcache
+
+
+class GFF3SliceView(Table):
+    # rows of a GFF3 file from start to stop, seeking via the line index
+
+    def __init__(self, source, start, stop, step):
+        self.source = source
+        self.start = start
+        self.stop = stop
+        self.step = step
+
+    def __iter__(self):
+        source = self.source
+        hdr = GFF3_HEADER + source.attributes
+        rows = self._iterrows()
+        if source.encode:
+            fields = _encodefields(source.encode, _GFF3_ENCODED)
+            rows = _encoderows(hdr, rows, fields, source._dictionaries)
+        yield hdr
+        for row in rows:
+            yield row
+
+    def _iterrows(self):
+        source = self.source
+        index = source._lineindex()
+        offset, skip = index.seek(self.start)
+        stop = None if self.stop is None else skip + self.stop - self.start
+        with open(source.filename, 'rb') as f:
+            f.seek(offset)
+            features = _iterfeatures(source._textlines(f), source.attributes)
+            for row in islice(features, skip, stop, self.step):
+                yield row
+
+
+# fields which are dictionary encoded if `encode` is True
+_GFF3_ENCODED = ('seqid', 'source', 'type', 'strand')
+
+
+# which lines of a GFF3 file are features, for the line index
+_GFF3_RECORDS = dict(comment='#', cutoff=('##FASTA', '>'), fields=9)
+
+
+def _isplainfile(filename):
+    return isinstance(filename, string_types) and \
+        os.path.isfile(filename) and \
+        not filename.endswith(('.gz', '.bgz', '.bz2', '.zip', '.xz'))
+
+
+def _parseshard(shard):
+    filename, start, stop, attributes = shard
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        text = f.read(stop - start).decode('utf-8')
+    # N.B., attributes are returned as strings, which are much cheaper to
+    # send back to the parent process
+    return [row[:8] + (str(row[8]),) + row[9:]
+            for row in _iterfeatures(text.split('\n'), attributes)]
+
+
+def _iterfeatures(lines, attributes=()):
+    for line in lines:
+        if not line or line[0] == '#':
+            if line.startswith('##FASTA'):
+                # remainder of the file is sequence data
+                break
+            continue
+        if line[0] == '>':
+            # sequence data without a preceding ##FASTA directive
+            break
+        vals = line.rstrip('\r\n').split('\t')
+        # ignore any row not 9 values long
+        if len(vals) != 9:
+            continue
+        attrs = GFF3Attributes(vals[8])
+        if attributes:
+            yield _feature(vals, attrs,
+                           tuple(attrs.get(key) for key in attributes))
+        else:
+            yield _feature(vals, attrs)
+
+
+def _feature(vals, attrs, extra=()):
+    if len(_interned_values) >= _intern_limit:
+        _interned_values.clear()
+    intern = _interned_values.setdefault
+    seqid, source, typ = vals[:3]
+    strand = vals[6]
+    return GFF3Feature((intern(seqid, seqid), intern(source, source),
+                        intern(typ, typ), int(vals[3]), int(vals[4]),
+                        vals[5], intern(strand, strand), vals[7], attrs) +
+                       extra)
+
+
+def _parse_sequence_regions(lines, regions):
+    for line in lines:
+        if not isinstance(line, text_type):
+            line = text_type(line, encoding='utf-8')
+        if not line.startswith('#'):
+            # end of header
+            break
+        if line.startswith('##sequence-region'):
+            vals = line.split()
+            if len(vals) == 4:
+                regions[vals[1]] = (int(vals[2]), int(vals[3]))
+
+
+def togff3(table, filename, index=True):
+    """
+    Write a table of GFF3 features to a file, e.g.::
+
+        >>> import petl as etl
+        >>> # activate bio extensions
+        ... import petlx.bio
+        >>> import os, shutil, tempfile
+        >>> tmpdir = tempfile.mkdtemp()
+        >>> filename = os.path.join(tmpdir, 'example.gff.gz')
+        >>> table1 = etl.fromgff3('fixture/sample.sorted.gff.gz')
+        >>> table1.selecteq('type', 'gene').togff3(filename)
+        >>> etl.fromgff3(filename, region='apidb|MAL1').nrows()
+        9
+        >>> shutil.rmtree(tmpdir)
+
+    The first nine fields are written, taken by name (seqid, source, type,
+    start, end, score, strand, phase, attributes). Attributes may be
+    strings or mappings, and None values are written as '.'.
+
+    If `filename` ends with '.gz' the file is compressed with bgzip's block
+    format, and unless `index` is False, a tabix index is built as the
+    features are written, in which case the table must be sorted by seqid
+    and start position.
+
+    """
+
+    _writetable(table, _GFF3Writer, filename, index=index)
+
+
+etl.togff3 = togff3
+Table.togff3 = togff3
+
+
+class _GFF3Writer(TabixWriter):
+
+    def __init__(self, filename, fields, index=True):
+        super(_GFF3Writer, self).__init__(filename, 'gff', index=index)
+        self.getter = operator.itemgetter(*asindices(fields, GFF3_HEADER))
+        self.writeheader('##gff-version 3')
+
+    def writerow(self, row):
+        vals = self.getter(row)
+        seqid, start, end = vals[0], vals[3], vals[4]
+        attrs = vals[8]
+        if isinstance(attrs, Mapping) and not isinstance(attrs,
+                                                         GFF3Attributes):
+            attrs = gff3_format_attributes(attrs)
+        line = '\t'.join('.' if v is None else text_type(v)
+                          for v in vals[:8] + (attrs,))
+        self.writerecord(seqid, int(start) - 1, int(end), line)
+
+
+def gff3_format_attributes(attributes):
+    """
+    Format a mapping of GFF3 attributes as a string of 'key=value' pairs
+    delimited by ';'. Values which are lists or tuples are joined by ','.
+
+    """
+
+    entries = list()
+    for key, value in attributes.items():
+        if value is None or value is False:
+            continue
+        if value is True:
+            entries.append(_quote(key))
+        elif isinstance(value, (list, tuple)):
+            entries.append('%s=%s' % (_quote(key),
+                                      ','.join(_quote(v, _reserved_item)
+                                               for v in value)))
+        else:
+            # commas are left alone, as separators of multiple values
+            entries.append('%s=%s' % (_quote(key), _quote(value)))
+    return ';'.join(entries)
+
+
+# characters with a reserved meaning in GFF3 columns, '%' must come first
+_reserved = (('%', '%25'), (';', '%3B'), ('=', '%3D'), ('&', '%26'),
+             ('\t', '%09'), ('\n', '%0A'), ('\r', '%0D'))
+_reserved_item = _reserved + ((',', '%2C'),)
+
+
+def _quote(v, reserved=_reserved):
+    v = text_type(v)
+    for c, escaped in reserved:
+        if c in v:
+            v = v.replace(c, escaped)
+    return v
+
+
+def gff3index(table):
+    """
+    Build an index of the feature hierarchy in a table of GFF3 features, via
+    a single pass through the table, e.g.::
+
+        >>> import petl as etl
+        >>> # activate bio extensions
+        ... import petlx.bio
+        >>> index = etl.fromgff3('fixture/sample.gff').gff3index()
+        >>> [row[2] for row in index.children('apidb|coI')]
+        ['mRNA']
+        >>> [row[8]['ID'] for row in index.descendants('apidb|coI',
+        ...                                            type='CDS')]
+        ['apidb|cds_coI-1']
+
+    Features are linked via the 'ID' and 'Parent' attributes. The index holds
+    the rows of the table in memory, along with a mapping from feature ID to
+    row offset and a compact array-backed adjacency list from parent to
+    child rows. Where several rows share the same ID (e.g., a CDS split over
+    several lines) the ID maps to the first of them.
+
+    The index can be saved to disk and loaded again, avoiding another pass
+    through the source file, e.g.::
+
+        >>> import os, shutil, tempfile
+        >>> tmpdir = tempfile.mkdtemp()
+        >>> filename = os.path.join(tmpdir, 'example.gff3index')
+        >>> index.save(filename)
+        >>> from petlx.bio.gff3 import GFF3Index
+        >>> index = GFF3Index.load(filename)
+        >>> shutil.rmtree(tmpdir)
+
+    """
+
+    return GFF3Index.build(table)
+
+
+etl.gff3index = gff3index
+Table.gff3index = gff3index
+
+
+class GFF3Index(object):
+
+    def __init__(self, header, rows, ids, child_offsets, children):
+        self.header = header
+        self.rows = rows
+        self.ids = ids
+        # children of the row at offset i are children[child_offsets[i]:
+        # child_offsets[i+1]]
+        self.child_offsets = child_offsets
+        self.children_array = children
+        self._type_index = header.index('type')
+        self._attributes_index = header.index('attributes')
+
+    @classmethod
+    def build(cls, table):
+        it = iter(table)
+        header = tuple(next(it))
+        attributes_index = header.index('attributes')
+
+        rows = list()
+        ids = dict()
+        edges = list()
+        for offset, row in enumerate(it):
+            row = tuple(row)
+            rows.append(row)
+            attributes = row[attributes_index]
+            feature_id = attributes.get('ID')
+            if feature_id is not None and feature_id not in ids:
+                ids[feature_id] = offset
+            parent = attributes.get('Parent')
+            if parent:
+                for parent_id in parent.split(','):
+                    edges.append((parent_id, offset))
+
+        # resolve parents, which may be defined after their children
+        counts = array('l', [0]) * (len(rows) + 1)
+        resolved = list()
+        for parent_id, offset in edges:
+            parent_offset = ids.get(parent_id)
+            if parent_offset is not None:
+                counts[parent_offset + 1] += 1
+                resolved.append((parent_offset, offset))
+
+        # build adjacency in compressed sparse row layout
+        for i in range(len(rows)):
+            counts[i + 1] += counts[i]
+        child_offsets = counts
+        children = array('l', [0]) * len(resolved)
+        fill = array('l', child_offsets[:-1])
+        for parent_offset, offset in resolved:
+            children[fill[parent_offset]] = offset
+            fill[parent_offset] += 1
+
+        return cls(header, rows, ids, child_offsets, children)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, feature_id):
+        return feature_id in self.ids
+
+    def feature(self, feature_id):
+        """Return the row for the feature with the given ID."""
+        return self.rows[self.ids[feature_id]]
+
+    def _child_offsets(self, offset):
+        return self.children_array[self.child_offsets[offset]:
+                                   self.child_offsets[offset + 1]]
+
+    def children(self, feature_id, type=None):
+        """Iterate over rows for the direct children of the given feature,
+        optionally restricted to features of the given type."""
+        for offset in self._child_offsets(self.ids[feature_id]):
+            row = self.rows[offset]
+            if type is None or row[self._type_index] == type:
+                yield row
+
+    def descendants(self, feature_id, type=None):
+        """Iterate depth-first over rows for all descendants of the given
+        feature, optionally restricted to features of the given type."""
+        stack = list(reversed(self._child_offsets(self.ids[feature_id])))
+        seen = set()
+        while stack:
+            offset = stack.pop()
+            if offset in seen:
+                # features may have multiple parents
+                continue
+            seen.add(offset)
+            row = self.rows[offset]
+            if type is None or row[self._type_index] == type:
+                yield row
+            stack.extend(reversed(self._child_offsets(offset)))
+
+    def gene_models(self, type='gene'):
+        """Iterate over gene models, yielding a (gene, transcripts) tuple for
+        each feature of the given type, where transcripts is a list of
+        (transcript, features) tuples and features is a list of all
+        descendants of the transcript (exons, CDSs, etc.)."""
+        for offset, row in enumerate(self.rows):
+            if row[self._type_index] != type:
+                continue
+            feature_id = row[self._attributes_index].get('ID')
+            if feature_id is None or self.ids[feature_id] != offset:
+                continue
+            transcripts = list()
+            for child_offset in self._child_offsets(offset):
+                transcript = self.rows[child_offset]
+                transcript_id = transcript[self._attributes_index].get('ID')
+                if transcript_id is None:
+                    features = []
+                else:
+                    features = list(self.descendants(transcript_id))
+                transcripts.append((transcript, features))
+            yield row, transcripts
+
+    def save(self, filename):
+        """Save the index to a file."""
+        with open(filename, 'wb') as f:
+            pickle.dump((self.header, self.rows, self.ids, self.child_offsets,
+                         self.children_array), f, protocol=-1)
+
+    @classmethod
+    def load(cls, filename):
+        """Load an index previously saved via :meth:`save`."""
+        with open(filename, 'rb') as f:
+            return cls(*pickle.load(f))
@@ -0,0 +1,542 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, division
+
+
+from collections import defaultdict
+from heapq import heappush, heappop
+from itertools import islice
+from operator import itemgetter
+
+
+import petl as etl
+from petl.compat import text_type
+from petl.util.base import Table, asindices
+
+
+def overlapindex(table, chrom='chrom', start='start', stop='stop',
+                 include_stop=False):
+    """
+    Build an in-memory index of the intervals in a table with chromosome,
+    start and stop fields, which can be queried for overlapping rows, e.g.::
+
+        >>> import petl as etl
+        >>> # activate bio extensions
+        ... import petlx.bio
+        >>> features = etl.fromgff3('fixture/sample.gff')
+        >>> index = etl.overlapindex(features, 'seqid', 'start', 'end',
+        ...                          include_stop=True)
+        >>> [row[2] for row in index.find('apidb|MAL5', 1289593, 1289595)]
+        ['supercontig', 'gene', 'rRNA', 'exon']
+
+    Intervals on each chromosome are held in sorted NumPy arrays, grouped by
+    interval length so that a query only needs to scan intervals which could
+    possibly overlap. Requires NumPy to be installed.
+
+    Note start coordinates are included and stop coordinates are excluded
+    from intervals. Use the `include_stop` keyword argument to include the
+    upper bound of intervals when finding overlaps. A zero-length interval
+    (e.g., an insertion in BED coordinates) overlaps any interval which
+    strictly contains its position.
+
+    """
+
+    return OverlapIndex(table, chrom=chrom, start=start, stop=stop,
+                        include_stop=include_stop)
+
+
+etl.overlapindex = overlapindex
+Table.overlapindex = overlapindex
+
+
+def _fieldindices(hdr, *fields):
+    # N.B., start and stop may be the same field, e.g., VCF POS
+    return tuple(asindices(hdr, f)[0] for f in fields)
+
+
+class OverlapIndex(object):
+
+    def __init__(self, table, chrom='chrom', start='start', stop='stop',
+                 include_stop=False):
+        import numpy as np
+
+        it = iter(table)
+        self.header = tuple(next(it))
+        ichrom, istart, istop = _fieldindices(self.header, chrom, start, stop)
+        self.include_stop = include_stop
+
+        self.rows = list()
+        coords = defaultdict(list)
+        for offset, row in enumerate(it):
+            row = tuple(row)
+            self.rows.append(row)
+            coords[row[ichrom]].append((row[istart], row[istop], offset))
+
+        # for each chromosome, a list of (maxlen, starts, stops, offsets)
+        # groups, where all intervals within a group have similar length
+        self.groups = dict()
+        for c, values in coords.items():
+            values = np.array(values, dtype='i8').reshape(-1, 3)
+            starts, stops, offsets = values[:, 0], values[:, 1], values[:, 2]
+            lengths = np.maximum(stops - starts, 0)
+            # group by power of 2 of the interval length
+            classes = np.frexp(lengths)[1]
+            groups = list()
+            for k in np.unique(classes):
+                loc = classes == k
+                order = np.argsort(starts[loc], kind='mergesort')
+                groups.append((int(lengths[loc].max()),
+                               starts[loc][order],
+                               stops[loc][order],
+                               offsets[loc][order]))
+            self.groups[c] = groups
+
+    def __len__(self):
+        return len(self.rows)
+
+    def find(self, chrom, start, stop):
+        """Return a list of rows overlapping the given interval, in the order
+        they appeared in the indexed table."""
+        import numpy as np
+        matches = self.findall(chrom, np.array([start]), np.array([stop]))[1]
+        return [self.rows[offset] for offset in matches]
+
+    def findall(self, chrom, starts, stops):
+        """Find overlaps for an array of query intervals on a single
+        chromosome. Returns a pair of arrays (queries, offsets) giving the
+        index of the query interval and the offset of the overlapping row in
+        the indexed table for each overlap, sorted by query then offset."""
+        import numpy as np
+
+        starts = np.asarray(starts, dtype='i8')
+        stops = np.asarray(stops, dtype='i8')
+        if self.include_stop:
+            lside, hside = 'left', 'right'
+        else:
+            lside, hside = 'right', 'left'
+
+        queries = list()
+        offsets = list()
+        for maxlen, gstarts, gstops, goffsets in self.groups.get(chrom, ()):
+            # candidates start after the query start minus the longest
+            # interval in the group, and before the query stop
+            lo = np.searchsorted(gstarts, starts - maxlen, side=lside)
+            hi = np.searchsorted(gstarts, stops, side=hside)
+            counts = np.maximum(hi - lo, 0)
+            total = counts.sum()
+            if not total:
+                continue
+            q = np.repeat(np.arange(len(starts)), counts)
+            cum = np.cumsum(counts) - counts
+            idx = np.repeat(lo - cum, counts) + np.arange(total)
+            if self.include_stop:
+                keep = gstops[idx] >= starts[q]
+            else:
+                keep = gstops[idx] > starts[q]
+            queries.append(q[keep])
+            offsets.append(goffsets[idx[keep]])
+
+        if not queries:
+            empty = np.zeros(0, dtype='i8')
+            return empty, empty
+        queries = np.concatenate(queries)
+        offsets = np.concatenate(offsets)
+        order = np.lexsort((offsets, queries))
+        return queries[order], offsets[order]
+
+
+def overlapjoin(left, right, lchrom='chrom', lstart='start', lstop='stop',
+                rchrom='chrom', rstart='start', rstop='stop',
+                include_stop=False, lprefix=None, rprefix=None,
+                batchsize=10000):
+    """
+    Join two tables by overlapping genome intervals, e.g.::
+
+        >>> import petl as etl
+        >>> # activate bio extensions
+        ... import petlx.bio
+        >>> variants = (('CHROM', 'POS', 'ID'),
+        ...             ('apidb|MAL5', 1289594, 'v1'),
+        ...             ('apidb|MAL5', 1000, 'v2'),
+        ...             ('apidb|MAL1', 643292, 'v3'))
+        >>> features = (
+        ...     etl
+        ...     .fromgff3('fixture/sample.gff')
+        ...     .cut('seqid', 'start', 'end', 'type')
+        ... )
+        >>> table1 = etl.overlapjoin(variants, features,
+        ...                          lchrom='CHROM', lstart='POS',
+        ...                          lstop='POS', rchrom='seqid',
+        ...                          rstart='start', rstop='end',
+        ...                          include_stop=True)
+        >>> table1.lookall()
+        +--------------+---------+------+--------------+---------+---------+---------------+
+        | CHROM        | POS     | ID   | seqid        | start   | end     | type          |
+        +==============+=========+======+==============+=========+=========+===============+
+        | 'apidb|MAL5' | 1289594 | 'v1' | 'apidb|MAL5' |       1 | 1343552 | 'supercontig' |
+        +--------------+---------+------+--------------+---------+---------+---------------+
+        | 'apidb|MAL5' | 1289594 | 'v1' | 'apidb|MAL5' | 1289594 | 1291685 | 'gene'        |
+        +--------------+---------+------+--------------+---------+---------+---------------+
+        | 'apidb|MAL5' | 1289594 | 'v1' | 'apidb|MAL5' | 1289594 | 1291685 | 'rRNA'        |
+        +--------------+---------+------+--------------+---------+---------+---------------+
+        | 'apidb|MAL5' | 1289594 | 'v1' | 'apidb|MAL5' | 1289594 | 1291685 | 'exon'        |
+        +--------------+---------+------+--------------+---------+---------+---------------+
+        | 'apidb|MAL5' |    1000 | 'v2' | 'apidb|MAL5' |       1 | 1343552 | 'supercontig' |
+        +--------------+---------+------+--------------+---------+---------+---------------+
+        | 'apidb|MAL1' |  643292 | 'v3' | 'apidb|MAL1' |       1 |  643292 | 'supercontig' |
+        +--------------+---------+------+--------------+---------+---------+---------------+
+
+    The right table is loaded into an :class:`OverlapIndex`, the left table
+    is streamed in batches of `batchsize` rows, so the left table may be
+    arbitrarily large. Overlapping rows from the right table are given in
+    their original order. Requires NumPy to be installed.
+
+    Note start coordinates are included and stop coordinates are excluded
+    from intervals. Use the `include_stop` keyword argument to include the
+    upper bound of intervals when finding overlaps. As for
+    :func:`overlapindex`, a zero-length interval overlaps any interval which
+    strictly contains its position.
+
+    """
+
+    return OverlapJoinView(left, right, lchrom=lchrom, lstart=lstart,
+                           lstop=lstop, rchrom=rchrom, rstart=rstart,
+                           rstop=rstop, include_stop=include_stop,
+                           lprefix=lprefix, rprefix=rprefix,
+                           batchsize=batchsize)
+
+
+etl.overlapjoin = overlapjoin
+Table.overlapjoin = overlapjoin
+
+
+def overlapleftjoin(left, right, lchrom='chrom', lstart='start', lstop='stop',
+                    rchrom='chrom', rstart='start', rstop='stop',
+                    include_stop=False, missing=None, lprefix=None,
+                    rprefix=None, batchsize=10000):
+    """
+    Like :func:`overlapjoin` but rows from the left table without any
+    overlapping rows in the right table are included, with `missing` in
+    place of values from the right table.
+
+    """
+
+    return OverlapJoinView(left, right, lchrom=lchrom, lstart=lstart,
+                           lstop=lstop, rchrom=rchrom, rstart=rstart,
+                           rstop=rstop, include_stop=include_stop,
+                           lprefix=lprefix, rprefix=rprefix,
+                           batchsize=batchsize, leftouter=True,
+                           missing=missing)
+
+
+etl.overlapleftjoin = overlapleftjoin
+Table.overlapleftjoin = overlapleftjoin
+
+
+def overlapsubtract(left, right, lchrom='chrom', lstart='start', lstop='stop',
+                    rchrom='chrom', rstart='start', rstop='stop',
+                    include_stop=False, batchsize=10000):
+    """
+    Return rows from the left table which do not overlap any row in the right
+    table. See also :func:`overlapjoin`.
+
+    """
+
+    return OverlapJoinView(left, right, lchrom=lchrom, lstart=lstart,
+                           lstop=lstop, rchrom=rchrom, rstart=rstart,
+                           rstop=rstop, include_stop=include_stop,
+                           batchsize=batchsize, subtract=True)
+
+
+etl.overlapsubtract = overlapsubtract
+Table.overlapsubtract = overlapsubtract
+
+
+class OverlapJoinView(Table):
+
+    def __init__(self, left, right, lchrom='chrom', lstart='start',
+                 lstop='stop', rchrom='chrom', rstart='start', rstop='stop',
+                 include_stop=False, lprefix=None, rprefix=None,
+                 batchsize=10000, leftouter=False, missing=None,
+                 subtract=False):
+        self.left = left
+        self.right = right
+        self.lchrom = lchrom
+        self.lstart = lstart
+        self.lstop = lstop
+        self.rchrom = rchrom
+        self.rstart = rstart
+        self.rstop = rstop
+        self.include_stop = include_stop
+        self.lprefix = lprefix
+        self.rprefix = rprefix
+        self.batchsize = batchsize
+        self.leftouter = leftouter
+        self.missing = missing
+        self.subtract = subtract
+
+    def __iter__(self):
+        index = OverlapIndex(self.right, chrom=self.rchrom, start=self.rstart,
+                             stop=self.rstop, include_stop=self.include_stop)
+        return iteroverlapjoin(self.left, index, self.lchrom, self.lstart,
+                               self.lstop, self.lprefix, self.rprefix,
+                               self.batchsize, self.leftouter, self.missing,
+                               self.subtract)
+
+
+def iteroverlapjoin(left, index, lchrom, lstart, lstop, lprefix, rprefix,
+                    batchsize, leftouter, missing, subtract):
+
+    lit = iter(left)
+    lhdr = tuple(next(lit))
+    ichrom, istart, istop = _fieldindices(lhdr, lchrom, lstart, lstop)
+
+    # determine output header
+    if subtract:
+        yield lhdr
+    else:
+        if lprefix is None:
+            outhdr = list(lhdr)
+        else:
+            outhdr = [text_type(lprefix) + text_type(f) for f in lhdr]
+        if rprefix is None:
+            outhdr.extend(index.header)
+        else:
+            outhdr.extend(text_type(rprefix) + text_type(f)
+                          for f in index.header)
+        yield tuple(outhdr)
+
+    rows = index.rows
+    rmissing = (missing,) * len(index.header)
+
+    while True:
+        batch = [tuple(row) for row in islice(lit, batchsize)]
+        if not batch:
+            break
+
+        # find overlaps for each chromosome present in the batch
+        bychrom = defaultdict(list)
+        for i, row in enumerate(batch):
+            bychrom[row[ichrom]].append(i)
+        matches = [None] * len(batch)
+        for c, positions in bychrom.items():
+            queries, offsets = index.findall(
+                c,
+                [batch[i][istart] for i in positions],
+                [batch[i][istop] for i in positions]
+            )
+            queries = queries.tolist()
+            offsets = offsets.tolist()
+            for q, offset in zip(queries, offsets):
+                i = positions[q]
+                if matches[i] is None:
+                    matches[i] = [offset]
+                else:
+                    matches[i].append(offset)
+
+        # emit rows in the original order of the left table
+        for row, found in zip(batch, matches):
+            if subtract:
+                if found is None:
+                    yield row
+            elif found is None:
+                if leftouter:
+                    yield row + rmissing
+            else:
+                for offset in found:
+                    yield row + rows[offset]
+
+
+def overlapmergejoin(left, right, lchrom='chrom', lstart='start',
+                     lstop='stop', rchrom='chrom', rstart='start',
+                     rstop='stop', include_stop=False, chroms=None,
+                     lprefix=None, rprefix=None):
+    """
+    Join two tables by overlapping genome intervals, where both tables are
+    already sorted by chromosome and start position, e.g.::
+
+        >>> import petl as etl
+        >>> # activate bio extensions
+        ... import petlx.bio
+        >>> variants = (('CHROM', 'POS', 'ID'),
+        ...             ('apidb|MAL1', 643292, 'v3'),
+        ...             ('apidb|MAL5', 1000, 'v2'),
+        ...             ('apidb|MAL5', 1289594, 'v1'))
+        >>> features = (
+        ...     etl
+        ...     .fromgff3('fixture/sample.sorted.gff.gz')
+        ...     .cut('seqid', 'start', 'end', 'type')
+        ... )
+        >>> table1 = etl.overlapmergejoin(variants, features,
+        ...                               lchrom='CHROM', lstart='POS',
+        ...                               lstop='POS', rchrom='seqid',
+        ...                               rstart='start', rstop='end',
+        ...                               include_stop=True, chroms=str)
+        >>> table1.lookall()
+        +--------------+---------+------+--------------+---------+---------+---------------+
+        | CHROM        | POS     | ID   | seqid        | start   | end     | type          |
+        +==============+=========+======+==============+=========+=========+===============+
+        | 'apidb|MAL1' |  643292 | 'v3' | 'apidb|MAL1' |       1 |  643292 | 'supercontig' |
+        +--------------+---------+------+--------------+---------+---------+---------------+
+        | 'apidb|MAL5' |    1000 | 'v2' | 'apidb|MAL5' |       1 | 1343552 | 'supercontig' |
+        +--------------+---------+------+--------------+---------+---------+---------------+
+        | 'apidb|MAL5' | 1289594 | 'v1' | 'apidb|MAL5' |       1 | 1343552 | 'supercontig' |
+        +--------------+---------+------+--------------+---------+---------+---------------+
+        | 'apidb|MAL5' | 1289594 | 'v1' | 'apidb|MAL5' | 1289594 | 1291685 | 'exon'        |
+        +--------------+---------+------+--------------+---------+---------+---------------+
+        | 'apidb|MAL5' | 1289594 | 'v1' | 'apidb|MAL5' | 1289594 | 1291685 | 'gene'        |
+        +--------------+---------+------+--------------+---------+---------+---------------+
+        | 'apidb|MAL5' | 1289594 | 'v1' | 'apidb|MAL5' | 1289594 | 1291685 | 'rRNA'        |
+        +--------------+---------+------+--------------+---------+---------+---------------+
+
+    Both tables are streamed in a single sweep, holding in memory only those
+    rows from the right table which overlap the current position, so neither
+    table needs to fit in memory. Chromosomes are expected in natural order,
+    e.g., 'chr2' before 'chr10', as output by :func:`petlx.push.genomicsort`.
+    The `chroms` argument may give a list of chromosomes which come first,
+    in that order, or a function returning a sort key for a chromosome name,
+    e.g., `str` for lexical order as output by `sort -k1,1`. A ValueError is
+    raised if either table is found not to be sorted, as far as it is read.
+
+    Note start coordinates are included and stop coordinates are excluded
+    from intervals. Use the `include_stop` keyword argument to include the
+    upper bound of intervals when finding overlaps. As for
+    :func:`overlapindex`, a zero-length interval overlaps any interval which
+    strictly contains its position.
+
+    """
+
+    return OverlapMergeJoinView(left, right, lchrom=lchrom, lstart=lstart,
+                                lstop=lstop, rchrom=rchrom, rstart=rstart,
+                                rstop=rstop, include_stop=include_stop,
+                                chroms=chroms, lprefix=lprefix,
+                                rprefix=rprefix)
+
+
+etl.overlapmergejoin = overlapmergejoin
+Table.overlapmergejoin = overlapmergejoin
+
+
+class OverlapMergeJoinView(Table):
+
+    def __init__(self, left, right, lchrom='chrom', lstart='start',
+                 lstop='stop', rchrom='chrom', rstart='start', rstop='stop',
+                 include_stop=False, chroms=None, lprefix=None, rprefix=None):
+        self.left = left
+        self.right = right
+        self.lchrom = lchrom
+        self.lstart = lstart
+        self.lstop = lstop
+        self.rchrom = rchrom
+        self.rstart = rstart
+        self.rstop = rstop
+        self.include_stop = include_stop
+        self.chroms = chroms
+        self.lprefix = lprefix
+        self.rprefix = rprefix
+
+    def __iter__(self):
+        return iteroverlapmergejoin(self.left, self.right, self.lchrom,
+                                    self.lstart, self.lstop, self.rchrom,
+                                    self.rstart, self.rstop,
+                                    self.include_stop, self.chroms,
+                                    self.lprefix, self.rprefix)
+
+
+def _prefixheader(hdr, prefix):
+    if prefix is None:
+        return tuple(hdr)
+    return tuple(text_type(prefix) + text_type(f) for f in hdr)
+
+
+def _itersorted(table, chrom, start, stop, chromkey, name):
+    # yield (chromkey, start, stop, row), checking the sort order as we go
+    it = iter(table)
+    hdr = tuple(next(it))
+    yield hdr
+    ichrom, istart, istop = _fieldindices(hdr, chrom, start, stop)
+    prev = prevrow = None
+    for row in it:
+        row = tuple(row)
+        key = (chromkey(row[ichrom]), row[istart])
+        if prev is not None and key < prev:
+            raise ValueError('%s table is not sorted by chromosome and start '
+                             'position, found %r after %r'
+                             % (name, (row[ichrom], row[istart]),
+                                (prevrow[ichrom], prevrow[istart])))
+        prev, prevrow = key, row
+        yield key[0], row[istart], row[istop], row
+
+
+def _chromkey(chroms):
+    # the same order as petlx.push.genomicsort(), i.e., chromosomes in
+    # `chroms` first, then others in natural order; keys are cached as there
+    # are few chromosomes
+    from petlx.push import _naturalkey
+    if callable(chroms):
+        return chroms
+    ranks = dict((c, i) for i, c in enumerate(chroms or ()))
+    keys = dict()
+
+    def key(c):
+        try:
+            return keys[c]
+        except KeyError:
+            if c in ranks:
+                k = keys[c] = (0, ranks[c])
+            else:
+                k = keys[c] = (1, tuple(_naturalkey(c)))
+            return k
+    return key
+
+
+def iteroverlapmergejoin(left, right, lchrom, lstart, lstop, rchrom, rstart,
+                         rstop, include_stop, chroms, lprefix, rprefix):
+    chromkey = _chromkey(chroms)
+    lit = _itersorted(left, lchrom, lstart, lstop, chromkey, 'left')
+    rit = _itersorted(right, rchrom, rstart, rstop, chromkey, 'right')
+    lhdr = next(lit)
+    rhdr = next(rit)
+    yield _prefixheader(lhdr, lprefix) + _prefixheader(rhdr, rprefix)
+
+    # right rows which may overlap the current position, as a heap of
+    # (stop, seq, start, row) so rows can be dropped once passed
+    active = list()
+    seq = 0
+    current = None
+    rnext = next(rit, None)
+
+    for lc, ls, le, lrow in lit:
+
+        if lc != current:
+            # new chromosome, nothing carries over
+            del active[:]
+            current = lc
+
+        # bring in right rows starting before the end of the left interval
+        while rnext is not None:
+            rc, rs, re, rrow = rnext
+            if rc < lc:
+                pass
+            elif rc > lc:
+                break
+            elif rs < le or (include_stop and rs == le):
+                heappush(active, (re, seq, rs, rrow))
+                seq += 1
+            else:
+                break
+            rnext = next(rit, None)
+
+        # drop right rows ending before the start of the left interval, no
+        # later left row can overlap them
+        while active and (active[0][0] < ls or
+                          (not include_stop and active[0][0] == ls)):
+            heappop(active)
+
+        # N.B., active rows may start beyond the end of a short left interval
+        if include_stop:
+            found = [a for a in active if a[2] <= le]
+        else:
+            found = [a for a in active if a[2] < le]
+        found.sort(key=itemgetter(1))
+        for _, _, _, rrow in found:
+            yield lrow + rrow
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, division
+
+
+import os
+
+
+from petl.compat import pickle
+
+
+# version of the sidecar index file format
+PIDX_VERSION = 1
+
+
+def lineindex(filename, step=10000, comment='#', cutoff=(), fields=None,
+              build=True):
+    """
+    Return a :class:`LineIndex` of the records in the uncompressed text file
+    `filename`, loaded from the sidecar file `filename` + '.pidx' if that
+    exists and is up to date, otherwise built via a single pass through the
+    file and saved to the sidecar file where possible.
+
+    Records are lines which are not blank and do not begin with the
+    `comment` prefix. If `fields` is given, only lines with that many
+    tab-separated values are records. Reading stops at the first line
+    beginning with any of the `cutoff` prefixes.
+
+    If `build` is False and there is no up to date sidecar file, None is
+    returned.
+
+    """
+
+    params = _params(comment, cutoff, fields)
+    index = LineIndex.load(filename, params)
+    if index is None and build:
+        index = LineIndex.build(filename, step, params)
+        try:
+            index.save()
+        except (IOError, OSError):
+            # e.g., directory not writable, index is still usable
+            pass
+    return index
+
+
+def _params(comment, cutoff, fields):
+    if not isinstance(cutoff, (list, tuple)):
+        cutoff = (cutoff,)
+    return comment, tuple(cutoff), fields
+
+
+class LineIndex(object):
+    """
+    Byte offsets of every `step`-th record in a text file, along with the
+    number of records and the offset at which reading stops. The index is
+    checked against the size and modification time of the file.
+
+    """
+
+    def __init__(self, filename, step, size, mtime, params, nrecords, end,
+                 offsets):
+        self.filename = filename
+        self.step = step
+        self.size = size
+        self.mtime = mtime
+        self.params = params
+        self.nrecords = nrecords
+        self.end = end
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, filename, step, params):
+        comment, cutoff, fields = params
+        comment = comment.encode('utf-8') if comment else None
+        cutoff = tuple(c.encode('utf-8') for c in cutoff)
+        ntabs = fields - 1 if fields else None
+        st = os.stat(filename)
+        offsets = list()
+        n = offset = 0
+        end = None
+        with open(filename, 'rb') as f:
+            for line in f:
+                if cutoff and line.startswith(cutoff):
+                    end = offset
+                    break
+                if (line.strip() and
+                        not (comment and line.startswith(comment)) and
+                        (ntabs is None or line.count(b'\t') == ntabs)):
+                    if n % step == 0:
+                        offsets.append(offset)
+                    n += 1
+                offset += len(line)
+        if end is None:
+            end = offset
+        return cls(filename, step, st.st_size, st.st_mtime, params, n, end,
+                   offsets)
+
+    @classmethod
+    def load(cls, filename, params):
+        """
+        Load the index for `filename` from its sidecar file, or return None
+        if there is no sidecar file or it is out of date.
+
+        """
+
+        try:
+            with open(filename + '.pidx', 'rb') as f:
+                state = pickle.load(f)
+        except (IOError, OSError, EOFError, ValueError, pickle.PickleError):
+            return None
+        if state[0] != PIDX_VERSION:
+            return None
+        index = cls(filename, *state[1:])
+        if index.params != params or not index.current():
+            return None
+        return index
+
+    def save(self):
+        """Save the index to the sidecar file."""
+        with open(self.filename + '.pidx', 'wb') as f:
+            pickle.dump((PIDX_VERSION, self.step, self.size, self.mtime,
+                         self.params, self.nrecords, self.end, self.offsets),
+                        f, protocol=-1)
+
+    def current(self):
+        """Return True if the file has not changed since it was indexed."""
+        try:
+            st = os.stat(self.filename)
+        except OSError:
+            return False
+        return st.st_size == self.size and st.st_mtime == self.mtime
+
+    def __len__(self):
+        return self.nrecords
+
+    def seek(self, record):
+        """
+        Return the offset of the nearest indexed record at or before
+        `record`, and the number of records from there to `record`.
+
+        """
+
+        if record >= self.nrecords:
+            return self.end, 0
+        i = record // self.step
+        return self.offsets[i], record - i * self.step
+
+    def ranges(self, n):
+        """
+        Split the records into at most `n` byte ranges, as (start, stop)
+        offsets, with boundaries at indexed records.
+
+        """
+
+        points = len(self.offsets)
+        if not points:
+            return []
+        per = -(-points // n)
+        starts = [self.offsets[i] for i in range(0, points, per)]
+        return list(zip(starts, starts[1:] + [self.end]))
@@ -2,13 +2,27 @@
 from __future__ import absolute_import, print_function, division
 
 
+import os
+import gzip
+import struct
+import threading
+from collections import Counter, OrderedDict
+from itertools import islice
+
+
 import petl as etl
-from petl.compat import text_type
-from petl.util.base import Table
+from petl.compat import text_type, string_types
+from petl.util.base import Table, asindices
+
+
+from petlx.bio.bgzf import TabixWriter, _writetable, bgzflines
+from petlx.bio.cache import diskcache
+from petlx.bio.encoding import _encodefields, _encoderows
 
 
 def fromtabix(filename, reference=None, start=None, stop=None, region=None,
-              header=None):
+              header=None, types=None, parallel=None, shards='by_chrom',
+              binsize=10**6, ordered=True, threads=None, encode=None):
     """
     Extract rows from a tabix indexed file, e.g.::
 
@@ -42,45 +56,653 @@ def fromtabix(filename, reference=None, start=None, stop=None, region=None,
         | 'Pf3D7_02_v3' | '105800' | '447300' | 'Core' |
         +---------------+----------+----------+--------+
 
+    Several regions may be given as a list (or any other iterable) of
+    region strings and/or (reference, start, stop) tuples, or as a table
+    whose first three fields are reference, start and stop. Regions are
+    served from a single open file in genome order, overlapping regions are
+    merged and no row is returned more than once, e.g.::
+
+        >>> table3 = etl.fromtabix('fixture/test.bed.gz',
+        ...                        region=['Pf3D7_02_v3:110000-120000',
+        ...                                'Pf3D7_02_v3:115000-460000',
+        ...                                ('Pf3D7_01_v3', 0, 100)])
+        >>> table3
+        +---------------+----------+----------+----------------------+
+        | #chrom        | start    | end      | region               |
+        +===============+==========+==========+======================+
+        | 'Pf3D7_01_v3' | '0'      | '27336'  | 'SubtelomericRepeat' |
+        +---------------+----------+----------+----------------------+
+        | 'Pf3D7_02_v3' | '105800' | '447300' | 'Core'               |
+        +---------------+----------+----------+----------------------+
+        | 'Pf3D7_02_v3' | '447300' | '450450' | 'Centromere'         |
+        +---------------+----------+----------+----------------------+
+        | 'Pf3D7_02_v3' | '450450' | '862500' | 'Core'               |
+        +---------------+----------+----------+----------------------+
+
+    Note that region strings use 1-based inclusive coordinates, whereas
+    (reference, start, stop) tuples use 0-based half-open coordinates, as
+    for the `start` and `stop` arguments. Regions on references not present
+    in the index are ignored.
+
+    Open files are kept in a process-wide cache of up to
+    `petlx.bio.tabix.cache_size` handles, so repeated iteration does not
+    reopen the file and re-read the index. Use :func:`closetabix` (or the
+    `close()` method of the returned table) to close cached handles.
+
+    Values are returned as strings unless a dictionary mapping fields
+    (names or indices) to conversion functions is given as the `types`
+    argument. If `types` is 'auto', integer and float fields are inferred
+    from the first rows of the file, and values which cannot be converted
+    are left as strings. Conversions are applied as each line is split, e.g.::
+
+        >>> table4 = etl.fromtabix('fixture/test.bed.gz',
+        ...                        region='Pf3D7_02_v3:110000-120000',
+        ...                        types={'start': int, 'end': int})
+        >>> table4
+        +---------------+--------+--------+--------+
+        | #chrom        | start  | end    | region |
+        +===============+========+========+========+
+        | 'Pf3D7_02_v3' | 105800 | 447300 | 'Core' |
+        +---------------+--------+--------+--------+
+
+    Large scans can be split into shards which are fetched and parsed by a
+    pool of `parallel` worker processes, each with its own file handle. If
+    `shards` is 'by_chrom' each reference sequence (or each region, if
+    regions are given) is a shard, if `shards` is 'by_bin' these are further
+    split into bins of `binsize` bases. Rows are returned in genome order,
+    holding at most two shards per worker in memory, unless `ordered` is
+    False in which case shards are returned in order of completion. Any
+    `types` must be picklable to be used with `parallel`, e.g.::
+
+        >>> table5 = etl.fromtabix('fixture/test.bed.gz', parallel=2,
+        ...                        shards='by_bin', binsize=100000)
+        >>> table5.nrows()
+        110
+
+    When reading the whole file without `parallel`, blocks may instead be
+    decompressed by a pool of `threads` threads, see
+    :func:`petlx.bio.bgzf.bgzflines`. Header lines beginning with '#' are
+    skipped.
+
+    If `encode` is True, values of the first field, the reference sequence,
+    are dictionary encoded: the table keeps the distinct values, rows share
+    a single copy of each value, and the integer codes of the values are
+    available via :func:`petlx.bio.encoding.dictcodes`. Other fields may be
+    encoded by passing a tuple of field names or indices, e.g.::
+
+        >>> table6 = etl.fromtabix('fixture/test.bed.gz',
+        ...                        encode=('#chrom', 'region'))
+        >>> codes, values = table6.dictcodes('region')
+        >>> values
+        ['SubtelomericRepeat', 'SubtelomericHypervariable', 'Core', 'Centromere', 'InternalHypervariable']
+
     """
     
-    return TabixView(filename, reference, start, stop, region, header)
+    return TabixView(filename, reference, start, stop, region, header,
+                     types=types, parallel=parallel, shards=shards,
+                     binsize=binsize, ordered=ordered, threads=threads,
+                     encode=encode)
 
 
 etl.fromtabix = fromtabix
 
 
+def tobed(table, filename, index=True):
+    """
+    Write a table of genome intervals to a BED file, e.g.::
+
+        >>> import petl as etl
+        >>> # activate bio extensions
+        ... import petlx.bio
+        >>> import os, shutil, tempfile
+        >>> tmpdir = tempfile.mkdtemp()
+        >>> filename = os.path.join(tmpdir, 'example.bed.gz')
+        >>> table1 = etl.fromtabix('fixture/test.bed.gz', region='Pf3D7_02_v3')
+        >>> table1.tobed(filename)
+        >>> etl.fromtabix(filename, region='Pf3D7_02_v3:110000-120000')
+        +---------------+----------+----------+--------+
+        | #chrom        | start    | end      | region |
+        +===============+==========+==========+========+
+        | 'Pf3D7_02_v3' | '105800' | '447300' | 'Core' |
+        +---------------+----------+----------+--------+
+        <BLANKLINE>
+        >>> shutil.rmtree(tmpdir)
+
+    The first three fields are taken as the chromosome and the 0-based
+    half-open start and end positions. The header is written as the first
+    line if the name of the first field starts with '#', and None values
+    are written as '.'.
+
+    If `filename` ends with '.gz' the file is compressed with bgzip's block
+    format, and unless `index` is False, a tabix index is built as the rows
+    are written, in which case the table must be sorted by chromosome and
+    start position.
+
+    """
+
+    _writetable(table, _BEDWriter, filename, index=index)
+
+
+etl.tobed = tobed
+Table.tobed = tobed
+
+
+class _BEDWriter(TabixWriter):
+
+    def __init__(self, filename, fields, index=True):
+        super(_BEDWriter, self).__init__(filename, 'bed', index=index)
+        if fields and text_type(fields[0]).startswith('#'):
+            self.writeheader('\t'.join(text_type(f) for f in fields))
+
+    def writerow(self, row):
+        line = '\t'.join('.' if v is None else text_type(v) for v in row)
+        self.writerecord(row[0], int(row[1]), int(row[2]), line)
+
+
+# maximum number of idle tabix handles to keep open
+cache_size = 8
+
+
+# idle tabix handles, least recently used first
+_handles = OrderedDict()
+_handles_pid = None
+
+
+def _acquire(filename):
+    global _handles_pid
+    if _handles_pid != os.getpid():
+        # N.B., handles inherited from a parent process share file offsets
+        # with the parent so must not be used
+        _handles.clear()
+        _handles_pid = os.getpid()
+    try:
+        return _handles.pop(filename)
+    except KeyError:
+        from pysam import TabixFile
+        return TabixFile(filename, mode='r')
+
+
+def _release(filename, f):
+    if filename in _handles or _handles_pid != os.getpid():
+        # another handle for the same file is already idle
+        f.close()
+        return
+    _handles[filename] = f
+    while len(_handles) > cache_size:
+        _, h = _handles.popitem(last=False)
+        h.close()
+
+
+def closetabix(filename=None):
+    """
+    Close cached tabix file handles, either for the given file or for all
+    files if no filename is given.
+
+    """
+
+    if filename is None:
+        filenames = list(_handles)
+    else:
+        filenames = [filename]
+    for fn in filenames:
+        f = _handles.pop(fn, None)
+        if f is not None:
+            f.close()
+
+
+# tabix index formats
+TABIX_GENERIC = 0
+TABIX_SAM = 1
+TABIX_VCF = 2
+TABIX_ZERO_BASED = 0x10000
+
+
+def _read_index_config(filename):
+    # read the configuration from the header of a .tbi or .csi index, as
+    # (format, col_seq, col_beg, col_end, meta, skip) with 0-based columns
+    for ext in '.tbi', '.csi':
+        if os.path.exists(filename + ext):
+            with gzip.open(filename + ext, 'rb') as f:
+                magic = f.read(4)
+                if magic == b'TBI\x01':
+                    f.read(4)  # n_ref
+                elif magic == b'CSI\x01':
+                    f.read(12)  # min_shift, depth, l_aux
+                else:
+                    continue
+                fmt, col_seq, col_beg, col_end, meta, skip = \
+                    struct.unpack('<6i', f.read(24))
+                return (fmt, col_seq - 1, col_beg - 1, col_end - 1,
+                        chr(meta), skip)
+    return None
+
+
+def _row_extent(config):
+    # return a function which gives the 0-based half-open extent of a row
+    fmt, _, col_beg, col_end = config[:4]
+    offset = 0 if fmt & TABIX_ZERO_BASED else 1
+    fmt &= 0xffff
+
+    if fmt == TABIX_VCF:
+        def extent(vals):
+            beg = int(vals[col_beg]) - 1
+            return beg, beg + len(vals[3])
+    elif col_end >= 0 and fmt == TABIX_GENERIC:
+        def extent(vals):
+            return int(vals[col_beg]) - offset, int(vals[col_end])
+    else:
+        def extent(vals):
+            beg = int(vals[col_beg]) - offset
+            return beg, beg + 1
+    return extent
+
+
+def _parse_region(region):
+    # parse a region string into 0-based half-open coordinates
+    reference, sep, coords = region.rpartition(':')
+    if not sep:
+        return region, None, None
+    start, _, stop = coords.replace(',', '').partition('-')
+    try:
+        start = int(start) - 1 if start else None
+        stop = int(stop) if stop else None
+    except ValueError:
+        # colon is part of the reference name
+        return region, None, None
+    return reference, start, stop
+
+
+def _normalise_regions(regions, contigs):
+    if isinstance(regions, Table):
+        regions = etl.data(regions)
+    parsed = list()
+    for region in regions:
+        if isinstance(region, string_types):
+            reference, start, stop = _parse_region(region)
+        else:
+            reference, start, stop = tuple(region)[:3]
+        if reference in contigs:
+            parsed.append((contigs[reference], start or 0, stop))
+
+    # sort into genome order and merge overlapping regions
+    parsed.sort(key=lambda r: (r[0], r[1]))
+    merged = list()
+    for rid, start, stop in parsed:
+        if merged and merged[-1][0] == rid:
+            _, pstart, pstop = merged[-1]
+            if pstop is None or start <= pstop:
+                if pstop is not None and (stop is None or stop > pstop):
+                    merged[-1] = (rid, pstart, stop)
+                continue
+        merged.append((rid, start, stop))
+    return merged
+
+
+
 class TabixView(Table):
     def __init__(self, filename, reference=None, start=None, stop=None,
-                 region=None, header=None):
+                 region=None, header=None, types=None, parallel=None,
+                 shards='by_chrom', binsize=10**6, ordered=True,
+                 threads=None, encode=None):
+        assert shards in ('by_chrom', 'by_bin'), \
+            "shards must be 'by_chrom' or 'by_bin'"
         self.filename = filename
         self.reference = reference
         self.start = start
         self.stop = stop
         self.region = region
         self.header = header
-        
+        self.types = types
+        self.parallel = parallel
+        self.shards = shards
+        self.binsize = binsize
+        self.ordered = ordered
+        self.threads = threads
+        self.encode = encode
+        self._fileheader = None
+        self._regions = None
+        self._parser = None
+        self._dictionaries = dict()
+        self._pool = None
+
+    def _header(self, f):
+        if self.header is not None:
+            return tuple(self.header)
+        if self._fileheader is None:
+            # assume last header line has fields
+            h = list(f.header)
+            if len(h) > 0:
+                header_line = h[-1]
+                if not isinstance(header_line, text_type):
+                    header_line = text_type(header_line, encoding='ascii')
+                self._fileheader = tuple(header_line.split('\t'))
+            else:
+                self._fileheader = ()
+        return self._fileheader
+
+    def _rowparser(self, f):
+        if self._parser is None:
+            converters = list()
+            if self.types == 'auto':
+                for i, conv in enumerate(_infer_types(f)):
+                    if conv is not None:
+                        converters.append((i, _TryConvert(conv)))
+            elif self.types:
+                hdr = self._header(f)
+                for field, conv in self.types.items():
+                    if isinstance(field, int):
+                        converters.append((field, conv))
+                    else:
+                        converters.append((asindices(hdr, field)[0], conv))
+            self._parser = _RowParser(converters)
+        return self._parser
+
     def __iter__(self):
-        from pysam import Tabixfile, asTuple
-        f = Tabixfile(self.filename, mode='r')
+        f = _acquire(self.filename)
+        rows = it = self._iterrows(f)
         try:
             # header row
-            if self.header is not None:
-                yield self.header
-            else:
-                # assume last header line has fields
-                h = list(f.header)
-                if len(h) > 0:
-                    header_line = text_type(h[-1], encoding='ascii')
-                    yield tuple(header_line.split('\t'))
+            hdr = self._header(f)
+            if self.encode:
+                # the reference is encoded by default
+                fields = _encodefields(self.encode, (0,))
+                rows = _encoderows(hdr, rows, fields, self._dictionaries)
+            if hdr:
+                yield hdr
 
             # data rows
-            for row in f.fetch(reference=self.reference, start=self.start,
-                               end=self.stop, region=self.region,
-                               parser=asTuple()):
-                yield tuple(row)
+            for row in rows:
+                yield row
 
-        except:
-            raise
         finally:
-            f.close()
+            it.close()
+            _release(self.filename, f)
+
+    def _iterrows(self, f):
+        parse = self._rowparser(f)
+        if self.parallel:
+            for row in self._iterparallel(f, parse):
+                yield row
+        elif self.region is None and self.reference is None and \
+                self.threads:
+            # whole file, decompressed by a pool of threads, skipping
+            # header lines as tabix does
+            config = _read_index_config(self.filename)
+            meta, skip = config[4:] if config is not None else ('#', 0)
+            lines = bgzflines(self.filename, threads=self.threads)
+            try:
+                for i, line in enumerate(lines):
+                    if i >= skip and line and line[0] != meta:
+                        yield parse(line)
+            finally:
+                lines.close()
+        elif self.region is None and self.reference is None:
+            # whole file, one reference at a time
+            for reference in f.contigs:
+                for line in f.fetch(reference):
+                    yield parse(line)
+        elif self.region is None or isinstance(self.region, string_types):
+            for line in f.fetch(reference=self.reference,
+                                start=self.start, end=self.stop,
+                                region=self.region):
+                yield parse(line)
+        else:
+            for row in self._itermultiregion(f, parse):
+                yield row
+
+    def _itermultiregion(self, f, parse):
+        contigs = f.contigs
+        if self._regions is None:
+            self._regions = _normalise_regions(
+                self.region, dict((c, i) for i, c in enumerate(contigs))
+            )
+        config = _read_index_config(self.filename)
+        extent = _row_extent(config) if config is not None else None
+        prev = None
+        for rid, start, stop in self._regions:
+            reference = contigs[rid]
+            if prev is not None and prev[0] != rid:
+                prev = None
+            skip = None
+            if prev is not None and extent is None:
+                # no index configuration available, match the lines
+                # returned for both regions instead
+                skip = _overlapping_lines(f, reference, prev[1:],
+                                          (start, stop))
+            for line in f.fetch(reference, start, stop):
+                if skip is not None and skip[line]:
+                    # returned with the previous region
+                    skip[line] -= 1
+                    continue
+                row = parse(line)
+                if skip is None and prev is not None:
+                    # skip rows already returned for the previous region
+                    rstart, rstop = extent(row)
+                    if rstart < prev[2] and rstop > prev[1]:
+                        continue
+                yield row
+            prev = (rid, start, stop)
+
+    def _iterparallel(self, f, parse):
+        contigs = f.contigs
+        contig_ids = dict((c, i) for i, c in enumerate(contigs))
+        if self.region is not None:
+            if isinstance(self.region, string_types):
+                regions = [self.region]
+            else:
+                regions = self.region
+            regions = _normalise_regions(regions, contig_ids)
+        elif self.reference is not None:
+            regions = _normalise_regions(
+                [(self.reference, self.start, self.stop)], contig_ids
+            )
+        else:
+            regions = [(rid, 0, None) for rid in range(len(contigs))]
+        config = _read_index_config(self.filename)
+        if self.shards == 'by_bin' and config is None:
+            raise ValueError('cannot shard by bin without a .tbi or .csi '
+                             'index')
+        # references found to have no rows beyond a bin, see _fetchshard()
+        ended = set()
+        shards = self._itershards(contigs, regions, config, parse, ended)
+        for reference, rows, more in _iterpool(_viewpool(self), shards,
+                                               self.parallel, self.ordered,
+                                               _fetchshard):
+            if not more:
+                ended.add(reference)
+            for row in rows:
+                yield row
+
+    def _itershards(self, contigs, regions, config, parse, ended):
+        # N.B., consumed from a thread of the pool, so takes no tabix handle
+        prev = None
+        for rid, start, stop in regions:
+            reference = contigs[rid]
+            if prev is not None and prev[0] == rid:
+                skip = prev[1:]
+            else:
+                skip = None
+            prev = (rid, start, stop)
+            if self.shards == 'by_chrom':
+                yield (self.filename, reference, start, stop, None, skip,
+                       config, parse, False)
+                continue
+            # N.B., rows overlapping several bins are returned from the bin
+            # containing their start
+            binstart = start
+            first = True
+            ended.discard(reference)
+            while stop is None or binstart < stop:
+                binstop = (binstart // self.binsize + 1) * self.binsize
+                if stop is not None:
+                    binstop = min(binstop, stop)
+                elif reference in ended:
+                    # a worker found no more rows on this reference
+                    break
+                # without a stop, the worker checks for rows beyond the bin
+                yield (self.filename, reference, binstart, binstop,
+                       None if first else binstart, skip if first else None,
+                       config, parse, stop is None)
+                first = False
+                binstart = binstop
+
+    def close(self):
+        closetabix(self.filename)
+        _closepool(self)
+
+
+TabixView.diskcache = diskcache
+
+
+def _overlapping_lines(f, reference, first, second):
+    # count the lines fetched for both of two regions of a reference; N.B.,
+    # counts rather than a set, as a line may occur more than once in a file
+    stops = [stop for stop in (first[1], second[1]) if stop is not None]
+    lo = max(first[0], second[0])
+    hi = min(stops) if stops else None
+    if hi is None or lo < hi:
+        return Counter(f.fetch(reference, lo, hi))
+    # the regions do not overlap, so these lines span the gap between them
+    return (Counter(f.fetch(reference, max(hi - 1, 0), hi)) &
+            Counter(f.fetch(reference, lo, lo + 1)))
+
+
+def _fetchshard(shard):
+    # return the rows of a shard, along with whether there may be rows on
+    # the reference beyond the shard, if `probe` is True
+    (filename, reference, start, stop, minstart, skip, config, parse,
+     probe) = shard
+    extent = _row_extent(config) if config is not None else None
+    f = _acquire(filename)
+    try:
+        lines = None
+        if skip is not None and extent is None:
+            # no index configuration available, match the lines returned
+            # for both regions instead
+            lines = _overlapping_lines(f, reference, skip, (start, stop))
+        rows = list()
+        for line in f.fetch(reference, start, stop):
+            if lines is not None and lines[line]:
+                # returned with the previous region
+                lines[line] -= 1
+                continue
+            row = parse(line)
+            if lines is None and (minstart is not None or skip is not None):
+                rstart, rstop = extent(row)
+                if minstart is not None and rstart < minstart:
+                    # returned with an earlier bin
+                    continue
+                if skip is not None and rstart < skip[1] and rstop > skip[0]:
+                    # returned with the previous region
+                    continue
+            rows.append(row)
+        more = True
+        if probe:
+            more = next(iter(f.fetch(reference, stop)), None) is not None
+        return reference, rows, more
+    finally:
+        _release(filename, f)
+
+
+def _viewpool(view):
+    # pool of `parallel` worker processes of a table, kept between iterations
+    if view._pool is None:
+        from multiprocessing import Pool
+        view._pool = Pool(view.parallel)
+    return view._pool
+
+
+def _closepool(view):
+    if view._pool is not None:
+        view._pool.terminate()
+        view._pool = None
+
+
+def _iterpool(pool, shards, parallel, ordered, fetch):
+    # results of `fetch` for each shard, in order if `ordered`, otherwise as
+    # soon as they are ready; N.B., the pool takes shards from a thread of
+    # its own as fast as they are produced, so keep a bounded number in
+    # flight
+    slots = threading.Semaphore(2 * parallel)
+    closed = list()
+
+    def feed():
+        it = iter(shards)
+        while True:
+            slots.acquire()
+            if closed:
+                return
+            try:
+                shard = next(it)
+            except StopIteration:
+                return
+            yield shard
+
+    imap = pool.imap if ordered else pool.imap_unordered
+    try:
+        for result in imap(fetch, feed()):
+            slots.release()
+            yield result
+    finally:
+        # let the feeding thread finish if the rows are not all read
+        closed.append(True)
+        slots.release()
+
+
+class _RowParser(object):
+    # split a line and apply conversions, picklable for use in workers
+
+    def __init__(self, converters):
+        self.converters = sorted(converters, key=lambda c: c[0])
+
+    def __call__(self, line):
+        vals = line.split('\t')
+        if self.converters:
+            n = len(vals)
+            for i, conv in self.converters:
+                if i < n:
+                    vals[i] = conv(vals[i])
+        return tuple(vals)
+
+
+class _TryConvert(object):
+
+    def __init__(self, conv):
+        self.conv = conv
+
+    def __call__(self, v):
+        try:
+            return self.conv(v)
+        except ValueError:
+            return v
+
+
+def _infer_types(f, n=100):
+    # infer int or float columns from the first few lines of the file
+    lines = list()
+    for reference in f.contigs:
+        lines.extend(islice(f.fetch(reference), n - len(lines)))
+        if len(lines) >= n:
+            break
+    rows = [line.split('\t') for line in lines]
+    ncols = max(len(row) for row in rows) if rows else 0
+    types = list()
+    for i in range(ncols):
+        values = [row[i] for row in rows if i < len(row)]
+        types.append(_infer_type(values))
+    return types
+
+
+def _infer_type(values):
+    # ignore missing values
+    values = [v for v in values if v not in ('', '.')]
+    if not values:
+        return None
+    for conv in int, float:
+        try:
+            for v in values:
+                conv(v)
+        except ValueError:
+            continue
+        return conv
+    return None
@@ -2,11 +2,31 @@
 from __future__ import absolute_import, print_function, division
 
 
+import copy
+import gzip
+import operator
+import os
+import re
+import struct
+from collections import namedtuple, OrderedDict
+from contextlib import closing
+
+
 import petl as etl
-from petl.util.base import Table
+from petl.compat import string_types
+from petl.compat import text_type
+from petl.util.base import Table, asindices
+
+
+from petlx.bio.tabix import _acquire, _release, _normalise_regions
+from petlx.bio.bgzf import TabixWriter, _writetable, isbgzf, bgzflines
+from petlx.bio.cache import diskcache, reducers
+from petlx.bio.encoding import _encodefields, _encoderows
 
 
-def fromvcf(filename, chrom=None, start=None, stop=None, samples=True):
+def fromvcf(filename, chrom=None, start=None, stop=None, samples=True,
+            region=None, engine='pyvcf', info=None, threads=None,
+            encode=None):
     """
     Returns a table providing access to data from a variant call file (VCF).
     E.g.::
@@ -31,10 +51,82 @@ def fromvcf(filename, chrom=None, start=None, stop=None, samples=True):
         +-------+---------+-------------+-----+--------+------+---------+----------------------+----------------------+----------------------+----------------------+
         ...
 
+    If the file is compressed with bgzip and indexed with tabix, variants
+    can be fetched for a single chromosome, or a range given as 0-based
+    half-open `start` and `stop` coordinates. Alternatively, a region string
+    such as '20:1000000-1240000' (1-based, inclusive) or a list of regions
+    can be given via the `region` argument. Overlapping regions are merged
+    and each variant is returned at most once, e.g.::
+
+        >>> table2 = etl.fromvcf('fixture/sample.vcf.gz', samples=None,
+        ...                      region=['19:112-112', '20:1000000-1231000'])
+        >>> table2.cut('CHROM', 'POS', 'REF', 'ALT')
+        +-------+---------+-----+--------+
+        | CHROM | POS     | REF | ALT    |
+        +=======+=========+=====+========+
+        | '19'  |     112 | 'A' | [G]    |
+        +-------+---------+-----+--------+
+        | '20'  | 1110696 | 'A' | [G, T] |
+        +-------+---------+-----+--------+
+        | '20'  | 1230237 | 'T' | [None] |
+        +-------+---------+-----+--------+
+
+    The header is read once when the table is first iterated and reused
+    on subsequent iterations. If `samples` is a list of sample names, only
+    the columns for those samples are parsed, and if `samples` is false
+    the FORMAT and sample columns are skipped altogether. Similarly, if
+    `info` is a list of INFO keys, only those entries are parsed, e.g.::
+
+        >>> table4 = etl.fromvcf('fixture/sample.vcf', samples=None,
+        ...                      info=['DP', 'AF'])
+        >>> table4.values('INFO').list()[2:4]
+        [{'DP': 14, 'AF': [0.5]}, {'DP': 11, 'AF': [0.017]}]
+
+    Rows are :class:`VCFVariantRow` tuples, which also provide the fixed
+    fields as attributes, e.g., ``row.POS``, and the calls as ``row.calls``.
+
+    By default records are parsed with PyVCF. If `engine` is 'pysam', records
+    are read with :class:`pysam.VariantFile` instead, which is much faster
+    on files with many samples. The table has the same fields, but values
+    are lighter weight: ALT is a list of strings, multi-valued INFO and FORMAT
+    values are tuples, and calls are :class:`Call` objects, e.g.::
+
+        >>> table3 = etl.fromvcf('fixture/sample.vcf.gz', engine='pysam',
+        ...                      samples=['NA00001'], region='20:14370-17330')
+        >>> for row in table3.cut('POS', 'FILTER', 'NA00001'):
+        ...     print(row)
+        ...
+        ('POS', 'FILTER', 'NA00001')
+        (14370, [], Call(sample=NA00001, CallData(GT='0|0', GQ=48, DP=1, HQ=(51, 51))))
+        (17330, ['q10'], Call(sample=NA00001, CallData(GT='0|0', GQ=49, DP=3, HQ=(58, 50))))
+
+    If `threads` is given, blocks of a bgzipped file are decompressed by that
+    many threads when reading the whole file, see
+    :func:`petlx.bio.bgzf.bgzflines`. With the 'pysam' engine the threads
+    are managed by htslib, and are also used for region queries.
+
+    If `encode` is True, the CHROM, REF and FILTER fields are dictionary
+    encoded: the table keeps the distinct values of each field, rows share
+    a single copy of each value, and the integer codes of the values are
+    available via :func:`petlx.bio.encoding.dictcodes`. Encoded FILTER
+    values are tuples rather than lists. Other fields may be encoded by
+    passing a tuple of field names, e.g.::
+
+        >>> table5 = etl.fromvcf('fixture/sample.vcf', samples=None,
+        ...                      encode=True)
+        >>> codes, values = table5.dictcodes('FILTER')
+        >>> values
+        [None, (), ('q10',)]
+        >>> list(codes)
+        [0, 0, 1, 2, 1, 1, 1, 0, 1]
+
     """
 
+    if engine not in ('pyvcf', 'pysam'):
+        raise ValueError('unknown engine: %r' % engine)
     return VCFView(filename, chrom=chrom, start=start, stop=stop,
-                   samples=samples)
+                   samples=samples, region=region, engine=engine, info=info,
+                   threads=threads, encode=encode)
 
 
 etl.fromvcf = fromvcf
@@ -43,19 +135,63 @@ etl.fromvcf = fromvcf
 VCF_HEADER = ('CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO')
 
 
+# fields which are dictionary encoded if `encode` is True
+_VCF_ENCODED = ('CHROM', 'REF', 'FILTER')
+
+
 class VCFView(Table):
     def __init__(self, filename, chrom=None, start=None, stop=None,
-                 samples=True):
+                 samples=True, region=None, engine='pyvcf', info=None,
+                 threads=None, encode=None):
         self.filename = filename
         self.chrom = chrom
         self.start = start
         self.stop = stop
         self.samples = samples
-        
+        self.region = region
+        self.engine = engine
+        self.info = info
+        self.threads = threads
+        self.encode = encode
+        self._reader = None
+        self._regions = None
+        self._dictionaries = dict()
+
+    def _getreader(self):
+        # parse the meta-information and header lines once only, then give
+        # each iteration its own copy of the reader to feed lines into
+        if self._reader is None:
+            import vcf as pyvcf
+            compressed = self.filename.endswith('.gz')
+            with open(self.filename, 'rb' if compressed else 'rt') as fh:
+                reader = pyvcf.Reader(fsock=fh, filename=self.filename,
+                                      compressed=compressed)
+            reader.reader = None
+            reader._reader = None
+            self._reader = reader
+            reducers[pyvcf.model._Call] = _reduce_pyvcf_call
+        return copy.copy(self._reader)
+
     def __iter__(self):
-        import vcf as pyvcf
-        reader = pyvcf.Reader(filename=self.filename)
-        
+        if self.engine == 'pysam':
+            it = self._iterpysam()
+        else:
+            it = self._iterpyvcf()
+        try:
+            hdr = next(it)
+            rows = it
+            if self.encode:
+                fields = _encodefields(self.encode, _VCF_ENCODED)
+                rows = _encoderows(hdr, rows, fields, self._dictionaries)
+            yield hdr
+            for row in rows:
+                yield row
+        finally:
+            it.close()
+
+    def _iterpyvcf(self):
+        reader = self._getreader()
+
         # determine header
         if isinstance(self.samples, (list, tuple)):
             # specific samples requested
@@ -66,24 +202,547 @@ class VCFView(Table):
         else:
             # no samples
             yield VCF_HEADER
-            
+
         # fetch region?
-        if None not in [self.chrom, self.start]:
-            it = reader.fetch(self.chrom, self.start, self.end)
+        if self.region is None and self.chrom is None:
+            lines = _iterlines(self.filename, reader.encoding, self.threads)
+            try:
+                for row in self._itervariants(reader, lines):
+                    yield row
+            finally:
+                lines.close()
         else:
-            it = reader
-            
-        # yield data
-        for variant in it:
-            out = tuple(getattr(variant, f) for f in VCF_HEADER)
+            f = _acquire(self.filename)
+            try:
+                if self.region is None:
+                    lines = f.fetch(self.chrom, self.start, self.stop)
+                elif isinstance(self.region, string_types):
+                    lines = f.fetch(region=self.region)
+                else:
+                    lines = self._itermultiregion(f)
+                for row in self._itervariants(reader, lines):
+                    yield row
+            finally:
+                _release(self.filename, f)
+
+    def _itervariants(self, reader, lines):
+        if isinstance(self.samples, (list, tuple)):
+            # specific samples requested, only pass those columns on to
+            # the reader
+            indices = [reader._sample_indexes[s] + 9 for s in self.samples]
+            reader.samples = list(self.samples)
+            reader._sample_indexes = dict((s, i) for i, s
+                                          in enumerate(self.samples))
+            lines = _selectcolumns(lines, indices)
+        elif not self.samples:
+            # no samples, don't parse FORMAT or sample columns at all
+            lines = _dropcolumns(lines)
+        if self.info is not None:
+            reader._parse_info = _selectinfo(reader._parse_info, self.info)
+        reader.reader = lines
+        intern = _interned_chroms.setdefault
+        for variant in reader:
+            chrom = variant.CHROM
+            out = (intern(chrom, chrom), variant.POS, variant.ID, variant.REF,
+                   variant.ALT, variant.QUAL, variant.FILTER, variant.INFO)
+            if self.samples:
+                out += tuple(variant.samples)
+            yield VCFVariantRow(out)
+
+    def _infokeys(self):
+        if self.info is not None:
+            return tuple(self.info)
+        if self.engine == 'pysam':
+            import pysam
+            vf = pysam.VariantFile(self.filename)
+            try:
+                return tuple(sorted(vf.header.info))
+            finally:
+                vf.close()
+        return tuple(sorted(self._getreader().infos))
+
+    def _itermultiregion(self, f):
+        contigs = f.contigs
+        if self._regions is None:
+            self._regions = _normalise_regions(
+                self.region, dict((c, i) for i, c in enumerate(contigs))
+            )
+        return _iterregions(self._regions, contigs, f.fetch, _line_extent)
+
+    def _iterpysam(self):
+        import pysam
+        vf = pysam.VariantFile(self.filename, threads=self.threads or 1)
+        try:
+
+            # determine header
             if isinstance(self.samples, (list, tuple)):
-                # specific samples requested
-                out += tuple(variant.genotype(s) for s in self.samples)
+                samples = tuple(self.samples)
             elif self.samples:
-                # all samples
-                out += tuple(variant.samples)
-            yield out
-            
+                samples = tuple(vf.header.samples)
+            else:
+                samples = ()
+            yield VCF_HEADER + samples
+
+            # yield data
+            if not self.samples or isinstance(self.samples, (list, tuple)):
+                # have htslib skip the other samples, these are kept in
+                # file order
+                order = dict((s, i) for i, s in enumerate(vf.header.samples))
+                vf.subset_samples(sorted(set(samples), key=order.get))
+            records = _fetchrecords(vf, self.chrom, self.start, self.stop,
+                                    self.region)
+            indices = dict((s, i + 9) for i, s
+                           in enumerate(vf.header.samples))
+            samples = [(s, indices[s]) for s in samples]
+            formats = dict()
+            for rec in records:
+                yield _pysamrow(rec, samples, formats, self.info)
+
+        finally:
+            vf.close()
+
+
+VCFView.diskcache = diskcache
+
+
+class VCFVariantRow(tuple):
+    """
+    Row of a VCF table, returned by :func:`fromvcf`. This is a tuple, with
+    the fixed columns also available as attributes, e.g., ``row.CHROM`` or
+    ``row.POS``, and the calls for each sample as ``row.calls``. Chromosome
+    names are shared between rows.
+
+    """
+
+    __slots__ = ()
+
+    CHROM = property(operator.itemgetter(0))
+    POS = property(operator.itemgetter(1))
+    ID = property(operator.itemgetter(2))
+    REF = property(operator.itemgetter(3))
+    ALT = property(operator.itemgetter(4))
+    QUAL = property(operator.itemgetter(5))
+    FILTER = property(operator.itemgetter(6))
+    INFO = property(operator.itemgetter(7))
+    calls = property(operator.itemgetter(slice(8, None)))
+
+
+# chromosome names are shared between rows, so keep one copy of each
+_interned_chroms = dict()
+
+
+def _reduce_pyvcf_call(call):
+    # N.B., PyVCF's CallData pickles as its type, losing the values, and the
+    # site is restored after the call is created as it refers back to the
+    # call
+    data = call.data
+    return (_restore_pyvcf_call,
+            (call.sample, data._fields, tuple(data), call.gt_nums,
+             call.gt_alleles, call.called, call.ploidity),
+            call.site, None, None, _set_pyvcf_site)
+
+
+def _restore_pyvcf_call(sample, fields, values, gt_nums, gt_alleles, called,
+                        ploidity):
+    import vcf.model
+    try:
+        calldata = _pyvcf_calldatatypes[fields]
+    except KeyError:
+        calldata = _pyvcf_calldatatypes[fields] = \
+            vcf.model.make_calldata_tuple(fields)
+    # bypass __init__, which would parse the genotype again
+    call = vcf.model._Call.__new__(vcf.model._Call)
+    call.sample = sample
+    call.data = calldata._make(values)
+    call.gt_nums = gt_nums
+    call.gt_alleles = gt_alleles
+    call.called = called
+    call.ploidity = ploidity
+    return call
+
+
+def _set_pyvcf_site(call, site):
+    call.site = site
+
+
+# PyVCF CallData types, by FORMAT keys
+_pyvcf_calldatatypes = dict()
+
+
+def _fetchrecords(vf, chrom=None, start=None, stop=None, region=None):
+    # records from a pysam VariantFile, for the whole file or a region
+    if region is None and chrom is None:
+        return vf
+    elif region is None:
+        return vf.fetch(chrom, start, stop)
+    elif isinstance(region, string_types):
+        return vf.fetch(region=region)
+    else:
+        contigs = list(vf.header.contigs)
+        regions = _normalise_regions(
+            region, dict((c, i) for i, c in enumerate(contigs))
+        )
+        return _iterregions(regions, contigs, vf.fetch, _record_extent)
+
+
+def _iterregions(regions, contigs, fetch, extent):
+    # fetch merged regions in order, skipping items already returned for
+    # the previous region
+    prev = None
+    for rid, start, stop in regions:
+        for item in fetch(contigs[rid], start, stop):
+            if prev is not None and prev[0] == rid:
+                istart, istop = extent(item)
+                if istart < prev[2] and istop > prev[1]:
+                    continue
+            yield item
+        prev = (rid, start, stop)
+
+
+def _line_extent(line):
+    vals = line.split('\t', 4)
+    start = int(vals[1]) - 1
+    return start, start + len(vals[3])
+
+
+def _record_extent(rec):
+    return rec.start, rec.stop
+
+
+class Call(object):
+    """
+    Genotype call for a single sample, returned by :func:`fromvcf` when
+    using the 'pysam' engine. The FORMAT fields are only parsed when first
+    accessed, either via the `data` attribute, a namedtuple, or by key, e.g.,
+    ``call['GT']``.
+
+    """
+
+    __slots__ = ('sample', '_raw', '_format', '_data')
+
+    def __init__(self, sample, raw, format):
+        self.sample = sample
+        self._raw = raw
+        self._format = format
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self._format.parse(self._raw)
+        return self._data
+
+    def __getitem__(self, key):
+        return getattr(self.data, key)
+
+    def __eq__(self, other):
+        return (isinstance(other, Call) and self.sample == other.sample
+                and self.data == other.data)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.sample, self.data))
+
+    def __repr__(self):
+        return 'Call(sample=%s, %r)' % (self.sample, self.data)
+
+    def __reduce__(self):
+        # N.B., the parsed values are pickled, as the parser can't be
+        data = self.data
+        return _restorecall, (self.sample, data._fields, tuple(data))
+
+
+def _restorecall(sample, keys, values):
+    call = Call(sample, None, None)
+    call._data = _calldatatype(keys)._make(values)
+    return call
+
+
+# namedtuple types for call data, by FORMAT keys
+_calldatatypes = dict()
+
+
+def _calldatatype(keys):
+    keys = tuple(keys)
+    try:
+        return _calldatatypes[keys]
+    except KeyError:
+        t = _calldatatypes[keys] = namedtuple('CallData', keys)
+        return t
+
+
+class _CallFormat(object):
+    # parses the sample columns sharing a FORMAT string
+
+    def __init__(self, keys, header):
+        self.keys = keys
+        self.type = _calldatatype(keys)
+        self.converters = [_call_converter(k, header) for k in keys]
+
+    def parse(self, raw):
+        values = raw.split(':')
+        values += ['.'] * (len(self.keys) - len(values))
+        return self.type._make([conv(v) for conv, v
+                                in zip(self.converters, values)])
+
+
+def _call_converter(key, header):
+    if key == 'GT' or key not in header.formats:
+        return _missing_str
+    meta = header.formats[key]
+    conv = {'Integer': int, 'Float': float}.get(meta.type)
+    if conv is None:
+        single = _missing_str
+    else:
+        def single(v):
+            return None if v == '.' else conv(v)
+    if meta.number == 1:
+        return single
+
+    def multiple(v):
+        return None if v == '.' else tuple(single(x) for x in v.split(','))
+    return multiple
+
+
+def _missing_str(v):
+    return None if v == '.' else v
+
+
+def _pysamrow(rec, samples, formats, info=None):
+    alts = rec.alts
+    filt = list(rec.filter.keys())
+    if not filt:
+        filt = None
+    elif filt == ['PASS']:
+        filt = []
+    if info is None:
+        info = dict(rec.info)
+    else:
+        recinfo = rec.info
+        info = dict((k, recinfo[k]) for k in info if k in recinfo)
+    chrom = rec.chrom
+    row = (_interned_chroms.setdefault(chrom, chrom), rec.pos, rec.id,
+           rec.ref, list(alts) if alts else [None], rec.qual, filt, info)
+    if not samples:
+        return VCFVariantRow(row)
+
+    # splitting the formatted record is much quicker than accessing each
+    # sample via pysam
+    vals = str(rec).rstrip('\n').split('\t')
+    try:
+        fmt = formats[vals[8]]
+    except KeyError:
+        fmt = formats[vals[8]] = _CallFormat(tuple(vals[8].split(':')),
+                                             rec.header)
+    return VCFVariantRow(row + tuple(Call(name, vals[i], fmt)
+                                     for name, i in samples))
+
+
+def _selectinfo(parse, keys):
+    # wrap the reader's INFO parser to skip entries for other keys
+    keys = frozenset(keys)
+
+    def parse_info(info_str):
+        entries = [e for e in info_str.split(';')
+                   if e.partition('=')[0] in keys]
+        if not entries:
+            return {}
+        return parse(';'.join(entries))
+
+    return parse_info
+
+
+def _selectcolumns(lines, indices):
+    for line in lines:
+        vals = line.split('\t')
+        yield '\t'.join(vals[:9] + [vals[i] for i in indices])
+
+
+def _dropcolumns(lines):
+    for line in lines:
+        yield '\t'.join(line.split('\t', 8)[:8])
+
+
+def _iterlines(filename, encoding, threads=None):
+    # data lines from a plain or gzipped VCF file, skipping the header
+    if threads and isbgzf(filename):
+        f = closing(bgzflines(filename, threads=threads, encoding=encoding))
+    elif filename.endswith('.gz'):
+        f = gzip.open(filename, 'rt', encoding=encoding)
+    else:
+        f = open(filename, 'rt')
+    with f as lines:
+        for line in lines:
+            if line.startswith('#'):
+                continue
+            line = line.strip()
+            if line:
+                yield line
+
+
+def tovcf(table, filename, meta=None, index=True):
+    """
+    Write a table of variants to a variant call file (VCF), e.g.::
+
+        >>> import petl as etl
+        >>> # activate bio extensions
+        ... import petlx.bio
+        >>> import os, shutil, tempfile
+        >>> tmpdir = tempfile.mkdtemp()
+        >>> filename = os.path.join(tmpdir, 'example.vcf.gz')
+        >>> table1 = etl.fromvcf('fixture/sample.vcf.gz')
+        >>> table1.selectgt('QUAL', 20).tovcf(filename)
+        >>> table2 = etl.fromvcf(filename, region='20', samples=None)
+        >>> table2.cut('CHROM', 'POS', 'REF', 'ALT', 'QUAL')
+        +-------+---------+-----+-----------+------+
+        | CHROM | POS     | REF | ALT       | QUAL |
+        +=======+=========+=====+===========+======+
+        | '20'  |   14370 | 'G' | [A]       |   29 |
+        +-------+---------+-----+-----------+------+
+        | '20'  | 1110696 | 'A' | [G, T]    |   67 |
+        +-------+---------+-----+-----------+------+
+        | '20'  | 1230237 | 'T' | [None]    |   47 |
+        +-------+---------+-----+-----------+------+
+        | '20'  | 1234567 | 'G' | [GA, GAC] |   50 |
+        +-------+---------+-----+-----------+------+
+        <BLANKLINE>
+        >>> shutil.rmtree(tmpdir)
+
+    The table should have the fields returned by :func:`fromvcf`, i.e.,
+    CHROM, POS, ID, REF, ALT, QUAL, FILTER and INFO, optionally followed by
+    a field of calls for each sample. Values may be as returned by either
+    engine, or strings already formatted for VCF.
+
+    The meta-information lines are taken from `meta`, which may be a list of
+    lines or the name of a VCF file to copy them from. By default, if the
+    table comes straight from :func:`fromvcf` they are copied from the file
+    it reads.
+
+    If `filename` ends with '.gz' the file is compressed with bgzip's block
+    format, and unless `index` is False, a tabix index is built as the
+    variants are written, in which case the table must be sorted by
+    chromosome and position.
+
+    """
+
+    if meta is None and isinstance(table, VCFView):
+        meta = table.filename
+    _writetable(table, _VCFWriter, filename, meta=meta, index=index)
+
+
+etl.tovcf = tovcf
+Table.tovcf = tovcf
+
+
+class _VCFWriter(TabixWriter):
+
+    def __init__(self, filename, fields, meta=None, index=True):
+        super(_VCFWriter, self).__init__(filename, 'vcf', index=index)
+        fields = tuple(fields)
+        self.getter = operator.itemgetter(*asindices(fields, VCF_HEADER))
+        n = len(VCF_HEADER)
+        if fields[:n] == VCF_HEADER:
+            self.samples = fields[n:]
+        else:
+            self.samples = ()
+        for line in _readmeta(meta):
+            self.writeheader(line)
+        hdr = ('#CHROM',) + VCF_HEADER[1:]
+        if self.samples:
+            hdr += ('FORMAT',) + self.samples
+        self.writeheader('\t'.join(hdr))
+
+    def writerow(self, row):
+        chrom, pos, id, ref, alt, qual, filt, info = self.getter(row)
+        vals = [text_type(chrom), text_type(pos), _formatvalue(id),
+                text_type(ref), _formatalt(alt), _formatvalue(qual),
+                _formatfilter(filt), _formatinfo(info)]
+        if self.samples:
+            calls = row[len(VCF_HEADER):]
+            vals.append(_formatcalls(calls, vals))
+        start = int(pos) - 1
+        self.writerecord(text_type(chrom), start, start + len(ref),
+                         '\t'.join(vals))
+
+
+def _readmeta(meta):
+    if meta is None:
+        return ['##fileformat=VCFv4.2']
+    if isinstance(meta, string_types):
+        # copy from another file
+        lines = list()
+        opener = gzip.open if meta.endswith('.gz') else open
+        with opener(meta, 'rt') as f:
+            for line in f:
+                if not line.startswith('##'):
+                    break
+                lines.append(line.rstrip('\r\n'))
+        return lines
+    return list(meta)
+
+
+def _formatvalue(v):
+    if v is None:
+        return '.'
+    if isinstance(v, float):
+        return '%g' % v
+    if isinstance(v, (list, tuple)):
+        return ','.join(_formatvalue(x) for x in v)
+    return text_type(v)
+
+
+def _formatalt(alt):
+    if isinstance(alt, string_types):
+        return alt
+    if not alt or all(a is None for a in alt):
+        return '.'
+    return ','.join('.' if a is None else text_type(a) for a in alt)
+
+
+def _formatfilter(filt):
+    if filt is None:
+        return '.'
+    if isinstance(filt, string_types):
+        return filt
+    if not filt:
+        return 'PASS'
+    return ';'.join(filt)
+
+
+def _formatinfo(info):
+    if info is None:
+        return '.'
+    if isinstance(info, string_types):
+        return info
+    entries = list()
+    for key, value in info.items():
+        if value is True:
+            entries.append(key)
+        elif value is not None and value is not False:
+            entries.append('%s=%s' % (key, _formatvalue(value)))
+    return ';'.join(entries) if entries else '.'
+
+
+def _formatcalls(calls, vals):
+    # append the FORMAT column to vals and return the sample columns
+    keys = None
+    for call in calls:
+        if call is not None and not isinstance(call, string_types):
+            keys = call.data._fields
+            break
+    if keys is None:
+        # no call data, or calls are already formatted
+        vals.append('GT')
+        return '\t'.join('.' if c is None else c for c in calls)
+    vals.append(':'.join(keys))
+    return '\t'.join(
+        '.' if call is None
+        else ':'.join(_formatvalue(v) for v in call.data)
+        for call in calls
+    )
+
 
 def vcfunpackinfo(table, *keys):
     """
@@ -113,8 +772,17 @@ def vcfunpackinfo(table, *keys):
         +-------+---------+-------------+-----+--------+------+---------+------+------+----------------+------+------+------+------+------+
         ...
 
+    If no keys are given and the table comes straight from :func:`fromvcf`,
+    the keys are taken from the ##INFO header lines, or from the `info`
+    argument to :func:`fromvcf` if given. Otherwise the table is scanned to
+    find them.
+
     """
 
+    if not keys and isinstance(table, VCFView):
+        # use the keys declared in the header or requested when reading,
+        # rather than a pass over the data
+        keys = table._infokeys()
     result = etl.unpackdict(table, 'INFO', keys=keys)
     return result
 
@@ -153,7 +821,7 @@ def vcfmeltsamples(table, *samples):
 
     """
 
-    result = etl.melt(table, key=VCF_HEADER, variables=samples,
+    result = etl.melt(table, key=VCF_HEADER, variables=samples or None,
                       variablefield='SAMPLE', valuefield='CALL')
     return result
 
@@ -203,3 +871,362 @@ def vcfunpackcall(table, *keys):
 
 etl.vcfunpackcall = vcfunpackcall
 Table.vcfunpackcall = vcfunpackcall
+
+
+def vcfmeltcalls(table, fields=('GT', 'DP'), samples=None):
+    """
+    Melt the samples columns and unpack the given FORMAT fields from each
+    call in one step, which is much quicker than :func:`vcfmeltsamples`
+    followed by :func:`vcfunpackcall`. E.g.::
+
+        >>> import petl as etl
+        >>> # activate bio extensions
+        ... import petlx.bio
+        >>> table1 = (
+        ...     etl
+        ...     .fromvcf('fixture/sample.vcf')
+        ...     .vcfmeltcalls(fields=('GT', 'GQ'))
+        ...     .cutout('INFO')
+        ... )
+        >>> table1
+        +-------+-----+------+-----+-----+------+--------+-----------+-------+------+
+        | CHROM | POS | ID   | REF | ALT | QUAL | FILTER | SAMPLE    | GT    | GQ   |
+        +=======+=====+======+=====+=====+======+========+===========+=======+======+
+        | '19'  | 111 | None | 'A' | [C] |  9.6 | None   | 'NA00001' | '0|0' | None |
+        +-------+-----+------+-----+-----+------+--------+-----------+-------+------+
+        | '19'  | 111 | None | 'A' | [C] |  9.6 | None   | 'NA00002' | '0|0' | None |
+        +-------+-----+------+-----+-----+------+--------+-----------+-------+------+
+        | '19'  | 111 | None | 'A' | [C] |  9.6 | None   | 'NA00003' | '0/1' | None |
+        +-------+-----+------+-----+-----+------+--------+-----------+-------+------+
+        | '19'  | 112 | None | 'A' | [G] |   10 | None   | 'NA00001' | '0|0' | None |
+        +-------+-----+------+-----+-----+------+--------+-----------+-------+------+
+        | '19'  | 112 | None | 'A' | [G] |   10 | None   | 'NA00002' | '0|0' | None |
+        +-------+-----+------+-----+-----+------+--------+-----------+-------+------+
+        ...
+
+    Fields missing from a call are None. If `samples` is given, only those
+    samples are melted.
+
+    """
+
+    return VCFMeltCallsView(table, fields, samples)
+
+
+etl.vcfmeltcalls = vcfmeltcalls
+Table.vcfmeltcalls = vcfmeltcalls
+
+
+class VCFMeltCallsView(Table):
+    def __init__(self, source, fields=('GT', 'DP'), samples=None):
+        self.source = source
+        self.fields = tuple(fields)
+        self.samples = samples
+
+    def __iter__(self):
+        it = iter(self.source)
+        hdr = tuple(next(it))
+        n = len(VCF_HEADER)
+        if self.samples is None:
+            samples = hdr[n:]
+        else:
+            samples = tuple(self.samples)
+        indices = asindices(hdr, samples)
+        yield hdr[:n] + ('SAMPLE',) + self.fields
+
+        missing = (None,) * len(self.fields)
+        getters = dict()
+        for row in it:
+            # variant fields are shared by the rows for all samples
+            prefix = tuple(row[:n])
+            for sample, i in zip(samples, indices):
+                call = row[i]
+                if call is None:
+                    yield prefix + (sample,) + missing
+                    continue
+                data = call.data
+                try:
+                    getter = getters[type(data)]
+                except KeyError:
+                    getter = getters[type(data)] = _datagetter(data._fields,
+                                                               self.fields)
+                yield prefix + (sample,) + getter(data)
+
+
+def _datagetter(available, fields):
+    # function returning a tuple of the given fields from call data
+    if all(f in available for f in fields):
+        if len(fields) == 1:
+            i = available.index(fields[0])
+            return lambda data: (data[i],)
+        return operator.itemgetter(*[available.index(f) for f in fields])
+    indices = [available.index(f) if f in available else None
+               for f in fields]
+    return lambda data: tuple(None if i is None else data[i]
+                              for i in indices)
+
+
+def vcftoarray(filename, fields=('GT', 'DP', 'GQ'), samples=None,
+               region=None, ploidy=2, chunksize=10000, out=None,
+               threads=None):
+    """
+    Extract FORMAT fields from a variant call file into NumPy arrays,
+    without creating a row for each call. Returns a dictionary mapping each
+    field to an array of shape (variants, samples), or (variants, samples,
+    ploidy) for genotypes, e.g.::
+
+        >>> import petl as etl
+        >>> # activate bio extensions
+        ... import petlx.bio
+        >>> arrays = etl.vcftoarray('fixture/sample.vcf.gz',
+        ...                         region='20:14370-1110696')
+        >>> arrays['GT']
+        array([[[0, 0],
+                [1, 0],
+                [1, 1]],
+        <BLANKLINE>
+               [[0, 0],
+                [0, 1],
+                [0, 0]],
+        <BLANKLINE>
+               [[1, 2],
+                [2, 1],
+                [2, 2]]], dtype=int32)
+        >>> arrays['DP']
+        array([[1, 8, 5],
+               [3, 5, 3],
+               [6, 0, 4]], dtype=int32)
+
+    Alleles are coded as integers. Missing values are -1 for alleles and
+    integer fields, and nan for float fields. Fields declared with a fixed
+    number of values greater than one have an extra dimension; fields with
+    a variable number of values are not supported.
+
+    Records are parsed `chunksize` variants at a time into buffers which
+    grow as needed. If `out` is given, it should be the path of a directory,
+    and each field is instead written to a NumPy file in that directory as
+    it is read, e.g., 'GT.npy'. The files are returned as read-only memory
+    maps, so the data need not fit in memory.
+
+    The `samples`, `region` and `threads` arguments are as for
+    :func:`fromvcf` with the 'pysam' engine. The
+    `pysam <http://pysam.readthedocs.org/>`_ package is required.
+
+    """
+
+    import pysam
+    vf = pysam.VariantFile(filename, threads=threads or 1)
+    buffers = list()
+    try:
+
+        # resolve samples and fields
+        indices = dict((s, i + 9) for i, s in enumerate(vf.header.samples))
+        if samples is None:
+            samples = list(vf.header.samples)
+        indices = [indices[s] for s in samples]
+        specs = [_FormatField(f, vf.header, ploidy) for f in fields]
+
+        # set up output buffers
+        if out is not None and not os.path.exists(out):
+            os.makedirs(out)
+        for spec in specs:
+            shape = (len(samples),) + spec.shape
+            if out is None:
+                buffers.append(_ArrayBuffer(spec.dtype, shape, chunksize))
+            else:
+                path = os.path.join(out, spec.key + '.npy')
+                buffers.append(_NpyWriter(path, spec.dtype, shape))
+
+        # parse records in chunks
+        chunk = list()
+        for rec in _fetchrecords(vf, region=region):
+            chunk.append(str(rec).rstrip('\n').split('\t'))
+            if len(chunk) == chunksize:
+                _parsechunk(chunk, indices, specs, buffers)
+                chunk = list()
+        if chunk:
+            _parsechunk(chunk, indices, specs, buffers)
+
+        return OrderedDict((spec.key, buf.finish())
+                           for spec, buf in zip(specs, buffers))
+
+    finally:
+        vf.close()
+        for buf in buffers:
+            buf.close()
+
+
+etl.vcftoarray = vcftoarray
+
+
+def _parsechunk(chunk, indices, specs, buffers):
+    n, m = len(chunk), len(indices)
+    values = [list() for _ in specs]
+    for vals in chunk:
+        keys = vals[8].split(':') if len(vals) > 8 else []
+        calls = [vals[i].split(':') for i in indices]
+        for spec, vs in zip(specs, values):
+            if spec.key not in keys:
+                vs.extend(['.'] * m)
+                continue
+            k = keys.index(spec.key)
+            try:
+                vs.extend([c[k] for c in calls])
+            except IndexError:
+                # trailing fields dropped
+                vs.extend([c[k] if k < len(c) else '.' for c in calls])
+    for spec, vs, buf in zip(specs, values, buffers):
+        buf.append(spec.parse(vs, n, m))
+
+
+class _FormatField(object):
+    # conversion of the values of a FORMAT field into an array
+
+    def __init__(self, key, header, ploidy):
+        import numpy as np
+        self.key = key
+        if key == 'GT':
+            # N.B., as for htslib, so allele indices cannot overflow
+            self.dtype = np.dtype('i4')
+            number = ploidy
+        elif key in header.formats:
+            meta = header.formats[key]
+            self.dtype = np.dtype({'Integer': 'i4', 'Float': 'f4'}
+                                  .get(meta.type, object))
+            number = meta.number
+            if not isinstance(number, int):
+                raise ValueError('FORMAT field %r has a variable number of '
+                                 'values' % key)
+        else:
+            raise ValueError('FORMAT field %r not found in header' % key)
+        self.number = number
+        self.shape = (number,) if number > 1 else ()
+        if self.dtype.kind == 'f':
+            self.fill = np.nan
+        elif self.dtype.kind == 'i':
+            self.fill = -1
+        else:
+            self.fill = None
+
+    def parse(self, values, n, m):
+        import numpy as np
+        size = n * m * self.number
+        a = None
+        if self.dtype.kind in 'if' and self._uniform(values):
+            # every call has the expected number of values, so parse all
+            # values in one go, falling back to value by value if any value
+            # is malformed
+            text = ' '.join(values).replace(',', ' ')
+            if self.key == 'GT':
+                text = text.replace('/', ' ').replace('|', ' ')
+            missing = '-1' if self.dtype.kind == 'i' else 'nan'
+            tokens = [missing if t == '.' else t for t in text.split()]
+            try:
+                a = np.array(tokens).astype(self.dtype)
+            except (ValueError, OverflowError):
+                a = None
+            if a is not None and a.size != size:
+                a = None
+        if a is None:
+            a = self._parseslow(values)
+        return a.reshape((n, m) + self.shape)
+
+    def _uniform(self, values):
+        # True if each value has exactly `number` separated items, so items
+        # cannot shift between calls, e.g., a haploid next to a triploid
+        # call; N.B., a missing call '.' has a single item
+        seps = self.number - 1
+        if self.key == 'GT':
+            return all(v.count('/') + v.count('|') == seps for v in values)
+        return all(v.count(',') == seps for v in values)
+
+    def _parseslow(self, values):
+        import numpy as np
+        conv = {'i': int, 'f': float}.get(self.dtype.kind, str)
+        a = np.empty((len(values), self.number), dtype=self.dtype)
+        a.fill(self.fill)
+        for i, v in enumerate(values):
+            if v == '.':
+                continue
+            if self.key == 'GT':
+                tokens = re.split('[/|]', v)
+            else:
+                tokens = v.split(',')
+            for j, t in enumerate(tokens[:self.number]):
+                if t != '.':
+                    a[i, j] = conv(t)
+        return a
+
+
+class _ArrayBuffer(object):
+    # in-memory array which grows by doubling
+
+    def __init__(self, dtype, shape, capacity):
+        import numpy as np
+        self.data = np.empty((capacity,) + shape, dtype=dtype)
+        self.n = 0
+
+    def append(self, a):
+        import numpy as np
+        stop = self.n + len(a)
+        if stop > len(self.data):
+            capacity = max(stop, 2 * len(self.data))
+            data = np.empty((capacity,) + self.data.shape[1:],
+                            dtype=self.data.dtype)
+            data[:self.n] = self.data[:self.n]
+            self.data = data
+        self.data[self.n:stop] = a
+        self.n = stop
+
+    def finish(self):
+        if self.n < len(self.data):
+            self.data = self.data[:self.n].copy()
+        return self.data
+
+    def close(self):
+        pass
+
+
+# fixed size of .npy headers written by _NpyWriter, so the header can be
+# rewritten with the final shape once all data have been appended
+_NPY_HEADER_SIZE = 128
+
+
+class _NpyWriter(object):
+    # NumPy file which is appended to along the first dimension
+
+    def __init__(self, path, dtype, shape):
+        if dtype.hasobject:
+            raise ValueError('cannot write object array to %r' % path)
+        self.path = path
+        self.dtype = dtype
+        self.shape = shape
+        self.n = 0
+        self.f = open(path, 'wb')
+        self._writeheader()
+
+    def _writeheader(self):
+        import numpy as np
+        header = ("{'descr': %r, 'fortran_order': False, 'shape': %r, }"
+                  % (np.lib.format.dtype_to_descr(self.dtype),
+                     (self.n,) + self.shape))
+        size = _NPY_HEADER_SIZE - 10
+        header = header.ljust(size - 1) + '\n'
+        self.f.seek(0)
+        self.f.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', size)
+                     + header.encode('latin1'))
+
+    def append(self, a):
+        self.f.write(a.astype(self.dtype, copy=False).tobytes())
+        self.n += len(a)
+
+    def finish(self):
+        import numpy as np
+        self._writeheader()
+        self.f.close()
+        if self.n == 0:
+            return np.load(self.path)
+        return np.load(self.path, mmap_mode='r')
+
+    def close(self):
+        if not self.f.closed:
+            self.f.close()
@@ -2,19 +2,36 @@ from __future__ import absolute_import, print_function, division
 
 
 import csv
-from tempfile import NamedTemporaryFile
+import gzip
+import heapq
+import numbers
+import re
+import struct
+import threading
+from tempfile import NamedTemporaryFile, TemporaryFile
 from operator import itemgetter
 from itertools import islice
 from collections import defaultdict
-from petl.compat import pickle, next, PY3
+from petl.compat import pickle, next, PY3, string_types, text_type, \
+    binary_type, numeric_types
 
 
-from petl.util.base import asindices, Record
+from petl.util.base import Table, asindices, Record
 from petl.comparison import comparable_itemgetter
 from petl.transform.sorts import _shortlistmergesorted
 import petl.transform
 
 
+class PipelineDone(Exception):
+    """Raised by the `accept()` method of a connection which needs no more
+    rows, e.g., by :func:`head` once it has passed on enough rows. Once all
+    receivers of a connection are done, `broadcast()` raises PipelineDone
+    in turn, so the signal travels back up the pipeline, and `push()` stops
+    reading the source and closes the pipeline.
+
+    """
+
+
 class PipelineComponent(object):
 
     def __init__(self):
@@ -48,23 +65,80 @@ class PipelineComponent(object):
         return default_connections, keyed_connections
             
     def push(self, source, limit=None):
+        """Push up to `limit` rows from `source` through the pipeline, then
+        close it."""
         it = iter(source)
         fields = next(it)
         c = self.connect(fields)
-        for row in islice(it, limit):
-            c.accept(tuple(row))
-        c.close()
+        _pushrows(it, c, limit)
+
+    def start(self, source, limit=None):
+        """Push rows from `source` through the pipeline in a background
+        thread, returning the thread. The pipeline is connected before this
+        method returns, so tables from :func:`totable` components can be
+        read straight away, e.g., while the source is still being read. If
+        an error is raised while pushing rows, it is raised again by any
+        table reading from the pipeline, or if there are no such tables it
+        is left uncaught in the thread, so it is reported as usual.
+
+        """
+
+        it = iter(source)
+        fields = next(it)
+        c = self.connect(fields)
+
+        def run():
+            try:
+                _pushrows(it, c, limit, c.abort)
+            except Exception as e:
+                # e.g., raised while closing the pipeline, or no table reads
+                # from the pipeline
+                if not c.abort(e):
+                    raise
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return thread
 
     def connect(self, fields):
         pass
 
 
+def _pushrows(it, c, limit, onerror=None):
+    try:
+        try:
+            for row in islice(it, limit):
+                c.accept(tuple(row))
+        except PipelineDone:
+            # nothing downstream needs any more rows, stop reading the source
+            pass
+        finally:
+            _closeiter(it)
+    except Exception as e:
+        # N.B., before closing, so tables reading from the pipeline do not
+        # take the end of the rows for success
+        if onerror is None or not onerror(e):
+            raise
+    finally:
+        # flush and close files downstream, also on error
+        c.close()
+
+
 class PipelineConnection(object):
 
+    # if True, the connection needs all rows for itself, so keeps accepting
+    # rows after all its receivers are done, e.g., when writing a file
+    tee = False
+
     def __init__(self, default_connections, keyed_connections, fields):
         self.default_connections = default_connections
         self.keyed_connections = keyed_connections
         self.fields = fields
+        self.nreceivers = len(default_connections) + \
+            sum(len(cs) for cs in keyed_connections.values())
+        # receivers which have raised PipelineDone
+        self.finished = set()
 
     def close(self):
         for c in self.default_connections:
@@ -73,17 +147,54 @@ class PipelineConnection(object):
             for c in self.keyed_connections[k]:
                 c.close()
 
+    def abort(self, error):
+        """Pass on an error raised while pushing rows, e.g., to tables
+        reading from the pipeline. Returns True if any receiver takes the
+        error."""
+        connections = list(self.default_connections)
+        for k in self.keyed_connections:
+            connections.extend(self.keyed_connections[k])
+        taken = False
+        for c in connections:
+            abort = getattr(c, 'abort', None)
+            if abort is not None and abort(error):
+                taken = True
+        return taken
+
     def broadcast(self, *args):
         assert 1 <= len(args) <= 2, 'expected 1 or 2 arguments'
         if len(args) == 1:
             row = args[0]
-            for c in self.default_connections:
-                c.accept(tuple(row))
+            connections = self.default_connections
         elif len(args) == 2:
             key, row = args
-            if key in self.keyed_connections:
-                for c in self.keyed_connections[key]:
-                    c.accept(tuple(row))
+            connections = self.keyed_connections.get(key, ())
+        finished = self.finished
+        for c in connections:
+            if finished and c in finished:
+                continue
+            try:
+                c.accept(tuple(row))
+            except PipelineDone:
+                finished.add(c)
+        if finished and len(finished) == self.nreceivers and not self.tee:
+            raise PipelineDone()
+
+    def broadcastall(self, rows):
+        """Broadcast rows on the default pipe, e.g., when closing, stopping
+        early once all receivers are done."""
+        try:
+            for row in rows:
+                self.broadcast(row)
+        except PipelineDone:
+            pass
+
+
+def _closeiter(it):
+    # release any files held open by the source
+    close = getattr(it, 'close', None)
+    if close is not None:
+        close()
 
 
 def tocsv(filename, dialect='excel', **kwargs):
@@ -126,6 +237,8 @@ class ToCsvComponent(PipelineComponent):
 
 class ToCsvConnection(PipelineConnection):
 
+    tee = True
+
     def __init__(self, default_connections, keyed_connections, fields, filename, 
                  dialect, kwargs):
         super(ToCsvConnection, self).__init__(default_connections,
@@ -175,6 +288,8 @@ class ToPickleComponent(PipelineComponent):
 
 class ToPickleConnection(PipelineConnection):
 
+    tee = True
+
     def __init__(self, default_connections, keyed_connections, fields,
                  filename, protocol):
         super(ToPickleConnection, self).__init__(default_connections,
@@ -194,6 +309,254 @@ class ToPickleConnection(PipelineConnection):
         super(ToPickleConnection, self).close()
 
 
+def totable(buffersize=None):
+    """Collect rows into a table, which can be read with petl's transforms
+    while rows are being pushed, e.g.::
+
+        >>> from petlx.push import partition, totable
+        >>> p = partition('fruit')
+        >>> oranges = p.pipe('orange', totable())
+        >>> bananas = p.pipe('banana', totable())
+        >>> p.start(sometable)
+        >>> oranges.table.join(bananas.table, key='city').look()
+
+    The `table` attribute of the component is a table of the rows received
+    by the component, which may be iterated any number of times, and by
+    several readers at once, each at its own pace. Readers wait for rows
+    which have not yet been pushed. See also
+    :meth:`PipelineComponent.start`, which pushes rows in a background
+    thread, so a single pass through a source can feed several tables.
+
+    Received rows are held in memory up to `buffersize` rows (by default
+    `petl.config.sort_buffersize`), after which rows are written to a
+    temporary file, so the pipeline never waits for slow readers. Rows are
+    made available to readers in batches of 1000.
+
+    """
+
+    return ToTableComponent(buffersize)
+
+
+class ToTableComponent(PipelineComponent):
+
+    def __init__(self, buffersize=None):
+        super(ToTableComponent, self).__init__()
+        self.buffersize = buffersize
+        self.buffer = None
+        self.table = ToTableView(self)
+
+    def connect(self, fields):
+        default_connections, keyed_connections = self._connect_receivers(fields)
+        if self.buffersize is None:
+            buffersize = petl.config.sort_buffersize
+        else:
+            buffersize = self.buffersize
+        self.buffer = _RowBuffer(fields, buffersize)
+        return ToTableConnection(default_connections, keyed_connections,
+                                 fields, self.buffer)
+
+
+class ToTableConnection(PipelineConnection):
+
+    tee = True
+
+    def __init__(self, default_connections, keyed_connections, fields,
+                 buffer):
+        super(ToTableConnection, self).__init__(default_connections,
+                                                keyed_connections, fields)
+        self.buffer = buffer
+
+    def accept(self, row):
+        self.buffer.append(row)
+        # forward rows on the default pipe (behave like tee)
+        self.broadcast(row)
+
+    def close(self):
+        self.buffer.close()
+        super(ToTableConnection, self).close()
+
+    def abort(self, error):
+        self.buffer.abort(error)
+        super(ToTableConnection, self).abort(error)
+        return True
+
+
+class ToTableView(Table):
+
+    def __init__(self, component):
+        self.component = component
+
+    def __iter__(self):
+        buffer = self.component.buffer
+        if buffer is None:
+            raise ValueError('no rows have been pushed to this table, see '
+                             'PipelineComponent.start()')
+        yield tuple(buffer.fields)
+        for row in buffer:
+            yield row
+
+
+# number of rows made available to readers at once
+_batchsize = 1000
+
+
+class _RowBuffer(object):
+    # rows from a single writer, in batches which are kept in memory or
+    # pickled to a temporary file, read by any number of readers
+
+    def __init__(self, fields, buffersize):
+        self.fields = fields
+        self.buffersize = buffersize
+        self.pending = list()
+        # lists of rows, or (offset, length) of a batch in the file
+        self.batches = list()
+        self.nrows = 0
+        self.file = None
+        self.closed = False
+        self.error = None
+        self.cond = threading.Condition()
+
+    def append(self, row):
+        self.pending.append(row)
+        if len(self.pending) >= _batchsize:
+            self._flush()
+
+    def _flush(self):
+        batch = self.pending
+        self.pending = list()
+        self.nrows += len(batch)
+        if self.nrows > self.buffersize:
+            data = pickle.dumps(batch, protocol=-1)
+        with self.cond:
+            if self.nrows > self.buffersize:
+                if self.file is None:
+                    self.file = TemporaryFile()
+                self.file.seek(0, 2)
+                self.batches.append((self.file.tell(), len(data)))
+                self.file.write(data)
+            else:
+                self.batches.append(batch)
+            self.cond.notify_all()
+
+    def close(self):
+        if self.pending:
+            self._flush()
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def abort(self, error):
+        with self.cond:
+            self.error = error
+            self.cond.notify_all()
+
+    def __iter__(self):
+        i = 0
+        while True:
+            with self.cond:
+                while i == len(self.batches) and not self.closed and \
+                        self.error is None:
+                    self.cond.wait()
+                if self.error is not None:
+                    raise self.error
+                if i == len(self.batches):
+                    return
+                batch = self.batches[i]
+                if isinstance(batch, tuple):
+                    # N.B., readers share the file with the writer
+                    offset, length = batch
+                    self.file.seek(offset)
+                    batch = self.file.read(length)
+            if not isinstance(batch, list):
+                batch = pickle.loads(batch)
+            i += 1
+            for row in batch:
+                yield row
+
+
+def tovcf(filename, meta=None, index=True):
+    """Push rows to a variant call file (VCF), compressed and indexed if
+    `filename` ends with '.gz'. E.g.::
+
+        >>> from petlx.push import tovcf
+        >>> p = tovcf('example.vcf.gz', meta='source.vcf.gz')
+        >>> p.push(sometable)
+
+    See :func:`petlx.bio.vcf.tovcf`.
+
+    """
+
+    from petlx.bio.vcf import _VCFWriter
+    return ToTabixComponent(_VCFWriter, filename, meta=meta, index=index)
+
+
+def togff3(filename, index=True):
+    """Push rows to a GFF3 file, compressed and indexed if `filename` ends
+    with '.gz'. E.g.::
+
+        >>> from petlx.push import togff3
+        >>> p = togff3('example.gff.gz')
+        >>> p.push(sometable)
+
+    See :func:`petlx.bio.gff3.togff3`.
+
+    """
+
+    from petlx.bio.gff3 import _GFF3Writer
+    return ToTabixComponent(_GFF3Writer, filename, index=index)
+
+
+def tobed(filename, index=True):
+    """Push rows to a BED file, compressed and indexed if `filename` ends
+    with '.gz'. E.g.::
+
+        >>> from petlx.push import tobed
+        >>> p = tobed('example.bed.gz')
+        >>> p.push(sometable)
+
+    See :func:`petlx.bio.tabix.tobed`.
+
+    """
+
+    from petlx.bio.tabix import _BEDWriter
+    return ToTabixComponent(_BEDWriter, filename, index=index)
+
+
+class ToTabixComponent(PipelineComponent):
+
+    def __init__(self, writer, filename, **kwargs):
+        super(ToTabixComponent, self).__init__()
+        self.writer = writer
+        self.filename = filename
+        self.kwargs = kwargs
+
+    def connect(self, fields):
+        default_connections, keyed_connections = self._connect_receivers(fields)
+        writer = self.writer(self.filename, fields, **self.kwargs)
+        return ToTabixConnection(default_connections, keyed_connections,
+                                 fields, writer)
+
+
+class ToTabixConnection(PipelineConnection):
+
+    tee = True
+
+    def __init__(self, default_connections, keyed_connections, fields,
+                 writer):
+        super(ToTabixConnection, self).__init__(default_connections,
+                                                keyed_connections, fields)
+        self.writer = writer
+
+    def accept(self, row):
+        self.writer.writerow(row)
+        # forward rows on the default pipe (behave like tee)
+        self.broadcast(row)
+
+    def close(self):
+        self.writer.close()
+        super(ToTabixConnection, self).close()
+
+
 def partition(discriminator):
     """Partition rows based on values of a field or results of applying a
     function on the row. E.g.::
@@ -243,7 +606,54 @@ class PartitionConnection(PipelineConnection):
         self.broadcast(key, row)
 
 
-def sort(key=None, reverse=False, buffersize=None):
+def head(n=5):
+    """Pass on only the first `n` rows. E.g.::
+
+        >>> from petlx.push import head, tocsv
+        >>> p = head(10)
+        >>> p.pipe(tocsv('first10.csv'))
+        >>> p.push(sometable)
+
+    Once `n` rows have been passed on the component is done, see
+    :class:`PipelineDone`, so if no other part of the pipeline needs more
+    rows, no more rows are read from the source.
+
+    """
+
+    return HeadComponent(n)
+
+
+class HeadComponent(PipelineComponent):
+
+    def __init__(self, n):
+        super(HeadComponent, self).__init__()
+        self.n = n
+
+    def connect(self, fields):
+        default_connections, keyed_connections = self._connect_receivers(fields)
+        return HeadConnection(default_connections, keyed_connections, fields,
+                              self.n)
+
+
+class HeadConnection(PipelineConnection):
+
+    def __init__(self, default_connections, keyed_connections, fields, n):
+        super(HeadConnection, self).__init__(default_connections,
+                                             keyed_connections, fields)
+        self.n = n
+        self.count = 0
+
+    def accept(self, row):
+        if self.count >= self.n:
+            raise PipelineDone()
+        self.count += 1
+        self.broadcast(row)
+        if self.count >= self.n:
+            # done, without waiting for another row
+            raise PipelineDone()
+
+
+def sort(key=None, reverse=False, buffersize=None, binarykey=False):
     """Sort rows based on some key field or fields. E.g.::
 
         >>> from petlx.push import sort, tocsv
@@ -251,21 +661,36 @@ def sort(key=None, reverse=False, buffersize=None):
         >>> p.pipe(tocsv('sorted_by_foo.csv'))
         >>> p.push(sometable)
 
+    If `binarykey` is True, the key values of each row are encoded once as
+    a single bytes string via :func:`encodekey`, which compares in the same
+    order as the values themselves, so rows are sorted and merged by native
+    comparison of bytes rather than via comparison objects. Encoded keys are
+    written to temporary files alongside the rows, so are not computed
+    again when merging. Key values must be None, numbers, text or bytes.
+
     """
 
-    return SortComponent(key=key, reverse=reverse, buffersize=buffersize)
+    return SortComponent(key=key, reverse=reverse, buffersize=buffersize,
+                         binarykey=binarykey)
 
 
 class SortComponent(PipelineComponent):
 
-    def __init__(self, key=None, reverse=False, buffersize=None):
+    def __init__(self, key=None, reverse=False, buffersize=None,
+                 binarykey=False):
         super(SortComponent, self).__init__()
         self.key = key
         self.reverse = reverse
         self.buffersize = buffersize
+        self.binarykey = binarykey
 
     def connect(self, fields):
         default_connections, keyed_connections = self._connect_receivers(fields)
+        if self.binarykey:
+            return BinaryKeySortConnection(default_connections,
+                                           keyed_connections, fields,
+                                           self.key, self.reverse,
+                                           self.buffersize)
         return SortConnection(default_connections, keyed_connections, fields, 
                               self.key, self.reverse, self.buffersize)
 
@@ -317,15 +742,138 @@ class SortConnection(PipelineConnection):
             chunkiters = [iterchunk(f) for f in self.chunkfiles]
             # make sure any left in cache are included
             chunkiters.append(self.cache)
-            for row in _shortlistmergesorted(self.getkey, self.reverse,
-                                            *chunkiters):
-                self.broadcast(row)
+            self.broadcastall(_shortlistmergesorted(self.getkey, self.reverse,
+                                                    *chunkiters))
         else:
-            for row in self.cache:
-                self.broadcast(row)
+            self.broadcastall(self.cache)
         super(SortConnection, self).close()
     
 
+
+class BinaryKeySortConnection(SortConnection):
+    # sort (key, row) pairs, where key is an encoded bytes string
+
+    def __init__(self, default_connections, keyed_connections, fields, key,
+                 reverse, buffersize):
+        super(BinaryKeySortConnection, self).__init__(
+            default_connections, keyed_connections, fields, None, reverse,
+            buffersize
+        )
+        if key is None:
+            self.encodekey = encodekey
+        else:
+            indices = asindices(fields, key)
+            self.encodekey = lambda row: encodekey(_getvalues(row, indices))
+        self.getkey = itemgetter(0)
+
+    def accept(self, row):
+        row = tuple(row)
+        super(BinaryKeySortConnection, self).accept((self.encodekey(row),
+                                                     row))
+
+    def close(self):
+        self.cache.sort(key=self.getkey, reverse=self.reverse)
+        if self.chunkfiles:
+            chunkiters = [iterchunk(f) for f in self.chunkfiles]
+            chunkiters.append(self.cache)
+            if self.reverse:
+                pairs = _shortlistmergesorted(self.getkey, True, *chunkiters)
+            else:
+                # N.B., ties are broken by chunk, which also keeps the sort
+                # stable, so rows themselves are never compared
+                pairs = heapq.merge(*[_tagchunk(it, i)
+                                      for i, it in enumerate(chunkiters)])
+            self.broadcastall(pair[-1] for pair in pairs)
+        else:
+            self.broadcastall(row for _, row in self.cache)
+        PipelineConnection.close(self)
+
+
+def _tagchunk(chunk, i):
+    for key, row in chunk:
+        yield key, i, row
+
+
+def _getvalues(row, indices):
+    # N.B., missing values at the end of short rows are treated as None
+    try:
+        return [row[i] for i in indices]
+    except IndexError:
+        return [row[i] if i < len(row) else None for i in indices]
+
+
+def encodekey(values):
+    """Encode a sequence of values as a bytes string, such that comparing
+    the encoded strings gives the same order as comparing the sequences of
+    values. E.g.::
+
+        >>> from petlx.push import encodekey
+        >>> encodekey(['chr2', 30]) < encodekey(['chr10', 4])
+        False
+        >>> encodekey([None, 2.5]) < encodekey([1, -3])
+        True
+
+    Values may be None, numbers, text or bytes. As for sorting in petl,
+    None comes before numbers, which come before bytes then text; ints and
+    floats compare by value. A TypeError is raised for other types, and a
+    ValueError for integers too large to encode, i.e., beyond the range of
+    a float or more than 2**63 from the nearest float.
+
+    """
+
+    return b''.join([_encodevalue(v) for v in values])
+
+
+_SIGN = 1 << 63
+_MASK = (1 << 64) - 1
+_unpack_double = struct.Struct('>Q').unpack
+_pack_double = struct.Struct('>d').pack
+_pack_number = struct.Struct('>cQQ').pack
+
+
+def _encodevalue(v):
+    if v is None:
+        return b'\x01'
+    if isinstance(v, text_type):
+        return b'\x04' + _escape(v.encode('utf-8', 'surrogatepass'))
+    if isinstance(v, binary_type):
+        return b'\x03' + _escape(v)
+    if isinstance(v, numeric_types):
+        return _encodenumber(v)
+    raise TypeError('cannot encode %r as a binary sort key' % (v,))
+
+
+def _escape(b):
+    # 0x00 marks the end of the value, so values which are prefixes of
+    # others come first
+    return b.replace(b'\x00', b'\x00\xff') + b'\x00\x00'
+
+
+def _encodenumber(v):
+    # order-preserving encoding of the value as a double, followed by the
+    # difference between an integer and the double, for large integers
+    try:
+        f = float(v) + 0.0  # N.B., -0.0 == 0.0
+    except OverflowError:
+        # integers beyond the range of a double
+        raise ValueError('integer too large for a binary sort key')
+    if f != f:
+        # NaN after all other numbers
+        bits = _MASK
+    else:
+        bits, = _unpack_double(_pack_double(f))
+        bits = bits ^ _MASK if bits & _SIGN else bits | _SIGN
+    rest = 0
+    if isinstance(v, numbers.Integral) and f not in (_INF, -_INF):
+        rest = int(v) - int(f)
+        if not -_SIGN <= rest < _SIGN:
+            raise ValueError('integer too large for a binary sort key')
+    return _pack_number(b'\x02', bits, rest + _SIGN)
+
+
+_INF = float('inf')
+
+
 def iterchunk(f):
     try:
         while True:
@@ -334,6 +882,178 @@ def iterchunk(f):
         pass
 
 
+def genomicsort(chrom='seqid', pos='start', order=None, buffersize=None):
+    """Sort rows by chromosome and position, e.g., to write a file which can
+    be indexed with tabix. E.g.::
+
+        >>> from petlx.push import genomicsort, togff3
+        >>> p = genomicsort('seqid', 'start')
+        >>> p.pipe(togff3('sorted.gff.gz'))
+        >>> p.push(features)
+
+    Rows are collected in a bucket per chromosome, and each bucket is sorted
+    by position only, as an integer, so rows are not compared as tuples.
+    Rows with the same chromosome and position keep their original order.
+    If more than `buffersize` rows are held in memory (by default
+    `petl.config.sort_buffersize`), the sorted buckets are written to a
+    temporary file, and at the end only the runs of each chromosome are
+    merged with each other.
+
+    Chromosomes are returned in natural order, e.g., 'chr2' before
+    'chr10', unless `order` is given, either as a list of chromosome names
+    or as the name of a VCF or GFF3 file whose '##contig' or
+    '##sequence-region' header lines give the order. Any chromosomes not
+    in the given order follow in natural order.
+
+    """
+
+    return GenomicSortComponent(chrom=chrom, pos=pos, order=order,
+                                buffersize=buffersize)
+
+
+class GenomicSortComponent(PipelineComponent):
+
+    def __init__(self, chrom='seqid', pos='start', order=None,
+                 buffersize=None):
+        super(GenomicSortComponent, self).__init__()
+        self.chrom = chrom
+        self.pos = pos
+        self.order = order
+        self.buffersize = buffersize
+
+    def connect(self, fields):
+        default_connections, keyed_connections = self._connect_receivers(fields)
+        return GenomicSortConnection(default_connections, keyed_connections,
+                                     fields, self.chrom, self.pos, self.order,
+                                     self.buffersize)
+
+
+class GenomicSortConnection(PipelineConnection):
+
+    def __init__(self, default_connections, keyed_connections, fields, chrom,
+                 pos, order, buffersize):
+        super(GenomicSortConnection, self).__init__(default_connections,
+                                                    keyed_connections, fields)
+        self.ichrom = asindices(fields, chrom)[0]
+        self.ipos = asindices(fields, pos)[0]
+        if isinstance(order, string_types):
+            order = _contigorder(order)
+        self.order = order
+        if buffersize is None:
+            self.buffersize = petl.config.sort_buffersize
+        else:
+            self.buffersize = buffersize
+        self.getpos = None
+        self.buckets = dict()
+        self.count = 0
+        # spilled runs, as (file, {chrom: (offset, nrows)})
+        self.runs = list()
+
+    def accept(self, row):
+        row = tuple(row)
+        c = row[self.ichrom]
+        try:
+            self.buckets[c].append(row)
+        except KeyError:
+            self.buckets[c] = [row]
+        self.count += 1
+        if self.count >= self.buffersize:
+            self._spill()
+
+    def _sortkey(self, row):
+        if self.getpos is None:
+            # N.B., positions from text files are converted to integers
+            if isinstance(row[self.ipos], int):
+                self.getpos = itemgetter(self.ipos)
+            else:
+                ipos = self.ipos
+                self.getpos = lambda r: int(r[ipos])
+        return self.getpos
+
+    def _spill(self):
+        f = TemporaryFile()
+        offsets = dict()
+        for c, bucket in self.buckets.items():
+            bucket.sort(key=self._sortkey(bucket[0]))
+            offsets[c] = f.tell(), len(bucket)
+            for r in bucket:
+                pickle.dump(r, f, protocol=-1)
+        f.flush()
+        self.runs.append((f, offsets))
+        self.buckets = dict()
+        self.count = 0
+
+    def _chroms(self):
+        chroms = set(self.buckets)
+        for _, offsets in self.runs:
+            chroms.update(offsets)
+        ordered = list()
+        if self.order is not None:
+            ordered = [c for c in self.order if c in chroms]
+            chroms.difference_update(ordered)
+        return ordered + sorted(chroms, key=_naturalkey)
+
+    def close(self):
+        try:
+            for c in self._chroms():
+                bucket = self.buckets.pop(c, [])
+                if bucket:
+                    bucket.sort(key=self._sortkey(bucket[0]))
+                runs = [_iterrun(f, offsets[c]) for f, offsets in self.runs
+                        if c in offsets]
+                if runs:
+                    # only runs of the same chromosome need merging
+                    runs.append(bucket)
+                    rows = _shortlistmergesorted(self.getpos, False, *runs)
+                else:
+                    rows = bucket
+                for row in rows:
+                    self.broadcast(row)
+        except PipelineDone:
+            # all receivers have seen enough rows
+            pass
+        finally:
+            for f, _ in self.runs:
+                f.close()
+        super(GenomicSortConnection, self).close()
+
+
+def _iterrun(f, run):
+    offset, n = run
+    f.seek(offset)
+    for _ in range(n):
+        yield pickle.load(f)
+
+
+def _naturalkey(chrom):
+    # e.g., 'chr2' before 'chr10'; N.B., numbers and text alternate so parts
+    # at the same position are always of the same type
+    parts = re.split(r'(\d+)', text_type(chrom))
+    parts[1::2] = [int(p) for p in parts[1::2]]
+    return parts
+
+
+def _contigorder(filename):
+    # chromosome names from '##contig' lines of a VCF header or
+    # '##sequence-region' lines of a GFF3 header
+    order = list()
+    opener = gzip.open if filename.endswith(('.gz', '.bgz')) else open
+    with opener(filename, 'rb') as f:
+        for line in f:
+            line = line.decode('utf-8')
+            if not line.startswith('#'):
+                break
+            if line.startswith('##contig=<'):
+                m = re.search(r'[<,]ID=([^,>]+)', line)
+                if m:
+                    order.append(m.group(1))
+            elif line.startswith('##sequence-region'):
+                vals = line.split()
+                if len(vals) > 1:
+                    order.append(vals[1])
+    return order
+
+
 def duplicates(key):
     """Report rows with duplicate key values. E.g.::
 
@@ -421,9 +1141,12 @@ class DuplicatesConnection(PipelineConnection):
             self.previous = row
 
     def close(self):
-        if not self.previous_is_duplicate:
+        if self.previous is not None and not self.previous_is_duplicate:
             # forward unique row
-            self._broadcast_unique(self.previous)
+            try:
+                self._broadcast_unique(self.previous)
+            except PipelineDone:
+                pass
         super(DuplicatesConnection, self).close()
         
 
@@ -496,54 +1219,101 @@ class DiffComponent(PipelineComponent):
 
         default_connections, keyed_connections = self._connect_receivers(aflds)
 
-        def _broadcast(*args):
-            if len(args) == 1:
-                for c in default_connections:
-                    c.accept(args[0])
-            else:
-                key, row = args
-                if key in keyed_connections:
-                    for c in keyed_connections[key]:
-                        c.accept(row)
-        
+        c = PipelineConnection(default_connections, keyed_connections, aflds)
+        _broadcast = c.broadcast
+
         try:
-            a = tuple(next(ita))
-        except StopIteration:
-            # a is empty, everything in b is added
-            for b in itb:
-                _broadcast('+', b)
-        else:
             try:
-                b = tuple(next(itb))
+                a = tuple(next(ita))
             except StopIteration:
-                # b is empty, everything in a is subtracted
-                _broadcast('-', a)
-                for a in ita:
-                    _broadcast('-', a)
+                # a is empty, everything in b is added
+                for b in itb:
+                    _broadcast('+', b)
             else:
-                while a is not None and b is not None:
-                    if b is None or a < b:
+                try:
+                    b = tuple(next(itb))
+                except StopIteration:
+                    # b is empty, everything in a is subtracted
+                    _broadcast('-', a)
+                    for a in ita:
                         _broadcast('-', a)
-                        # advance a
-                        try:
-                            a = tuple(next(ita))
-                        except StopIteration:
-                            a = None
-                    elif a == b:
-                        _broadcast(a)  # default channel
-                        # advance both
-                        try:
-                            a = tuple(next(ita))
-                        except StopIteration:
-                            a = None
-                        try:
-                            b = tuple(next(itb))
-                        except StopIteration:
-                            b = None
-                    else:
-                        _broadcast('+', b)
-                        # advance b
-                        try:
-                            b = tuple(next(itb))
-                        except StopIteration:
-                            b = None
+                else:
+                    while a is not None and b is not None:
+                        if b is None or a < b:
+                            _broadcast('-', a)
+                            # advance a
+                            try:
+                                a = tuple(next(ita))
+                            except StopIteration:
+                                a = None
+                        elif a == b:
+                            _broadcast(a)  # default channel
+                            # advance both
+                            try:
+                                a = tuple(next(ita))
+                            except StopIteration:
+                                a = None
+                            try:
+                                b = tuple(next(itb))
+                            except StopIteration:
+                                b = None
+                        else:
+                            _broadcast('+', b)
+                            # advance b
+                            try:
+                                b = tuple(next(itb))
+                            except StopIteration:
+                                b = None
+        except PipelineDone:
+            # nothing downstream needs any more rows
+            pass
+        finally:
+            _closeiter(ita)
+            _closeiter(itb)
+        c.close()
+
+
+def overlapjoin(lchrom='chrom', lstart='start', lstop='stop', rchrom='chrom',
+                rstart='start', rstop='stop', include_stop=False, chroms=None,
+                lprefix=None, rprefix=None):
+    """Join two tables by overlapping genome intervals. E.g.::
+
+        >>> from petlx.push import overlapjoin, tocsv
+        >>> p = overlapjoin(lchrom='CHROM', lstart='POS', lstop='POS',
+        ...                 rchrom='seqid', rstart='start', rstop='end',
+        ...                 include_stop=True)
+        >>> p.pipe(tocsv('annotated.csv'))
+        >>> p.push(variants, features)
+
+    N.B., assumes both tables are already sorted by chromosome and start
+    position, see :func:`petlx.bio.interval.overlapmergejoin`.
+
+    """
+
+    return OverlapJoinComponent(lchrom=lchrom, lstart=lstart, lstop=lstop,
+                                rchrom=rchrom, rstart=rstart, rstop=rstop,
+                                include_stop=include_stop, chroms=chroms,
+                                lprefix=lprefix, rprefix=rprefix)
+
+
+class OverlapJoinComponent(PipelineComponent):
+
+    def __init__(self, **kwargs):
+        super(OverlapJoinComponent, self).__init__()
+        self.kwargs = kwargs
+
+    def push(self, ta, tb, limit=None):
+        from petlx.bio.interval import overlapmergejoin
+        it = iter(overlapmergejoin(ta, tb, **self.kwargs))
+        fields = next(it)
+        default_connections, keyed_connections = self._connect_receivers(fields)
+        c = PipelineConnection(default_connections, keyed_connections, fields)
+        try:
+            for row in islice(it, limit):
+                c.broadcast(row)
+        except PipelineDone:
+            # nothing downstream needs any more rows
+            pass
+        finally:
+            _closeiter(it)
+        c.close()
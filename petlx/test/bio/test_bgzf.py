@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, division
+
+
+import gzip
+import os
+import random
+import shutil
+from tempfile import mkdtemp
+
+
+from petl.test.helpers import eq_
+import pysam
+
+
+from petlx.bio.bgzf import BgzfWriter, TabixWriter, reg2bin, isbgzf, \
+    bgzflines
+
+
+def test_bgzf():
+    tmpdir = mkdtemp()
+    try:
+        fn = os.path.join(tmpdir, 'test.gz')
+        data = b''.join(b'line %d\n' % i for i in range(100000))
+        with BgzfWriter(fn) as f:
+            f.write(data[:10])
+            eq_(10, f.tell())
+            f.write(data[10:])
+        with gzip.open(fn, 'rb') as f:
+            eq_(data, f.read())
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_bgzflines():
+    tmpdir = mkdtemp()
+    try:
+        fn = os.path.join(tmpdir, 'test.gz')
+        rnd = random.Random(42)
+        # lines of varying length, crossing block and chunk boundaries
+        lines = ['x' * rnd.randint(0, 5000) for _ in range(2000)]
+        with BgzfWriter(fn) as f:
+            f.write('\n'.join(lines).encode('ascii'))
+        eq_(True, isbgzf(fn))
+        for threads in 1, 3:
+            eq_(lines, list(bgzflines(fn, threads=threads)))
+        # windows line terminators
+        with BgzfWriter(fn) as f:
+            f.write('\r\n'.join(lines).encode('ascii') + b'\r\n')
+        eq_(lines, list(bgzflines(fn, threads=2)))
+        # file written by bgzip
+        expect = gzip.open('fixture/sample.sorted.gff.gz', 'rb').read()
+        eq_(expect.decode('utf-8').rstrip('\n').split('\n'),
+            list(bgzflines('fixture/sample.sorted.gff.gz', threads=2)))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_bgzflines_not_bgzf():
+    tmpdir = mkdtemp()
+    try:
+        fn = os.path.join(tmpdir, 'test.gz')
+        with gzip.open(fn, 'wb') as f:
+            f.write(b'foo\nbar\n')
+        eq_(False, isbgzf(fn))
+        eq_(False, isbgzf('fixture/sample.gff'))
+        try:
+            list(bgzflines(fn))
+        except ValueError:
+            pass
+        else:
+            assert False, 'expected ValueError'
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_reg2bin():
+    eq_(4681, reg2bin(0, 1))
+    eq_(4681, reg2bin(0, 1 << 14))
+    eq_(585, reg2bin(0, (1 << 14) + 1))
+    eq_(4682, reg2bin(1 << 14, (1 << 14) + 10))
+    eq_(0, reg2bin(0, 1 << 29))
+
+
+def test_tabixwriter():
+    rnd = random.Random(42)
+    records = list()
+    for chrom in 'chr1', 'chr2', 'chr10':
+        pos = 0
+        for i in range(5000):
+            pos += rnd.randint(0, 500)
+            end = pos + rnd.choice([1, 10, 100, 1000, 50000, 2000000])
+            line = '%s\t%s\t%s\tr%s' % (chrom, pos, end, i)
+            records.append((chrom, pos, end, line))
+    tmpdir = mkdtemp()
+    try:
+        fn = os.path.join(tmpdir, 'test.bed.gz')
+        writer = TabixWriter(fn, 'bed')
+        writer.writeheader('#chrom\tstart\tend\tname')
+        for record in records:
+            writer.writerecord(*record)
+        writer.close()
+
+        f = pysam.TabixFile(fn)
+        eq_(['chr1', 'chr10', 'chr2'], sorted(f.contigs))
+        eq_(['#chrom\tstart\tend\tname'], list(f.header))
+        for _ in range(200):
+            chrom = rnd.choice(['chr1', 'chr2', 'chr10'])
+            start = rnd.randint(0, 3000000)
+            stop = start + rnd.randint(1, 100000)
+            expect = [r[3] for r in records
+                      if r[0] == chrom and r[1] < stop and r[2] > start]
+            eq_(sorted(expect), sorted(f.fetch(chrom, start, stop)))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_tabixwriter_unsorted():
+    tmpdir = mkdtemp()
+    try:
+        fn = os.path.join(tmpdir, 'test.bed.gz')
+        writer = TabixWriter(fn, 'bed')
+        writer.writerecord('chr1', 100, 200, 'chr1\t100\t200')
+        try:
+            writer.writerecord('chr1', 10, 20, 'chr1\t10\t20')
+        except ValueError:
+            pass
+        else:
+            assert False, 'expected ValueError'
+        writer.writerecord('chr2', 10, 20, 'chr2\t10\t20')
+        try:
+            writer.writerecord('chr1', 300, 400, 'chr1\t300\t400')
+        except ValueError:
+            pass
+        else:
+            assert False, 'expected ValueError'
+    finally:
+        shutil.rmtree(tmpdir)
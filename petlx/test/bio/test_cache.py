@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, division
+
+
+import os
+import shutil
+import tempfile
+import time
+
+
+import petl as etl
+from petl.test.helpers import eq_, ieq
+
+
+# activate extensions
+import petlx.bio.gff3
+import petlx.bio.tabix
+import petlx.bio.vcf
+from petlx.bio import cache
+
+
+def _entries(path):
+    return sorted(n for n in os.listdir(path) if n.endswith('.rows'))
+
+
+def test_diskcache_gff3():
+    path = tempfile.mkdtemp()
+    src = tempfile.NamedTemporaryFile(suffix='.gff', delete=False).name
+    shutil.copy('fixture/sample.gff', src)
+    try:
+        expect = etl.fromgff3(src, attributes=['ID'])
+        actual = etl.fromgff3(src, attributes=['ID']).diskcache(path=path)
+
+        # partial iteration doesn't populate the cache
+        actual.head(3).nrows()
+        eq_([], _entries(path))
+
+        ieq(expect, actual)
+        eq_(1, len(_entries(path)))
+        # served from the cache
+        ieq(expect, actual)
+        ieq(expect, etl.fromgff3(src, attributes=['ID']).diskcache(path=path))
+        eq_(1, len(_entries(path)))
+        eq_(expect.values('attributes').list(),
+            actual.values('attributes').list())
+
+        # different arguments
+        etl.fromgff3(src).diskcache(path=path).nrows()
+        eq_(2, len(_entries(path)))
+
+        # changes to the file are picked up
+        n = expect.nrows()
+        with open(src, 'a') as f:
+            f.write('apidb|MAL1\tApiDB\tgene\t1\t10\t.\t+\t.\tID=x\n')
+        os.utime(src, (time.time() + 10, time.time() + 10))
+        eq_(n + 1, actual.nrows())
+        eq_(3, len(_entries(path)))
+
+        cache.clearcache(path=path)
+        eq_([], _entries(path))
+    finally:
+        shutil.rmtree(path)
+        os.remove(src)
+
+
+def test_diskcache_vcf():
+    path = tempfile.mkdtemp()
+    try:
+        for engine in 'pyvcf', 'pysam':
+            expect = etl.fromvcf('fixture/sample.vcf.gz', engine=engine)
+            actual = expect.diskcache(path=path, codec=None)
+            for _ in range(2):
+                rows = list(actual)
+                eq_([str(row) for row in expect], [str(row) for row in rows])
+                for row, erow in zip(rows[1:], list(expect)[1:]):
+                    for call, ecall in zip(row[8:], erow[8:]):
+                        eq_(ecall.data, call.data)
+                        eq_(ecall['GT'], call['GT'])
+                        if engine == 'pyvcf':
+                            eq_(ecall.gt_type, call.gt_type)
+                            eq_(row[8].site, call.site)
+        eq_(2, len(_entries(path)))
+    finally:
+        shutil.rmtree(path)
+
+
+def test_diskcache_tabix():
+    path = tempfile.mkdtemp()
+    try:
+        expect = etl.fromtabix('fixture/test.bed.gz', types='auto',
+                               region=['Pf3D7_02_v3', 'Pf3D7_01_v3'])
+        actual = expect.diskcache(path=path, codec='bz2')
+        ieq(expect, actual)
+        ieq(expect, actual)
+        eq_(1, len(_entries(path)))
+    finally:
+        shutil.rmtree(path)
+
+
+def test_diskcache_unkeyable():
+    path = tempfile.mkdtemp()
+    try:
+        src = 'fixture/test.bed.gz'
+        # built-in conversion functions are keyed by name
+        etl.fromtabix(src, types={'start': int}).diskcache(path=path).nrows()
+        eq_(1, len(_entries(path)))
+        # other functions may change between sessions, so are not cached
+        expect = etl.fromtabix(src, types={'start': lambda v: int(v)})
+        actual = expect.diskcache(path=path)
+        ieq(expect, actual)
+        eq_(1, len(_entries(path)))
+    finally:
+        shutil.rmtree(path)
+
+
+def test_diskcache_evict():
+    path = tempfile.mkdtemp()
+    size = cache.cache_size
+    try:
+        table = etl.fromgff3('fixture/sample.gff').diskcache(path=path)
+        table.nrows()
+        entry = _entries(path)[0]
+        cache.cache_size = os.path.getsize(os.path.join(path, entry)) + 1
+        # make the first entry the least recently used
+        old = time.time() - 100
+        os.utime(os.path.join(path, entry), (old, old))
+        etl.fromgff3('fixture/sample.gff', attributes=['ID']) \
+            .diskcache(path=path).nrows()
+        eq_(1, len(_entries(path)))
+        assert entry not in _entries(path)
+    finally:
+        cache.cache_size = size
+        shutil.rmtree(path)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, division
+
+
+import os
+import shutil
+import tempfile
+
+
+import petl as etl
+from petl.test.helpers import ieq, eq_
+
+
+import petlx.bio.encoding
+import petlx.bio.gff3
+import petlx.bio.tabix
+import petlx.bio.vcf
+
+
+def test_fromgff3_encode():
+    expect = etl.fromgff3('fixture/sample.gff')
+    actual = etl.fromgff3('fixture/sample.gff', encode=True)
+    ieq(expect, actual)
+    rows = list(actual)[1:]
+    types = set(id(row.type) for row in rows)
+    eq_(len(set(row.type for row in rows)), len(types))
+    # codes are consistent between iterations
+    codes, values = actual.dictcodes('type')
+    eq_(len(rows), len(codes))
+    eq_([row.type for row in rows], [values[c] for c in codes])
+    eq_((codes, values), actual.dictcodes('type'))
+    # rows sliced via the line index are encoded by the same dictionary;
+    # N.B., use a copy, as the index is written alongside the file
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fn = os.path.join(tmpdir, 'sample.gff')
+        shutil.copy('fixture/sample.gff', fn)
+        sliced = etl.fromgff3(fn, index=True, encode=True)
+        codes, values = sliced.dictcodes('type')
+        value = sliced.rowslice(170, 172).values('type')[0]
+        assert value is values[codes[170]]
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_fromgff3_encode_fields():
+    table = etl.fromgff3('fixture/sample.gff', attributes=('Parent',),
+                         encode=('seqid', 'Parent'))
+    codes, values = table.dictcodes('Parent')
+    eq_(None, values[0])
+    eq_(table.values('Parent').list(), [values[c] for c in codes])
+
+
+def test_fromtabix_encode():
+    expect = etl.fromtabix('fixture/test.bed.gz')
+    actual = etl.fromtabix('fixture/test.bed.gz', encode=True)
+    ieq(expect, actual)
+    codes, values = actual.dictcodes('#chrom')
+    eq_(sorted(set(expect.values('#chrom'))), sorted(values))
+    eq_(expect.values('#chrom').list(), [values[c] for c in codes])
+
+
+def test_fromvcf_encode():
+    expect = etl.fromvcf('fixture/sample.vcf', samples=None)
+    for engine in 'pyvcf', 'pysam':
+        actual = etl.fromvcf('fixture/sample.vcf.gz', samples=None,
+                             engine=engine, encode=True)
+        ieq(expect.cut('CHROM', 'POS', 'REF'),
+            actual.cut('CHROM', 'POS', 'REF'))
+        eq_([None if f is None else tuple(f)
+             for f in expect.values('FILTER')],
+            actual.values('FILTER').list())
+
+
+def test_dictcodes():
+    table = etl.wrap([('foo', 'bar'), ('a', 1), ('b', 2), ('a', 3)])
+    codes, values = table.dictcodes('foo')
+    eq_([0, 1, 0], list(codes))
+    eq_(['a', 'b'], values)
+
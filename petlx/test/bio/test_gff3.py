@@ -2,8 +2,14 @@
 from __future__ import absolute_import, print_function, division
 
 
+import os
+import shutil
+from tempfile import mkdtemp
+
+
 import petl as etl
-from petl.test.helpers import eq_
+from petl.compat import pickle
+from petl.test.helpers import eq_, ieq
 
 
 # activate extension
@@ -59,3 +65,229 @@ def test_fromgff3_region():
     tbl_features = etl.fromgff3('fixture/sample.sorted.gff.gz',
                                 region='apidb|MAL5:1289593-1289595')
     eq_(4, tbl_features.nrows())
+
+
+def test_gff3_attributes_lazy():
+    from petlx.bio.gff3 import GFF3Attributes
+    s = 'ID=apidb|X95275;description=complete+map+%28IR-A%29.;size=1;size=2;'
+    attrs = GFF3Attributes(s)
+    # single key lookup does not parse the whole string
+    eq_('apidb|X95275', attrs.get('ID'))
+    eq_('2', attrs.get('size'))
+    eq_(None, attrs.get('Parent'))
+    eq_(None, attrs._values)
+    eq_('complete map (IR-A).', attrs['description'])
+    eq_(3, len(attrs))
+    eq_({'ID': 'apidb|X95275', 'description': 'complete map (IR-A).',
+         'size': '2'}, attrs)
+    eq_('2', attrs.get('size'))
+
+
+def test_gff3_attributes_compact():
+    from petlx.bio.gff3 import GFF3Attributes
+    a = GFF3Attributes('ID=gene1;Name=foo%3Bbar')
+    b = GFF3Attributes('ID=gene2;Name=baz')
+    eq_('foo;bar', a['Name'])
+    eq_('baz', b['Name'])
+    # rows with the same keys share them, and the string is formatted again
+    # from the values
+    assert a._keys is b._keys
+    eq_(None, a._string)
+    eq_('ID=gene1;Name=foo%3Bbar', str(a))
+    # strings which would not be formatted the same way are kept
+    c = GFF3Attributes('ID=gene3;Name=a+b')
+    eq_('a b', c['Name'])
+    eq_('ID=gene3;Name=a+b', str(c))
+    eq_(dict(a), pickle.loads(pickle.dumps(a, protocol=-1)))
+
+
+def test_gff3_feature():
+    from petlx.bio.gff3 import GFF3Feature
+    rows = list(etl.fromgff3(sample_gff3_filename))[1:]
+    row = rows[0]
+    assert isinstance(row, GFF3Feature)
+    assert isinstance(row, tuple)
+    eq_('apidb|MAL1', row.seqid)
+    eq_('supercontig', row.type)
+    eq_((1, 643292), (row.start, row.end))
+    eq_(row[8], row.attributes)
+    eq_(tuple(row), pickle.loads(pickle.dumps(row, protocol=-1)))
+    # values repeated between rows are held once
+    assert rows[0].source is rows[-1].source
+    assert rows[0].strand is rows[1].strand
+    # rows still work with petl transforms
+    eq_(643292, etl.wrap([GFF3_HEADER] + rows).cut('end').values('end')[0])
+
+
+def test_gff3_intern_limit():
+    from petlx.bio import gff3
+    expect = etl.fromgff3(sample_gff3_filename, attributes=['ID'])
+    expect = [(tuple(row), dict(row.attributes))
+              for row in list(expect)[1:]]
+    limit = gff3._intern_limit
+    gff3._intern_limit = 5
+    for d in gff3._interned_values, gff3._interned_keys, gff3._keysets:
+        d.clear()
+    try:
+        actual = etl.fromgff3(sample_gff3_filename, attributes=['ID'])
+        actual = [(tuple(row), dict(row.attributes))
+                  for row in list(actual)[1:]]
+        # at most one value is added per field before checking the size
+        assert len(gff3._interned_values) <= 5 + 4
+        assert len(gff3._interned_keys) <= 5
+        assert len(gff3._keysets) <= 5
+    finally:
+        gff3._intern_limit = limit
+    eq_(expect, actual)
+
+
+def test_fromgff3_attributes():
+    features = etl.fromgff3(sample_gff3_filename,
+                            attributes=('ID', 'Parent'))
+    eq_(GFF3_HEADER + ('ID', 'Parent'), features.header())
+    rows = list(features)
+    eq_('apidb|MAL1', rows[1][9])
+    eq_(None, rows[1][10])
+    cds = [row for row in rows[1:] if row[2] == 'CDS'][0]
+    eq_('apidb|cds_coI-1', cds[9])
+    eq_('apidb|rna_coI-1', cds[10])
+
+
+def test_fromgff3_fasta():
+    tmpdir = mkdtemp()
+    try:
+        fn = os.path.join(tmpdir, 'test.gff')
+        with open(fn, 'w') as f:
+            f.write('##gff-version 3\n'
+                    '##sequence-region ctg123 1 1497228\n'
+                    'ctg123\t.\tgene\t1000\t9000\t.\t+\t.\tID=gene00001\n'
+                    '# a comment\n'
+                    '\n'
+                    'ctg123\t.\tmRNA\t1050\t9000\t.\t+\t.\t'
+                    'Parent=gene00001\n'
+                    '##FASTA\n'
+                    '>ctg123\n'
+                    'cttctgggcgtacccgattctcggagaacttgccgcaccattccgccttg\n')
+        features = etl.fromgff3(fn)
+        rows = list(features)
+        eq_(3, len(rows))
+        eq_(('ctg123', '.', 'mRNA', 1050, 9000, '.', '+', '.'), rows[2][:8])
+        eq_({'ctg123': (1, 1497228)}, features.sequence_regions())
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_fromgff3_parallel():
+    from petlx.bio.gff3 import _GFF3_RECORDS
+    from petlx.bio.lineindex import lineindex
+    with open(sample_gff3_filename) as f:
+        lines = f.readlines()
+    tmpdir = mkdtemp()
+    try:
+        fn = os.path.join(tmpdir, 'test.gff')
+        with open(fn, 'w') as f:
+            for i, line in enumerate(lines):
+                f.write(line)
+                if i % 10 == 0:
+                    f.write('# a comment\n\n')
+            f.write('##FASTA\n>ctg123\ncttctgggcg\n')
+        # small steps between indexed rows
+        lineindex(fn, step=7, **_GFF3_RECORDS)
+        expect = etl.fromgff3(sample_gff3_filename, attributes=['ID'])
+        actual = etl.fromgff3(fn, attributes=['ID'], parallel=2)
+        ieq(expect.cutout('attributes'), actual.cutout('attributes'))
+        for args in ((5,), (3, 20), (7, 14), (170, None), (10, 100, 3),
+                     (200,)):
+            ieq(expect.rowslice(*args).cutout('attributes'),
+                actual.rowslice(*args).cutout('attributes'))
+        # the index is used whenever it is up to date
+        from petlx.bio.gff3 import GFF3SliceView
+        assert isinstance(etl.fromgff3(fn).rowslice(3, 20), GFF3SliceView)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_fromgff3_parallel_gzip():
+    actual = etl.fromgff3('fixture/sample.sorted.gff.gz', parallel=2)
+    try:
+        actual.nrows()
+    except ValueError:
+        pass
+    else:
+        assert False, 'expected ValueError'
+
+
+def test_fromgff3_gzip():
+    features = etl.fromgff3('fixture/sample.sorted.gff.gz')
+    eq_(etl.fromgff3(sample_gff3_filename).nrows(), features.nrows())
+
+
+def test_fromgff3_threads():
+    expect = etl.fromgff3('fixture/sample.sorted.gff.gz', attributes=['ID'])
+    actual = etl.fromgff3('fixture/sample.sorted.gff.gz', attributes=['ID'],
+                          threads=2)
+    ieq(expect.cutout('attributes'), actual.cutout('attributes'))
+    eq_(expect.values('attributes').list(),
+        actual.values('attributes').list())
+    # plain files are read as usual
+    actual = etl.fromgff3(sample_gff3_filename, threads=2)
+    eq_(expect.nrows(), actual.nrows())
+
+
+def test_gff3index():
+    from petlx.bio.gff3 import GFF3Index
+    index = etl.fromgff3(sample_gff3_filename).gff3index()
+    eq_(177, len(index))
+    eq_('gene', index.feature('apidb|coI')[2])
+    eq_(['apidb|rna_coI-1'],
+        [row[8]['ID'] for row in index.children('apidb|coI')])
+    eq_(['apidb|rna_coI-1', 'apidb|cds_coI-1', 'apidb|exon_coI-1'],
+        [row[8]['ID'] for row in index.descendants('apidb|coI')])
+    eq_(['apidb|exon_coI-1'],
+        [row[8]['ID'] for row in index.descendants('apidb|coI',
+                                                   type='exon')])
+    models = dict((gene[8]['ID'], transcripts)
+                  for gene, transcripts in index.gene_models())
+    transcripts = models['apidb|coI']
+    eq_(1, len(transcripts))
+    eq_('apidb|rna_coI-1', transcripts[0][0][8]['ID'])
+    eq_(['CDS', 'exon'], [row[2] for row in transcripts[0][1]])
+
+    # round trip via disk
+    tmpdir = mkdtemp()
+    try:
+        fn = os.path.join(tmpdir, 'index.pickle')
+        index.save(fn)
+        loaded = GFF3Index.load(fn)
+        eq_(list(index.descendants('apidb|coI')),
+            list(loaded.descendants('apidb|coI')))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_togff3():
+    tmpdir = mkdtemp()
+    try:
+        fn = os.path.join(tmpdir, 'test.gff.gz')
+        expect = etl.fromgff3('fixture/sample.sorted.gff.gz')
+        expect.togff3(fn)
+        ieq(expect, etl.fromgff3(fn))
+        ieq(expect.selecteq('seqid', 'apidb|MAL1'),
+            etl.fromgff3(fn, region='apidb|MAL1'))
+        # attributes from dicts, quoted as needed
+        fn = os.path.join(tmpdir, 'test.gff')
+        table = (('seqid', 'source', 'type', 'start', 'end', 'score', 'strand',
+                  'phase', 'attributes'),
+                 ('ctg1', None, 'gene', 10, 20, None, '+', None,
+                  {'ID': 'g1', 'Note': 'a=b;c', 'Dbxref': ['x:1', 'y,2']}))
+        etl.togff3(table, fn)
+        with open(fn) as f:
+            eq_(['##gff-version 3\n',
+                 'ctg1\t.\tgene\t10\t20\t.\t+\t.\t'
+                 'ID=g1;Note=a%3Db%3Bc;Dbxref=x:1,y%2C2\n'],
+                f.readlines())
+        actual = etl.fromgff3(fn)
+        eq_({'ID': 'g1', 'Note': 'a=b;c', 'Dbxref': 'x:1,y,2'},
+            dict(actual.values('attributes').list()[0]))
+    finally:
+        shutil.rmtree(tmpdir)
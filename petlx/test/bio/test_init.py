@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, division
+
+
+import subprocess
+import sys
+
+
+import petl as etl
+from petl.util.base import Table
+from petl.test.helpers import eq_
+
+
+from petlx.bio import EXTENSIONS
+
+
+def test_lazy_registration():
+    code = '\n'.join([
+        'import sys',
+        'import petl as etl',
+        'import petlx.bio',
+        'assert "petlx.bio.vcf" not in sys.modules',
+        'assert "petlx.bio.gff3" not in sys.modules',
+        'assert "petlx.bio.tabix" not in sys.modules',
+        'print(etl.fromvcf("fixture/sample.vcf").nrows())',
+        'assert etl.fromvcf.__module__ == "petlx.bio.vcf"',
+        'assert "petlx.bio.gff3" not in sys.modules',
+        'print(etl.fromgff3("fixture/sample.gff").nrows())',
+        'print(etl.fromvcf("fixture/sample.vcf")'
+        '.vcfmeltsamples().vcfunpackcall().nrows())',
+    ])
+    out = subprocess.check_output([sys.executable, '-c', code],
+                                  universal_newlines=True)
+    eq_(['9', '177', '27'], out.split())
+
+
+def test_registry():
+    import petlx.bio.gff3
+    import petlx.bio.interval
+    import petlx.bio.tabix
+    import petlx.bio.vcf
+    registered = set()
+    for module, names, methods in EXTENSIONS:
+        for name in names:
+            eq_(module, getattr(etl, name).__module__)
+            registered.add(name)
+        for name in methods:
+            eq_(module, getattr(Table, name).__module__)
+    # every function registered by the extension modules has a stub
+    for name in dir(etl):
+        if getattr(getattr(etl, name), '__module__', '').startswith(
+                'petlx.bio.'):
+            assert name in registered, name
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, division
+
+
+import petl as etl
+from petl.test.helpers import ieq, eq_
+
+
+# activate extension
+import petlx.bio.interval
+
+
+left = (('chrom', 'begin', 'end', 'quux'),
+        ('chr1', 1, 2, 'a'),
+        ('chr1', 2, 4, 'b'),
+        ('chr2', 2, 5, 'c'),
+        ('chr1', 9, 14, 'd'),
+        ('chr1', 1, 1, 'e'),
+        ('chr3', 10, 10, 'f'))
+
+
+right = (('chrom', 'start', 'stop', 'value'),
+         ('chr1', 3, 7, 'bar'),
+         ('chr1', 1, 4, 'foo'),
+         ('chr2', 4, 9, 'baz'),
+         ('chr1', 0, 100, 'qux'))
+
+
+def test_overlapindex():
+    index = etl.overlapindex(right)
+    eq_(4, len(index))
+    ieq([('chr1', 3, 7, 'bar'), ('chr1', 1, 4, 'foo'),
+         ('chr1', 0, 100, 'qux')],
+        index.find('chr1', 3, 4))
+    ieq([('chr1', 0, 100, 'qux')], index.find('chr1', 7, 8))
+    ieq([], index.find('chr2', 9, 10))
+    index = etl.overlapindex(right, include_stop=True)
+    ieq([('chr2', 4, 9, 'baz')], index.find('chr2', 9, 10))
+    ieq([], index.find('chrX', 9, 10))
+
+
+def test_overlapjoin():
+    actual = etl.overlapjoin(left, right, lstart='begin', lstop='end',
+                             batchsize=2)
+    expect = (('chrom', 'begin', 'end', 'quux',
+               'chrom', 'start', 'stop', 'value'),
+              ('chr1', 1, 2, 'a', 'chr1', 1, 4, 'foo'),
+              ('chr1', 1, 2, 'a', 'chr1', 0, 100, 'qux'),
+              ('chr1', 2, 4, 'b', 'chr1', 3, 7, 'bar'),
+              ('chr1', 2, 4, 'b', 'chr1', 1, 4, 'foo'),
+              ('chr1', 2, 4, 'b', 'chr1', 0, 100, 'qux'),
+              ('chr2', 2, 5, 'c', 'chr2', 4, 9, 'baz'),
+              ('chr1', 9, 14, 'd', 'chr1', 0, 100, 'qux'),
+              ('chr1', 1, 1, 'e', 'chr1', 0, 100, 'qux'))
+    ieq(expect, actual)
+    ieq(expect, actual)
+
+
+def test_overlapjoin_include_stop():
+    actual = etl.overlapjoin(left, right, lstart='begin', lstop='end',
+                             include_stop=True, rprefix='r_')
+    expect = (('chrom', 'begin', 'end', 'quux',
+               'r_chrom', 'r_start', 'r_stop', 'r_value'),
+              ('chr1', 1, 2, 'a', 'chr1', 1, 4, 'foo'),
+              ('chr1', 1, 2, 'a', 'chr1', 0, 100, 'qux'),
+              ('chr1', 2, 4, 'b', 'chr1', 3, 7, 'bar'),
+              ('chr1', 2, 4, 'b', 'chr1', 1, 4, 'foo'),
+              ('chr1', 2, 4, 'b', 'chr1', 0, 100, 'qux'),
+              ('chr2', 2, 5, 'c', 'chr2', 4, 9, 'baz'),
+              ('chr1', 9, 14, 'd', 'chr1', 0, 100, 'qux'),
+              ('chr1', 1, 1, 'e', 'chr1', 1, 4, 'foo'),
+              ('chr1', 1, 1, 'e', 'chr1', 0, 100, 'qux'))
+    ieq(expect, actual)
+
+
+def test_overlapleftjoin():
+    actual = etl.overlapleftjoin(left, right, lstart='begin', lstop='end')
+    expect = (('chrom', 'begin', 'end', 'quux',
+               'chrom', 'start', 'stop', 'value'),
+              ('chr1', 1, 2, 'a', 'chr1', 1, 4, 'foo'),
+              ('chr1', 1, 2, 'a', 'chr1', 0, 100, 'qux'),
+              ('chr1', 2, 4, 'b', 'chr1', 3, 7, 'bar'),
+              ('chr1', 2, 4, 'b', 'chr1', 1, 4, 'foo'),
+              ('chr1', 2, 4, 'b', 'chr1', 0, 100, 'qux'),
+              ('chr2', 2, 5, 'c', 'chr2', 4, 9, 'baz'),
+              ('chr1', 9, 14, 'd', 'chr1', 0, 100, 'qux'),
+              ('chr1', 1, 1, 'e', 'chr1', 0, 100, 'qux'),
+              ('chr3', 10, 10, 'f', None, None, None, None))
+    ieq(expect, actual)
+
+
+def test_overlapsubtract():
+    actual = etl.overlapsubtract(left, right, lstart='begin', lstop='end')
+    expect = (('chrom', 'begin', 'end', 'quux'),
+              ('chr3', 10, 10, 'f'))
+    ieq(expect, actual)
+
+
+def test_overlapmergejoin():
+    sleft = etl.sort(left, key=('chrom', 'begin'))
+    sright = etl.sort(right, key=('chrom', 'start'))
+    for include_stop in False, True:
+        expect = etl.overlapjoin(sleft, sright, lstart='begin', lstop='end',
+                                 include_stop=include_stop)
+        actual = etl.overlapmergejoin(sleft, sright, lstart='begin',
+                                      lstop='end', include_stop=include_stop)
+        ieq(expect.sort(), actual.sort())
+
+
+def test_overlapmergejoin_chroms():
+    sleft = (('chrom', 'start', 'stop'),
+             ('chr2', 1, 10),
+             ('chr10', 1, 10))
+    sright = (('chrom', 'start', 'stop'),
+              ('chr2', 5, 6),
+              ('chr10', 5, 6))
+    actual = etl.overlapmergejoin(sleft, sright, chroms=['chr2', 'chr10'])
+    expect = (('chrom', 'start', 'stop', 'chrom', 'start', 'stop'),
+              ('chr2', 1, 10, 'chr2', 5, 6),
+              ('chr10', 1, 10, 'chr10', 5, 6))
+    ieq(expect, actual)
+
+
+def test_overlapmergejoin_genomicsort():
+    from petlx.push import genomicsort, totable
+    sleft = (('chrom', 'start', 'stop'),
+             ('chr10', 1, 10),
+             ('chr2', 1, 10),
+             ('chrX', 1, 10))
+    sright = (('chrom', 'start', 'stop'),
+              ('chr2', 5, 6),
+              ('chr10', 5, 6),
+              ('chr1', 5, 6))
+    tables = list()
+    for table in sleft, sright:
+        p = genomicsort('chrom', 'start')
+        t = p.pipe(totable())
+        p.push(table)
+        tables.append(t.table)
+    actual = etl.overlapmergejoin(*tables)
+    expect = (('chrom', 'start', 'stop', 'chrom', 'start', 'stop'),
+              ('chr2', 1, 10, 'chr2', 5, 6),
+              ('chr10', 1, 10, 'chr10', 5, 6))
+    ieq(expect, actual)
+    # chromosomes not in chroms follow in natural order, as for genomicsort
+    actual = etl.overlapmergejoin(etl.sort(sleft, 'chrom', reverse=True),
+                                  etl.sort(sright, 'chrom', reverse=True)
+                                  .selectne('chrom', 'chr1'),
+                                  chroms=['chrX', 'chr2'])
+    ieq(expect, actual)
+
+
+def test_overlap_zero_length():
+    # zero-length intervals overlap intervals strictly containing them, or
+    # also those ending at their position if include_stop is True
+    sleft = (('chrom', 'start', 'stop', 'id'),
+             ('chr1', 1, 10, 'a'),
+             ('chr1', 5, 5, 'b'))
+    sright = (('chrom', 'start', 'stop', 'id'),
+              ('chr1', 1, 1, 'x'),
+              ('chr1', 5, 5, 'y'),
+              ('chr1', 5, 8, 'z'),
+              ('chr1', 10, 10, 'w'))
+    expect = {False: [('a', 'y'), ('a', 'z')],
+              True: [('a', 'w'), ('a', 'x'), ('a', 'y'), ('a', 'z'),
+                     ('b', 'y'), ('b', 'z')]}
+    for include_stop in False, True:
+        for join in etl.overlapjoin, etl.overlapmergejoin:
+            actual = join(sleft, sright, include_stop=include_stop,
+                          rprefix='r_')
+            eq_(expect[include_stop],
+                sorted(actual.cut('id', 'r_id').data().tuple()))
+
+
+def test_overlapmergejoin_unsorted():
+    try:
+        etl.overlapmergejoin(left, right, lstart='begin', lstop='end').nrows()
+    except ValueError:
+        pass
+    else:
+        assert False, 'expected ValueError'
+
+
+def test_overlapmergejoin_gff3():
+    variants = (('CHROM', 'POS'),
+                ('apidb|MAL1', 643292),
+                ('apidb|MAL5', 1000),
+                ('apidb|MAL5', 1289594))
+    features = etl.fromgff3('fixture/sample.sorted.gff.gz')
+    actual = etl.overlapmergejoin(variants, features, lchrom='CHROM',
+                                  lstart='POS', lstop='POS', rchrom='seqid',
+                                  rstart='start', rstop='end',
+                                  include_stop=True, chroms=str)
+    ieq(['supercontig', 'supercontig', 'supercontig', 'exon', 'gene',
+         'rRNA'],
+        actual.values('type'))
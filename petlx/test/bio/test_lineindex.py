@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, division
+
+
+import os
+import shutil
+from tempfile import mkdtemp
+
+
+from petl.test.helpers import eq_
+
+
+from petlx.bio.lineindex import lineindex, LineIndex
+
+
+def test_lineindex():
+    lines = ['# header\n'] + ['a\t%s\n' % i for i in range(10)]
+    lines[5:5] = ['\n', '# comment\n', 'bad\n']
+    lines += ['##END\n', 'a\t10\n']
+    tmpdir = mkdtemp()
+    try:
+        fn = os.path.join(tmpdir, 'test.txt')
+        with open(fn, 'w') as f:
+            f.write(''.join(lines))
+        index = lineindex(fn, step=3, cutoff='##END', fields=2)
+        eq_(10, len(index))
+        # offsets of records 0, 3, 6 and 9
+        offsets = [len(''.join(lines[:i])) for i in (1, 4, 10, 13)]
+        eq_(offsets, index.offsets)
+        eq_(len(''.join(lines[:-2])), index.end)
+        eq_((offsets[1], 2), index.seek(5))
+        eq_((index.end, 0), index.seek(10))
+        eq_([(offsets[0], offsets[2]), (offsets[2], index.end)],
+            index.ranges(2))
+
+        # sidecar file is reused while the file is unchanged
+        assert os.path.exists(fn + '.pidx')
+        loaded = LineIndex.load(fn, index.params)
+        eq_(index.offsets, loaded.offsets)
+        eq_(None, LineIndex.load(fn, ('#', (), None)))
+        with open(fn, 'a') as f:
+            f.write('a\t11\n')
+        eq_(None, LineIndex.load(fn, index.params))
+        eq_(None, lineindex(fn, step=3, cutoff='##END', fields=2,
+                            build=False))
+    finally:
+        shutil.rmtree(tmpdir)
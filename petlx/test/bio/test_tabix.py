@@ -2,8 +2,14 @@
 from __future__ import absolute_import, print_function, division
 
 
+import os
+import shutil
+from itertools import islice
+from tempfile import mkdtemp
+
+
 import petl as etl
-from petl.test.helpers import ieq
+from petl.test.helpers import ieq, eq_
 
 
 # activate extension
@@ -23,3 +29,219 @@ def test_fromtabix_noheader():
                            region='Pf3D7_02_v3:110000-120000')
     expect = (('Pf3D7_02_v3', '105800', '447300', 'Core'),)
     ieq(expect, actual)
+
+
+def test_fromtabix_regions():
+    regions = ['Pf3D7_02_v3:110000-120000',
+               ('Pf3D7_01_v3', 0, 100),
+               'Pf3D7_02_v3:115000-460000',
+               'Pf3D7_nonexistent']
+    actual = etl.fromtabix('fixture/test.bed.gz', region=regions)
+    expect = (('#chrom', 'start', 'end', 'region'),
+              ('Pf3D7_01_v3', '0', '27336', 'SubtelomericRepeat'),
+              ('Pf3D7_02_v3', '105800', '447300', 'Core'),
+              ('Pf3D7_02_v3', '447300', '450450', 'Centromere'),
+              ('Pf3D7_02_v3', '450450', '862500', 'Core'))
+    ieq(expect, actual)
+    ieq(expect, actual)
+
+
+def test_fromtabix_regions_no_duplicates():
+    # row spanning disjoint regions is only returned once
+    regions = etl.wrap((('chrom', 'start', 'stop'),
+                        ('Pf3D7_02_v3', 440000, 448000),
+                        ('Pf3D7_02_v3', 110000, 120000),
+                        ('Pf3D7_02_v3', 300000, 310000)))
+    actual = etl.fromtabix('fixture/test.bed.gz', region=regions)
+    expect = (('#chrom', 'start', 'end', 'region'),
+              ('Pf3D7_02_v3', '105800', '447300', 'Core'),
+              ('Pf3D7_02_v3', '447300', '450450', 'Centromere'))
+    ieq(expect, actual)
+
+
+def test_fromtabix_regions_duplicate_lines():
+    import petlx.bio.tabix as tabix
+    tmpdir = mkdtemp()
+    try:
+        fn = os.path.join(tmpdir, 'test.bed.gz')
+        table = (('#chrom', 'start', 'end', 'name'),
+                 ('chr1', 0, 100, 'a'),
+                 ('chr1', 0, 100, 'a'),
+                 ('chr1', 50, 60, 'b'),
+                 ('chr1', 150, 160, 'c'),
+                 ('chr1', 150, 160, 'c'))
+        etl.wrap(table).tobed(fn)
+        regions = [('chr1', 40, 70), ('chr1', 80, 200)]
+        expect = etl.wrap(table).convertall(str)
+        ieq(expect, etl.fromtabix(fn, region=regions))
+        # without the index configuration, lines returned for both regions
+        # are counted instead
+        read_index_config = tabix._read_index_config
+        tabix._read_index_config = lambda filename: None
+        try:
+            ieq(expect, etl.fromtabix(fn, region=regions))
+        finally:
+            tabix._read_index_config = read_index_config
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_fromtabix_handle_cache():
+    from petlx.bio import tabix
+    table = etl.fromtabix('fixture/test.bed.gz',
+                          region='Pf3D7_02_v3:110000-120000')
+    table.nrows()
+    handle = tabix._handles['fixture/test.bed.gz']
+    table.nrows()
+    assert tabix._handles['fixture/test.bed.gz'] is handle
+    # interleaved iteration uses a separate handle
+    it1 = iter(table)
+    it2 = iter(table)
+    eq_(next(it1), next(it2))
+    eq_(next(it1), next(it2))
+    table.close()
+    assert 'fixture/test.bed.gz' not in tabix._handles
+
+
+def test_fromtabix_parallel():
+    expect = etl.fromtabix('fixture/test.bed.gz')
+    eq_(110, expect.nrows())
+    actual = etl.fromtabix('fixture/test.bed.gz', parallel=2)
+    ieq(expect, actual)
+    actual = etl.fromtabix('fixture/test.bed.gz', parallel=2,
+                           shards='by_bin', binsize=100000)
+    ieq(expect, actual)
+    actual = etl.fromtabix('fixture/test.bed.gz', parallel=2,
+                           shards='by_bin', binsize=100000, ordered=False)
+    ieq(expect.sort(), actual.sort())
+
+
+def test_fromtabix_threads():
+    expect = etl.fromtabix('fixture/test.bed.gz')
+    actual = etl.fromtabix('fixture/test.bed.gz', threads=2)
+    ieq(expect, actual)
+    # lines are skipped and terminated as by tabix
+    import pysam
+    from petlx.bio.bgzf import BgzfWriter
+    tmpdir = mkdtemp()
+    try:
+        fn = os.path.join(tmpdir, 'test.txt.gz')
+        with BgzfWriter(fn) as f:
+            f.write(b'chrom\tpos\tname\r\n'
+                    b'chr1\t10\t#a\r\n'
+                    b'@comment\r\n'
+                    b'chr1\t20\tb\r\n'
+                    b'chr2\t5\tc\r\n')
+        pysam.tabix_index(fn, seq_col=0, start_col=1, end_col=1,
+                          meta_char='@', line_skip=1, force=True)
+        header = ('chrom', 'pos', 'name')
+        expect = etl.fromtabix(fn, header=header)
+        actual = etl.fromtabix(fn, header=header, threads=2)
+        ieq(expect, actual)
+        eq_(('chr1', '10', '#a'), actual[1])
+        eq_(3, actual.nrows())
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_fromtabix_parallel_regions():
+    regions = ['Pf3D7_02_v3:110000-120000',
+               'Pf3D7_02_v3:300000-460000',
+               'Pf3D7_02_v3:440000-448000',
+               'Pf3D7_05_v3']
+    expect = etl.fromtabix('fixture/test.bed.gz', region=regions)
+    actual = etl.fromtabix('fixture/test.bed.gz', region=regions,
+                           parallel=2, shards='by_bin', binsize=7000)
+    ieq(expect, actual)
+    # the worker processes are kept until the table is closed
+    pool = actual._pool
+    ieq(expect, actual)
+    assert actual._pool is pool
+    actual.close()
+    assert actual._pool is None
+
+
+def test_fromtabix_parallel_unordered():
+    expect = etl.fromtabix('fixture/test.bed.gz')
+    actual = etl.fromtabix('fixture/test.bed.gz', parallel=2,
+                           shards='by_bin', binsize=50000, ordered=False)
+    try:
+        eq_(sorted(expect.data()), sorted(actual.data()))
+        # only reading part of the rows leaves the pool usable
+        eq_(3, len(list(islice(actual.data(), 3))))
+        eq_(len(expect.data()), len(actual.data()))
+    finally:
+        actual.close()
+
+
+def test_fetchshard_no_index_config():
+    from petlx.bio.tabix import _fetchshard, _read_index_config, _RowParser
+    filename = 'fixture/test.bed.gz'
+    parse = _RowParser([])
+    config = _read_index_config(filename)
+    # overlaps the previous region, i.e., 'Pf3D7_02_v3:110000-120000'
+    shard = (filename, 'Pf3D7_02_v3', 440000, 460000, None, (110000, 120000))
+    expect = [('Pf3D7_02_v3', '447300', '450450', 'Centromere'),
+              ('Pf3D7_02_v3', '450450', '862500', 'Core')]
+    eq_(expect, _fetchshard(shard + (config, parse, False))[1])
+    # without the index configuration rows of the previous region are
+    # remembered instead
+    eq_(expect, _fetchshard(shard + (None, parse, False))[1])
+
+
+def test_fromtabix_types():
+    actual = etl.fromtabix('fixture/test.bed.gz',
+                           region='Pf3D7_02_v3:110000-120000',
+                           types={'start': int, 'end': int})
+    expect = (('#chrom', 'start', 'end', 'region'),
+              ('Pf3D7_02_v3', 105800, 447300, 'Core'))
+    ieq(expect, actual)
+    # by index, multiple regions and parallel scans
+    expect = etl.fromtabix('fixture/test.bed.gz').convert(('start', 'end'),
+                                                          int)
+    actual = etl.fromtabix('fixture/test.bed.gz', types={1: int, 2: int})
+    ieq(expect, actual)
+    regions = sorted(expect.values('#chrom').set())
+    actual = etl.fromtabix('fixture/test.bed.gz', types={1: int, 2: int},
+                           region=regions)
+    ieq(expect, actual)
+    actual = etl.fromtabix('fixture/test.bed.gz', types={1: int, 2: int},
+                           parallel=2, shards='by_bin', binsize=100000)
+    ieq(expect, actual)
+
+
+def test_fromtabix_types_auto():
+    table = etl.fromtabix('fixture/sample.vcf.gz', types='auto')
+    expect = (('#CHROM', 'POS', 'QUAL'),
+              ('19', 111, 9.6),
+              ('19', 112, 10.0),
+              ('20', 14370, 29.0),
+              ('20', 17330, 3.0),
+              ('20', 1110696, 67.0),
+              ('20', 1230237, 47.0),
+              ('20', 1234567, 50.0),
+              ('20', 1235237, '.'),
+              ('X', 10, 10.0))
+    ieq(expect, table.cut('#CHROM', 'POS', 'QUAL'))
+
+
+def test_tobed():
+    tmpdir = mkdtemp()
+    try:
+        fn = os.path.join(tmpdir, 'test.bed.gz')
+        expect = etl.fromtabix('fixture/test.bed.gz')
+        expect.tobed(fn)
+        ieq(expect, etl.fromtabix(fn))
+        regions = ['Pf3D7_02_v3:110000-120000', 'Pf3D7_05_v3']
+        ieq(etl.fromtabix('fixture/test.bed.gz', region=regions),
+            etl.fromtabix(fn, region=regions))
+        # no header
+        fn = os.path.join(tmpdir, 'test.bed')
+        (etl
+         .fromtabix('fixture/test_noheader.bed.gz',
+                    header=('chrom', 'start', 'end', 'region'))
+         .tobed(fn))
+        with open(fn) as f:
+            eq_('Pf3D7_01_v3\t0\t27336\tSubtelomericRepeat\n', f.readline())
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, division
+
+
+import petl as etl
+from petl.test.helpers import ieq, eq_
+
+
+# activate extension
+import petlx.bio.vcf
+
+
+def test_fromvcf():
+    table = etl.fromvcf('fixture/sample.vcf', samples=None)
+    eq_(('CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO'),
+        table.header())
+    eq_(9, table.nrows())
+    # compressed
+    expect = table.cut('CHROM', 'POS', 'REF')
+    actual = etl.fromvcf('fixture/sample.vcf.gz', samples=None)
+    ieq(expect, actual.cut('CHROM', 'POS', 'REF'))
+    # iterate more than once
+    ieq(expect, actual.cut('CHROM', 'POS', 'REF'))
+
+
+def test_fromvcf_samples():
+    table = etl.fromvcf('fixture/sample.vcf', samples=['NA00002'])
+    eq_(('CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO',
+         'NA00002'), table.header())
+    eq_(['0|0', '0|0', '1|0', '0|1', '2|1', '0|0', '0/2', '0|0', '0/1'],
+        [c['GT'] for c in table.values('NA00002')])
+
+
+def test_fromvcf_chrom():
+    table = etl.fromvcf('fixture/sample.vcf.gz', chrom='20', start=14369,
+                        stop=17330, samples=None).cut('CHROM', 'POS')
+    expect = (('CHROM', 'POS'),
+              ('20', 14370),
+              ('20', 17330))
+    ieq(expect, table)
+    ieq(expect, table)
+    table = etl.fromvcf('fixture/sample.vcf.gz', chrom='19',
+                        samples=None).cut('CHROM', 'POS')
+    expect = (('CHROM', 'POS'),
+              ('19', 111),
+              ('19', 112))
+    ieq(expect, table)
+
+
+def test_fromvcf_region():
+    table = etl.fromvcf('fixture/sample.vcf.gz', region='20:17330-1110696',
+                        samples=None).cut('CHROM', 'POS')
+    expect = (('CHROM', 'POS'),
+              ('20', 17330),
+              ('20', 1110696))
+    ieq(expect, table)
+
+
+def test_fromvcf_regions():
+    regions = ['X', '20:1234560-1234570', '19:111-111', '20:1234567-1235237',
+               '20:14370-14370', '20:1234568-1234568', 'chrZ']
+    table = etl.fromvcf('fixture/sample.vcf.gz', region=regions,
+                        samples=None).cut('CHROM', 'POS')
+    expect = (('CHROM', 'POS'),
+              ('19', 111),
+              ('20', 14370),
+              ('20', 1234567),
+              ('20', 1235237),
+              ('X', 10))
+    ieq(expect, table)
+    ieq(expect, table)
+
+
+def test_fromvcf_pysam():
+    expect = etl.fromvcf('fixture/sample.vcf.gz')
+    actual = etl.fromvcf('fixture/sample.vcf.gz', engine='pysam')
+    eq_(expect.header(), actual.header())
+    fields = ('CHROM', 'POS', 'ID', 'REF', 'FILTER')
+    ieq(expect.cut(*fields), actual.cut(*fields))
+    eq_([[str(a) if a else None for a in alts]
+         for alts in expect.values('ALT')],
+        actual.values('ALT').list())
+    for sample in 'NA00001', 'NA00002', 'NA00003':
+        eq_([call['GT'] for call in expect.values(sample)],
+            [call['GT'] for call in actual.values(sample)])
+    call = actual.values('NA00002').list()[2]
+    eq_('NA00002', call.sample)
+    eq_({'GT': '1|0', 'GQ': 48, 'DP': 8, 'HQ': (51, 51)},
+        dict(call.data._asdict()))
+
+
+def test_fromvcf_rows():
+    from petlx.bio.vcf import VCFVariantRow
+    for engine in 'pyvcf', 'pysam':
+        rows = list(etl.fromvcf('fixture/sample.vcf.gz', engine=engine))[1:]
+        row = rows[2]
+        assert isinstance(row, VCFVariantRow)
+        eq_(('20', 14370, 'rs6054257'), (row.CHROM, row.POS, row.ID))
+        eq_(14, row.INFO['DP'])
+        eq_(['NA00001', 'NA00002', 'NA00003'],
+            [call.sample for call in row.calls])
+        eq_(tuple(row[8:]), row.calls)
+        assert rows[2].CHROM is rows[3].CHROM
+
+
+def test_fromvcf_threads():
+    for engine in 'pyvcf', 'pysam':
+        expect = etl.fromvcf('fixture/sample.vcf.gz', engine=engine)
+        actual = etl.fromvcf('fixture/sample.vcf.gz', engine=engine,
+                             threads=2)
+        eq_(expect.header(), actual.header())
+        eq_([str(row) for row in expect], [str(row) for row in actual])
+
+
+def test_fromvcf_pysam_regions():
+    regions = ['X', '20:1234560-1234570', '19:111-111', '20:1234567-1235237',
+               '20:14370-14370', '20:1234568-1234568', 'chrZ']
+    for engine in 'pyvcf', 'pysam':
+        table = etl.fromvcf('fixture/sample.vcf.gz', region=regions,
+                            samples=['NA00003'], engine=engine)
+        expect = (('CHROM', 'POS', 'NA00003'),
+                  ('19', 111, '0/1'),
+                  ('20', 14370, '1/1'),
+                  ('20', 1234567, '1/1'),
+                  ('20', 1235237, './.'),
+                  ('X', 10, '0|2'))
+        ieq(expect, table.cut('CHROM', 'POS', 'NA00003')
+            .convert('NA00003', lambda c: c['GT']))
+
+
+def test_vcftoarray():
+    import numpy as np
+    arrays = etl.vcftoarray('fixture/sample.vcf.gz',
+                            fields=('GT', 'GQ', 'HQ'), chunksize=2)
+    eq_(['GT', 'GQ', 'HQ'], list(arrays))
+    gt = arrays['GT']
+    eq_((9, 3, 2), gt.shape)
+    # compare with genotypes from fromvcf, haploid and missing calls are
+    # padded with -1
+    expect = [[call['GT'] for call in row[8:]]
+              for row in etl.fromvcf('fixture/sample.vcf.gz').data()]
+    actual = [['/'.join('.' if a < 0 else str(a) for a in call)
+               for call in row] for row in gt]
+    expect[8][0] = '0/.'
+    eq_([[gt.replace('|', '/') for gt in row] for row in expect], actual)
+    eq_((9, 3), arrays['GQ'].shape)
+    eq_([48, 48, 43], arrays['GQ'][2].tolist())
+    eq_([-1, 17, 40], arrays['GQ'][6].tolist())
+    eq_((9, 3, 2), arrays['HQ'].shape)
+    eq_([[51, 51], [51, 51], [-1, -1]], arrays['HQ'][2].tolist())
+    assert np.all(arrays['HQ'][6:] == -1)
+
+
+def test_vcftoarray_samples_region():
+    arrays = etl.vcftoarray('fixture/sample.vcf.gz', fields=('DP',),
+                            samples=['NA00003', 'NA00001'],
+                            region=['20:14370-14370', '20:1230237-1234567'])
+    eq_([[5, 1], [2, -1], [3, 4]], arrays['DP'].tolist())
+
+
+def test_vcftoarray_out():
+    import os
+    import shutil
+    import tempfile
+    import numpy as np
+    expect = etl.vcftoarray('fixture/sample.vcf.gz')
+    tmpdir = tempfile.mkdtemp()
+    try:
+        actual = etl.vcftoarray('fixture/sample.vcf.gz', chunksize=4,
+                                out=os.path.join(tmpdir, 'out'))
+        for field in 'GT', 'DP', 'GQ':
+            assert isinstance(actual[field], np.memmap)
+            eq_(expect[field].dtype, actual[field].dtype)
+            eq_(expect[field].tolist(), actual[field].tolist())
+            loaded = np.load(os.path.join(tmpdir, 'out', field + '.npy'))
+            eq_(expect[field].tolist(), loaded.tolist())
+        del actual
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_vcftoarray_mixed_ploidy():
+    from petlx.bio.vcf import _FormatField
+    gt = _FormatField('GT', None, 2)
+    # values must not shift between calls of different ploidy
+    eq_([[[0, -1], [0, 1]]], gt.parse(['0', '0/1/1'], 1, 2).tolist())
+    eq_([[[-1, -1], [1, 1], [0, 1]]],
+        gt.parse(['.', '1/1', '0/1/1'], 1, 3).tolist())
+    eq_([[[1, -1], [0, 1]], [[-1, -1], [1, 0]]],
+        gt.parse(['1', '0/1', '.', '1|0'], 2, 2).tolist())
+    gt = _FormatField('GT', None, 3)
+    eq_([[[0, -1, -1], [0, 1, -1], [0, 1, 1], [-1, -1, -1]]],
+        gt.parse(['0', '0/1', '0/1/1', '.'], 1, 4).tolist())
+    # allele indices beyond the range of a byte do not overflow
+    eq_([[[128, 300]]], gt.parse(['128/300/.'], 1, 1)[..., :2].tolist())
+
+
+def test_fromvcf_samples_pushdown():
+    for engine in 'pyvcf', 'pysam':
+        table = etl.fromvcf('fixture/sample.vcf.gz', engine=engine,
+                            samples=['NA00003', 'NA00001'])
+        eq_(('NA00003', 'NA00001'), table.header()[8:])
+        row = table.select('POS', lambda v: v == 14370).data().list()[0]
+        eq_(('NA00003', 'NA00001'), tuple(call.sample for call in row[8:]))
+        eq_(('1/1', '0|0'), tuple(call['GT'] for call in row[8:]))
+        eq_((5, 1), tuple(call['DP'] for call in row[8:]))
+        # no samples
+        table = etl.fromvcf('fixture/sample.vcf.gz', engine=engine,
+                            samples=False)
+        eq_(8, len(table.header()))
+        eq_({8}, set(len(row) for row in table.data()))
+
+
+def test_fromvcf_info():
+    for engine in 'pyvcf', 'pysam':
+        table = etl.fromvcf('fixture/sample.vcf.gz', engine=engine,
+                            samples=None, info=['DP', 'AA'])
+        eq_([{}, {}, {'DP': 14}, {'DP': 11}, {'DP': 10, 'AA': 'T'},
+             {'DP': 13, 'AA': 'T'}, {'DP': 9, 'AA': 'G'}, {}, {}],
+            table.values('INFO').list())
+
+
+def test_vcfunpackinfo():
+    table = etl.fromvcf('fixture/sample.vcf', samples=None).vcfunpackinfo()
+    eq_(('CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER',
+         'AA', 'AC', 'AF', 'AN', 'DB', 'DP', 'H2', 'NS'), table.header())
+    eq_([None, None, 14, 11, 10, 13, 9, None, None],
+        table.values('DP').list())
+    table = (etl.fromvcf('fixture/sample.vcf.gz', samples=None, info=['DP'],
+                         engine='pysam')
+             .vcfunpackinfo())
+    eq_(('CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'DP'),
+        table.header())
+    eq_([None, None, 14, 11, 10, 13, 9, None, None],
+        table.values('DP').list())
+
+
+def test_vcfmeltcalls():
+    for engine in 'pyvcf', 'pysam':
+        table = etl.fromvcf('fixture/sample.vcf.gz', engine=engine)
+        expect = (table
+                  .vcfmeltsamples()
+                  .vcfunpackcall('GT', 'DP')
+                  .cutout('INFO'))
+        actual = table.vcfmeltcalls(fields=('GT', 'DP')).cutout('INFO')
+        eq_(expect.header(), actual.header())
+        ieq(expect, actual)
+        eq_(27, actual.nrows())
+    table = (etl.fromvcf('fixture/sample.vcf.gz')
+             .vcfmeltcalls(fields=('GT', 'XX'), samples=['NA00003'])
+             .cut('POS', 'SAMPLE', 'GT', 'XX'))
+    eq_(('POS', 'SAMPLE', 'GT', 'XX'), table.header())
+    eq_((14370, 'NA00003', '1/1', None), table.data().list()[2])
+    eq_(9, table.nrows())
+
+
+def test_tovcf():
+    import os
+    import shutil
+    import tempfile
+    import pysam
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for engine in 'pyvcf', 'pysam':
+            fn = os.path.join(tmpdir, engine + '.vcf.gz')
+            etl.fromvcf('fixture/sample.vcf.gz', engine=engine).tovcf(fn)
+            expect = pysam.TabixFile('fixture/sample.vcf.gz')
+            actual = pysam.TabixFile(fn)
+            eq_(list(expect.header), list(actual.header))
+            for chrom in expect.contigs:
+                eq_(list(expect.fetch(chrom)), list(actual.fetch(chrom)))
+            ieq(etl.fromvcf('fixture/sample.vcf.gz',
+                            region='20:14370-17330',
+                            samples=None).cut('CHROM', 'POS', 'INFO'),
+                etl.fromvcf(fn, region='20:14370-17330',
+                            samples=None).cut('CHROM', 'POS', 'INFO'))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_tovcf_nosamples():
+    import os
+    import shutil
+    import tempfile
+    table = (('CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO'),
+             ('1', 100, None, 'A', ['T'], 30.5, [], {'DP': 10, 'DB': True}),
+             ('1', 200, 'rs1', 'G', [None], None, None, {}))
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fn = os.path.join(tmpdir, 'test.vcf')
+        etl.tovcf(table, fn, meta=['##fileformat=VCFv4.1'])
+        with open(fn) as f:
+            eq_(['##fileformat=VCFv4.1\n',
+                 '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n',
+                 '1\t100\t.\tA\tT\t30.5\tPASS\tDP=10;DB\n',
+                 '1\t200\trs1\tG\t.\t.\t.\t.\n'],
+                f.readlines())
+    finally:
+        shutil.rmtree(tmpdir)
@@ -2,13 +2,16 @@ from __future__ import absolute_import, print_function, division
 # N.B., do not import unicode_literals in tests
 
 
-from tempfile import NamedTemporaryFile
+import os
+import shutil
+from tempfile import NamedTemporaryFile, mkdtemp
 
 
 from petl.io import fromcsv, fromtsv, frompickle
-from petl.test.helpers import ieq
+from petl.test.helpers import ieq, eq_
 from petlx.push import tocsv, totsv, topickle, partition, sort, duplicates, \
-    unique, diff
+    unique, diff, overlapjoin, tobed, tovcf, genomicsort, encodekey, head, \
+    totable
 
 
 def test_topickle():
@@ -202,6 +205,50 @@ def test_sort_buffered():
     ieq(expectation, actual)
 
 
+def test_sort_binarykey():
+    table = (('foo', 'bar', 'baz'),
+             ('C', 2, 0.5),
+             ('A', 9, None),
+             ('A', 6, -1),
+             ('F', 1, 2.5),
+             ('A', 6, -3),
+             ('D', 10),
+             (None, 3, 1))
+
+    for key in 'foo', ('foo', 'bar'), ('bar', 'baz'), ('baz', 'foo'):
+        for reverse in False, True:
+            for buffersize in None, 2:
+                fn1 = NamedTemporaryFile().name
+                fn2 = NamedTemporaryFile().name
+                p = sort(key, reverse=reverse, buffersize=buffersize)
+                p.pipe(topickle(fn1))
+                p.push(table)
+                p = sort(key, reverse=reverse, buffersize=buffersize,
+                         binarykey=True)
+                p.pipe(topickle(fn2))
+                p.push(table)
+                ieq(frompickle(fn1), frompickle(fn2))
+
+
+def test_encodekey():
+    values = [None, -2.5, -1, 0, 1, 1.5, 2**60, 2**60 + 1, float('inf'),
+              b'', b'a', b'a\x00', b'ab', u'', u'a', u'a\x00', u'ab',
+              u'\xe9']
+    keys = [encodekey([v]) for v in values]
+    eq_(keys, sorted(keys))
+    eq_(encodekey([0]), encodekey([-0.0]))
+    eq_(encodekey([3]), encodekey([3.0]))
+    assert encodekey([u'a', 2]) < encodekey([u'a', 10]) < \
+        encodekey([u'ab', 1])
+    for v in 2**120 + 2**66, 2**1100, -10**400:
+        try:
+            encodekey([v])
+        except ValueError:
+            pass
+        else:
+            assert False, 'expected ValueError'
+
+
 def test_duplicates():
 
     table = (('foo', 'bar', 'baz'),
@@ -353,3 +400,271 @@ def test_diff():
     ieq(bminusa, added)
     ieq(aminusb, subtracted)
     ieq(both, common)
+
+
+def test_overlapjoin():
+
+    variants = (('CHROM', 'POS'),
+                ('chr1', 3),
+                ('chr1', 8),
+                ('chr2', 1))
+
+    features = (('seqid', 'start', 'end', 'type'),
+                ('chr1', 1, 5, 'gene'),
+                ('chr1', 2, 4, 'exon'),
+                ('chr2', 5, 9, 'gene'))
+
+    fn = NamedTemporaryFile().name
+    p = overlapjoin(lchrom='CHROM', lstart='POS', lstop='POS',
+                    rchrom='seqid', rstart='start', rstop='end',
+                    include_stop=True)
+    p.pipe(topickle(fn))
+    p.push(variants, features)
+
+    expectation = (('CHROM', 'POS', 'seqid', 'start', 'end', 'type'),
+                   ('chr1', 3, 'chr1', 1, 5, 'gene'),
+                   ('chr1', 3, 'chr1', 2, 4, 'exon'))
+    ieq(expectation, frompickle(fn))
+
+
+def test_tobed():
+    import petl as etl
+    import petlx.bio
+
+    t = etl.fromtabix('fixture/test.bed.gz')
+    tmpdir = mkdtemp()
+    try:
+        fn1 = os.path.join(tmpdir, 'test.bed.gz')
+        fn2 = os.path.join(tmpdir, 'test.csv')
+        p = tobed(fn1)
+        p.pipe(tocsv(fn2))
+        p.push(t)
+
+        ieq(t, etl.fromtabix(fn1))
+        ieq(etl.fromtabix('fixture/test.bed.gz', region='Pf3D7_02_v3'),
+            etl.fromtabix(fn1, region='Pf3D7_02_v3'))
+        ieq(t, fromcsv(fn2))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_genomicsort():
+    table = (('chrom', 'pos', 'id'),
+             ('chr10', '5', 'a'),
+             ('chr2', '30', 'b'),
+             ('chrX', '1', 'c'),
+             ('chr2', '4', 'd'),
+             ('chr10', '2', 'e'),
+             ('chr2', '4', 'f'),
+             ('chr1', '100', 'g'))
+    expectation = (('chrom', 'pos', 'id'),
+                   ('chr1', '100', 'g'),
+                   ('chr2', '4', 'd'),
+                   ('chr2', '4', 'f'),
+                   ('chr2', '30', 'b'),
+                   ('chr10', '2', 'e'),
+                   ('chr10', '5', 'a'),
+                   ('chrX', '1', 'c'))
+
+    for buffersize in None, 2:
+        fn = NamedTemporaryFile().name
+        p = genomicsort('chrom', 'pos', buffersize=buffersize)
+        p.pipe(topickle(fn))
+        p.push(table)
+        ieq(expectation, frompickle(fn))
+
+    fn = NamedTemporaryFile().name
+    p = genomicsort('chrom', 'pos', order=['chrX', 'chr10'], buffersize=3)
+    p.pipe(topickle(fn))
+    p.push(table)
+    ieq(['chrX', 'chr10', 'chr10', 'chr1', 'chr2', 'chr2', 'chr2'],
+        [row[0] for row in list(frompickle(fn))[1:]])
+
+
+def test_genomicsort_contigs():
+    import petl as etl
+    import petlx.bio
+
+    t = etl.fromvcf('fixture/sample.vcf', samples=None)
+    tmpdir = mkdtemp()
+    try:
+        meta = os.path.join(tmpdir, 'meta.vcf')
+        with open(meta, 'wb') as f:
+            f.write(b'##fileformat=VCFv4.0\n'
+                    b'##contig=<ID=X,length=1000000>\n'
+                    b'##contig=<ID=20>\n'
+                    b'##contig=<ID=19>\n'
+                    b'#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
+        fn = os.path.join(tmpdir, 'test.vcf.gz')
+        p = genomicsort('CHROM', 'POS', order=meta, buffersize=4)
+        p.pipe(tovcf(fn, meta=meta))
+        p.push(t.sort('POS', reverse=True))
+
+        expect = (('CHROM', 'POS'),
+                  ('X', 10),
+                  ('20', 14370),
+                  ('20', 17330),
+                  ('20', 1110696),
+                  ('20', 1230237),
+                  ('20', 1234567),
+                  ('20', 1235237),
+                  ('19', 111),
+                  ('19', 112))
+        ieq(expect, etl.fromvcf(fn).cut('CHROM', 'POS'))
+        ieq(etl.wrap(expect).selecteq('CHROM', '20'),
+            etl.fromvcf(fn, region='20').cut('CHROM', 'POS'))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def _counting(table, pulled):
+    # yield rows of table, counting data rows read
+    it = iter(table)
+    yield next(it)
+    for row in it:
+        pulled.append(row)
+        yield row
+
+
+def test_head():
+    table = [('foo', 'bar')] + [('a', i) for i in range(100)]
+
+    pulled = list()
+    fn = NamedTemporaryFile().name
+    p = head(3)
+    p.pipe(topickle(fn))
+    p.push(_counting(table, pulled))
+    ieq(table[:4], frompickle(fn))
+    # source is not read any further
+    eq_(3, len(pulled))
+
+    # downstream of a sort, all rows are read
+    pulled = list()
+    fn = NamedTemporaryFile().name
+    p = sort('bar', reverse=True)
+    p.pipe(head(2)).pipe(topickle(fn))
+    p.push(_counting(table, pulled))
+    ieq([('foo', 'bar'), ('a', 99), ('a', 98)], frompickle(fn))
+    eq_(100, len(pulled))
+
+
+def test_head_branches():
+    table = [('foo', 'bar')] + [('a' if i % 2 else 'b', i)
+                                for i in range(100)]
+
+    # stops once every branch is done
+    pulled = list()
+    fn1 = NamedTemporaryFile().name
+    fn2 = NamedTemporaryFile().name
+    p = partition('foo')
+    p.pipe('a', head(2)).pipe(topickle(fn1))
+    p.pipe('b', head(3)).pipe(topickle(fn2))
+    p.push(_counting(table, pulled))
+    ieq([('foo', 'bar'), ('a', 1), ('a', 3)], frompickle(fn1))
+    ieq([('foo', 'bar'), ('b', 0), ('b', 2), ('b', 4)], frompickle(fn2))
+    eq_(5, len(pulled))
+
+    # a file writer needs all rows, even if what follows it is done
+    pulled = list()
+    p = topickle(fn1)
+    p.pipe(head(2)).pipe(topickle(fn2))
+    p.push(_counting(table, pulled))
+    ieq(table, frompickle(fn1))
+    ieq(table[:3], frompickle(fn2))
+    eq_(100, len(pulled))
+
+
+def test_totable():
+    table = (('foo', 'bar'),
+             ('C', 2),
+             ('A', 9),
+             ('B', 6))
+
+    p = sort('foo')
+    t = p.pipe(totable())
+    p.push(table)
+    expectation = (('foo', 'bar'),
+                   ('A', 9),
+                   ('B', 6),
+                   ('C', 2))
+    ieq(expectation, t.table)
+    ieq(expectation, t.table)
+
+
+def test_totable_start():
+    import petl as etl
+
+    table = [('foo', 'bar')] + [(i % 3, i) for i in range(3000)]
+
+    p = partition('foo')
+    t0 = p.pipe(0, totable(buffersize=100))
+    t1 = p.pipe(1, totable())
+    thread = p.start(table)
+    # read both while rows are being pushed
+    actual = etl.join(t0.table.convert('foo', lambda v: v + 1), t1.table,
+                      key='foo', lprefix='l_', rprefix='r_')
+    eq_(1000 * 1000, actual.nrows())
+    thread.join()
+    ieq(etl.wrap(table).selecteq('foo', 0), t0.table)
+    ieq(etl.wrap(table).selecteq('foo', 1), t1.table)
+
+
+def test_totable_error():
+    def source():
+        yield ('foo', 'bar')
+        for i in range(10):
+            yield ('a', i)
+        raise ValueError('bad row')
+
+    p = head(100)
+    t = p.pipe(totable())
+    p.start(source())
+    try:
+        t.table.nrows()
+    except ValueError as e:
+        eq_('bad row', str(e))
+    else:
+        assert False, 'expected ValueError'
+
+    try:
+        totable().table.nrows()
+    except ValueError:
+        pass
+    else:
+        assert False, 'expected ValueError'
+
+
+def test_push_error():
+    def source():
+        yield ('foo', 'bar')
+        for i in range(10):
+            yield ('a', i)
+        raise ValueError('bad row')
+
+    # the pipeline is closed, so rows are flushed to files downstream
+    tmpdir = mkdtemp()
+    try:
+        fn = os.path.join(tmpdir, 'test.csv')
+        p = sort('bar')
+        p.pipe(tocsv(fn))
+        try:
+            p.push(source())
+        except ValueError as e:
+            eq_('bad row', str(e))
+        else:
+            assert False, 'expected ValueError'
+        eq_(11, len(fromcsv(fn)))
+    finally:
+        shutil.rmtree(tmpdir)
+
+    # not swallowed by the thread when no table reads from the pipeline
+    import threading
+    if hasattr(threading, 'excepthook'):
+        errors = list()
+        excepthook = threading.excepthook
+        threading.excepthook = lambda args: errors.append(args.exc_value)
+        try:
+            head(100).start(source()).join()
+        finally:
+            threading.excepthook = excepthook
+        eq_(['bad row'], [str(e) for e in errors])